@@ -0,0 +1,158 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web, ClientSession, ClientTimeout
+from update_dispatcher import chat_key
+from request_context import request_scope
+
+logger = logging.getLogger(__name__)
+
+# This runtime is an aiohttp front-end over the existing synchronous bot: the
+# webhook, per-chat ordering and background jobs run on the event loop, but each
+# update is still handled by TeleBot on blocking_executor, and the gspread, Bot API,
+# news and crypto calls inside handlers block their worker thread. Updates being
+# handled at once are therefore capped by ASYNC_BLOCKING_WORKERS; more chats only
+# wait cheaply in the queue.
+
+# Blocking work (TeleBot handlers, gspread) runs here; its size caps how many handlers block at once
+blocking_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("ASYNC_BLOCKING_WORKERS", "32")),
+    thread_name_prefix="blocking"
+)
+
+_http_session = None
+
+def get_http_session():
+    """Shared aiohttp session for the async service clients; must be called on the event loop"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = ClientSession(timeout=ClientTimeout(total=float(os.getenv("ASYNC_HTTP_TIMEOUT", "10"))))
+    return _http_session
+
+async def close_http_session():
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call on the bounded executor without stalling the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, lambda: func(*args, **kwargs))
+
+class AsyncUpdateDispatcher:
+    """asyncio counterpart of UpdateDispatcher: one lightweight task per active chat
+
+    Updates of a chat are awaited one after another. Up to max_pending updates can
+    wait, but since process hands each one to blocking_executor, no more chats
+    than it has threads are actually handled at the same time.
+    """
+
+    def __init__(self, process, max_pending=10000):
+        self.process = process
+        self.max_pending = max_pending
+        self._chats = {}
+        self._pending = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.avg_lag = 0.0
+        self.max_lag = 0.0
+
+    def submit(self, update):
+        """Queue an update; False if the backlog is full. Must be called on the event loop"""
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            return False
+        self._pending += 1
+        key = chat_key(update)
+        chat_queue = self._chats.get(key)
+        if chat_queue is None:
+            chat_queue = self._chats[key] = deque()
+            asyncio.get_running_loop().create_task(self._drain(key, chat_queue))
+        chat_queue.append((time.monotonic(), update))
+        return True
+
+    async def _drain(self, key, chat_queue):
+        while chat_queue:
+            enqueued_at, update = chat_queue.popleft()
+            lag = time.monotonic() - enqueued_at
+            try:
+                await self.process(update)
+            except Exception as e:
+                logger.error(f"Error processing update {getattr(update, 'update_id', '?')} for chat {key}: {e}")
+                self.failed += 1
+            self._pending -= 1
+            self.processed += 1
+            self.avg_lag = lag if self.processed == 1 else 0.9 * self.avg_lag + 0.1 * lag
+            self.max_lag = max(self.max_lag, lag)
+        del self._chats[key]
+
+    def stats(self):
+        now = time.monotonic()
+        oldest = min((chat_queue[0][0] for chat_queue in self._chats.values() if chat_queue), default=None)
+        return {
+            'pending': self._pending,
+            'active_chats': len(self._chats),
+            'processed': self.processed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'avg_lag': round(self.avg_lag, 3),
+            'max_lag': round(self.max_lag, 3),
+            'oldest_wait': round(now - oldest, 3) if oldest is not None else 0.0,
+        }
+
+def create_app(bot, health=None):
+    """aiohttp application serving /webhook and /healthz for a TeleBot instance"""
+    from telebot import types
+
+    def process_blocking(update):
+        with request_scope(chat_key(update)):
+            bot.process_new_updates([update])
+
+    async def process(update):
+        # Handlers are synchronous TeleBot code that calls gspread and the Bot API,
+        # so each update occupies one executor thread until it is done
+        await run_blocking(process_blocking, update)
+
+    dispatcher = AsyncUpdateDispatcher(process, max_pending=int(os.getenv("WEBHOOK_MAX_PENDING", "10000")))
+
+    async def webhook(request):
+        if request.headers.get('content-type') != 'application/json':
+            raise web.HTTPForbidden()
+        update = types.Update.de_json(await request.text())
+        if not dispatcher.submit(update):
+            raise web.HTTPServiceUnavailable()
+        return web.Response(text='')
+
+    async def healthz(request):
+        report = dict(health() if health else {}, updates=dispatcher.stats())
+        return web.json_response(report)
+
+    async def on_cleanup(app):
+        await close_http_session()
+        blocking_executor.shutdown(wait=False)
+
+    app = web.Application()
+    app.router.add_post('/webhook', webhook)
+    app.router.add_get('/healthz', healthz)
+    app.on_cleanup.append(on_cleanup)
+    app['dispatcher'] = dispatcher
+    return app
+
+def run(bot, port, health=None, background=()):
+    """Serve the bot on asyncio; background is a list of coroutine functions started with the app"""
+    app = create_app(bot, health)
+
+    async def start_background(app):
+        app['background'] = [asyncio.get_running_loop().create_task(task()) for task in background]
+
+    async def stop_background(app):
+        for task in app['background']:
+            task.cancel()
+
+    app.on_startup.append(start_background)
+    app.on_cleanup.insert(0, stop_background)
+    logger.info(f"Starting asyncio runtime on port {port}")
+    web.run_app(app, host="0.0.0.0", port=port)
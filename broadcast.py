@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timezone
+from send_queue import PRIORITY_BULK
+from keyboards import inline_keyboard
+
+logger = logging.getLogger(__name__)
+
+RUNNING = 'running'
+DONE = 'done'
+CANCELLED = 'cancelled'
+
+def is_unreachable(error):
+    """True if a send failed because the user blocked the bot, was deactivated or the chat is gone"""
+    code = getattr(error, 'error_code', None)
+    if code == 403:
+        return True
+    description = str(getattr(error, 'description', None) or error).lower()
+    return code == 400 and 'chat not found' in description
+
+class BroadcastStore:
+    """Broadcast jobs and unreachable users, kept as JSON files in one directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._blocked = None
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write(self, name, data):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path(f"{name}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, self._path(name))
+
+    def save_job(self, job):
+        with self._lock:
+            self._write(f"job-{job['id']}.json", job)
+
+    def load_jobs(self):
+        jobs = []
+        try:
+            names = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            return jobs
+        for name in names:
+            if name.startswith('job-') and name.endswith('.json'):
+                try:
+                    with open(self._path(name)) as f:
+                        jobs.append(json.load(f))
+                except Exception as e:
+                    logger.error(f"Error reading broadcast job {name}: {e}")
+        return jobs
+
+    def _load_blocked(self):
+        if self._blocked is None:
+            try:
+                with open(self._path('blocked_users.json')) as f:
+                    self._blocked = set(json.load(f))
+            except FileNotFoundError:
+                self._blocked = set()
+            except Exception as e:
+                logger.error(f"Error reading blocked users, starting empty: {e}")
+                self._blocked = set()
+        return self._blocked
+
+    def blocked_users(self):
+        with self._lock:
+            return set(self._load_blocked())
+
+    def add_blocked(self, user_ids):
+        with self._lock:
+            blocked = self._load_blocked()
+            if not set(user_ids) - blocked:
+                return
+            blocked.update(user_ids)
+            self._write('blocked_users.json', sorted(blocked))
+
+    def remove_blocked(self, user_id):
+        with self._lock:
+            blocked = self._load_blocked()
+            if user_id in blocked:
+                blocked.discard(user_id)
+                self._write('blocked_users.json', sorted(blocked))
+
+class BroadcastEngine:
+    """Persisted broadcast jobs sent in chunks through the outbound send queue
+
+    Recipients are walked in user ID order and handed to the outbox a chunk at a
+    time, so the send workers run at the bot's full rate limit. The job file is
+    checkpointed after every chunk; a job that was running when the process
+    stopped resumes from its last checkpoint (at most one chunk is sent twice).
+    Users the bot can no longer reach are recorded and skipped by later jobs.
+    """
+
+    def __init__(self, bot, outbox, storage, store, chunk_size=200, progress_interval=10.0, chunk_timeout=300.0):
+        self.bot = bot
+        self.outbox = outbox
+        # A backend, or a zero-argument callable returning one so it can be created on first use
+        self._storage = storage
+        self.store = store
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        # Longest wait for a chunk's send callbacks; recipients still missing are counted as failed
+        self.chunk_timeout = chunk_timeout
+        self._jobs = {}
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    @property
+    def storage(self):
+        return self._storage() if callable(self._storage) else self._storage
+
+    def start(self, admin_chat_id, text):
+        """Create a broadcast job and start sending it; returns the job"""
+        job = {
+            'id': uuid.uuid4().hex[:8],
+            'admin_chat_id': admin_chat_id,
+            'text': text,
+            'status': RUNNING,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'finished_at': None,
+            'cursor': '',
+            'total': 0,
+            'sent': 0,
+            'failed': 0,
+            'blocked': 0,
+            'progress_message_id': None,
+        }
+        self.store.save_job(job)
+        self._launch(job)
+        return job
+
+    def resume(self):
+        """Restart jobs that were still running when the process stopped; returns how many"""
+        resumed = 0
+        for job in self.store.load_jobs():
+            if job.get('status') == RUNNING and job['id'] not in self._threads:
+                logger.info(f"Resuming broadcast {job['id']} after user {job['cursor'] or '(start)'}")
+                self._launch(job)
+                resumed += 1
+        return resumed
+
+    def cancel(self, job_id):
+        """Stop a running job after its current chunk; False if it isn't running"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] != RUNNING:
+                return False
+            job['status'] = CANCELLED
+            return True
+
+    def mark_reachable(self, user_id):
+        """A user who talks to the bot again gets broadcasts again"""
+        self.store.remove_blocked(str(user_id))
+
+    def _launch(self, job):
+        with self._lock:
+            self._jobs[job['id']] = job
+            thread = self._threads[job['id']] = threading.Thread(target=self._run, args=(job,), name=f"broadcast-{job['id']}", daemon=True)
+        thread.start()
+
+    def _recipients(self, job):
+        """User IDs still to be sent to, in ID order"""
+        blocked = self.store.blocked_users()
+        user_ids = sorted({str(user['UserID']) for user in self.storage.get_all_users() if user.get('UserID')})
+        return [user_id for user_id in user_ids if user_id > job['cursor'] and user_id not in blocked]
+
+    def _send_chunk(self, job, chunk):
+        """Queue one chunk on the outbox and wait for every send to finish"""
+        done = threading.Condition()
+        outcomes = {}
+
+        def on_sent(user_id):
+            def callback(result, error):
+                with done:
+                    outcomes[user_id] = error
+                    done.notify()
+            return callback
+
+        for user_id in chunk:
+            self.outbox.send_message(user_id, job['text'], priority=PRIORITY_BULK, callback=on_sent(user_id))
+        with done:
+            if not done.wait_for(lambda: len(outcomes) == len(chunk), timeout=self.chunk_timeout):
+                missing = [user_id for user_id in chunk if user_id not in outcomes]
+                logger.warning(f"Broadcast {job['id']}: no send result for {len(missing)} users after {self.chunk_timeout}s, counting them as failed")
+                for user_id in missing:
+                    outcomes[user_id] = TimeoutError("send not confirmed")
+            # Callbacks arriving after the timeout must not change the counts below
+            results = dict(outcomes)
+        unreachable = [user_id for user_id, error in results.items() if error is not None and is_unreachable(error)]
+        with self._lock:
+            job['sent'] += sum(1 for error in results.values() if error is None)
+            job['blocked'] += len(unreachable)
+            job['failed'] += sum(1 for error in results.values() if error is not None) - len(unreachable)
+            job['cursor'] = chunk[-1]
+        if unreachable:
+            self.store.add_blocked(unreachable)
+
+    def _run(self, job):
+        try:
+            remaining = self._recipients(job)
+            with self._lock:
+                job['total'] = job['sent'] + job['failed'] + job['blocked'] + len(remaining)
+            self._report(job)
+            last_report = time.monotonic()
+            for start in range(0, len(remaining), self.chunk_size):
+                if job['status'] != RUNNING:
+                    break
+                self._send_chunk(job, remaining[start:start + self.chunk_size])
+                self.store.save_job(job)
+                if time.monotonic() - last_report >= self.progress_interval:
+                    self._report(job)
+                    last_report = time.monotonic()
+            with self._lock:
+                if job['status'] == RUNNING:
+                    job['status'] = DONE
+                job['finished_at'] = datetime.now(timezone.utc).isoformat()
+            self.store.save_job(job)
+            self._report(job)
+            logger.info(f"Broadcast {job['id']} {job['status']}: {job['sent']} sent, {job['blocked']} unreachable, {job['failed']} failed")
+        except Exception as e:
+            # Left as running on disk, so the next start picks it up again
+            logger.error(f"Error in broadcast {job['id']}: {e}")
+        finally:
+            with self._lock:
+                self._threads.pop(job['id'], None)
+
+    def _progress_text(self, job):
+        processed = job['sent'] + job['failed'] + job['blocked']
+        percent = 100 * processed // job['total'] if job['total'] else 100
+        status = {RUNNING: "⏳ In progress", DONE: "✅ Finished", CANCELLED: "⏹ Cancelled"}.get(job['status'], job['status'])
+        return (
+            f"💌 <b>Broadcast {job['id']}</b> — {status}\n\n"
+            f"Progress: {processed}/{job['total']} ({percent}%)\n"
+            f"✅ Sent: {job['sent']}\n"
+            f"🚫 Blocked/deactivated: {job['blocked']}\n"
+            f"⚠️ Failed: {job['failed']}"
+        )
+
+    def _report(self, job):
+        """Post or update the admin's progress message"""
+        markup = None
+        if job['status'] == RUNNING:
+            markup = inline_keyboard([[("⏹ Cancel", f"broadcast_cancel:{job['id']}")]])
+        text = self._progress_text(job)
+        try:
+            if job['progress_message_id'] is None:
+                message = self.bot.send_message(job['admin_chat_id'], text, reply_markup=markup)
+                job['progress_message_id'] = message.message_id
+                self.store.save_job(job)
+            else:
+                self.bot.edit_message_text(text, job['admin_chat_id'], job['progress_message_id'], reply_markup=markup)
+        except Exception as e:
+            logger.error(f"Error reporting progress of broadcast {job['id']}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': [
+                    {'id': job['id'], 'total': job['total'], 'processed': job['sent'] + job['failed'] + job['blocked']}
+                    for job in self._jobs.values() if job['status'] == RUNNING
+                ],
+            }
+
+def create_broadcast_engine(bot, outbox):
+    """BroadcastEngine configured from BROADCAST_* environment variables"""
+    from sheet_manager import get_sheet_manager
+    return BroadcastEngine(
+        bot,
+        outbox,
+        get_sheet_manager,
+        BroadcastStore(os.getenv("BROADCAST_DIR", "broadcasts")),
+        chunk_size=int(os.getenv("BROADCAST_CHUNK", "200")),
+        progress_interval=float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "10")),
+        chunk_timeout=float(os.getenv("BROADCAST_CHUNK_TIMEOUT", "300"))
+    )
@@ -15,8 +15,11 @@ main_menu_buttons = [
     "💬 Send Feedback", "🔧 Admin Menu"
 ]
 
-def register_cleanup_handlers(bot):
-    @bot.message_handler(func=lambda message: message.text == '🗑️ Community Cleanup')
+def register_cleanup_handlers(bot, router, outbox=None):
+    # Replies go through the outbound send queue when one is given
+    sender = outbox or bot
+
+    @router.text('🗑️ Community Cleanup')
     def start_cleanup(message):
         chat_id = message.chat.id
         description = (
@@ -29,33 +32,33 @@ def register_cleanup_handlers(bot):
             "• Get featured in our community highlights.\n\n"
             "Ready to make a difference?"
         )
-        bot.send_message(chat_id, description)
+        sender.send_message(chat_id, description)
         cleanup_submissions[chat_id] = {}
-        bot.send_message(chat_id, "Please provide the location of the cleanup. Type /cancel to abort.")
+        sender.send_message(chat_id, "Please provide the location of the cleanup. Type /cancel to abort.")
         bot.register_next_step_handler(message, location_handler, bot)
 
     def location_handler(message, bot):
         chat_id = message.chat.id
         if message.text == '/cancel' or message.text in main_menu_buttons:
-            bot.send_message(chat_id, "Submission cancelled.")
+            sender.send_message(chat_id, "Submission cancelled.")
             if chat_id in cleanup_submissions:
                 del cleanup_submissions[chat_id]
             if message.text in main_menu_buttons:
-                bot.send_message(chat_id, f"Returning to main menu. Please click '{message.text}' again.")
+                sender.send_message(chat_id, f"Returning to main menu. Please click '{message.text}' again.")
             return
         
         cleanup_submissions[chat_id]['location'] = message.text
-        bot.send_message(chat_id, "Great! Now, please upload a photo or video of the clean area. Type /cancel to abort.")
+        sender.send_message(chat_id, "Great! Now, please upload a photo or video of the clean area. Type /cancel to abort.")
         bot.register_next_step_handler(message, media_handler, bot)
 
     def media_handler(message, bot):
         chat_id = message.chat.id
         if message.text and (message.text == '/cancel' or message.text in main_menu_buttons):
-            bot.send_message(chat_id, "Submission cancelled.")
+            sender.send_message(chat_id, "Submission cancelled.")
             if chat_id in cleanup_submissions:
                 del cleanup_submissions[chat_id]
             if message.text in main_menu_buttons:
-                bot.send_message(chat_id, f"Returning to main menu. Please click '{message.text}' again.")
+                sender.send_message(chat_id, f"Returning to main menu. Please click '{message.text}' again.")
             return
 
         media_id = None
@@ -64,7 +67,7 @@ def register_cleanup_handlers(bot):
         elif message.video:
             media_id = message.video.file_id
         else:
-            bot.send_message(chat_id, "That doesn't seem to be a photo or video. Please upload a valid file or type /cancel to abort.")
+            sender.send_message(chat_id, "That doesn't seem to be a photo or video. Please upload a valid file or type /cancel to abort.")
             bot.register_next_step_handler(message, media_handler, bot)
             return
 
@@ -77,9 +80,9 @@ def register_cleanup_handlers(bot):
         markup.add(InlineKeyboardButton("Confirm", callback_data="confirm_cleanup"),
                    InlineKeyboardButton("Cancel", callback_data="cancel_cleanup"))
 
-        bot.send_message(chat_id, confirmation_message, reply_markup=markup)
+        sender.send_message(chat_id, confirmation_message, reply_markup=markup)
 
-    @bot.callback_query_handler(func=lambda call: call.data in ['confirm_cleanup', 'cancel_cleanup'])
+    @router.callback('confirm_cleanup', 'cancel_cleanup')
     def confirmation_handler(call):
         chat_id = call.message.chat.id
         if call.data == 'confirm_cleanup':
@@ -92,12 +95,12 @@ def register_cleanup_handlers(bot):
                 location=submission['location'],
                 media_url=submission['media_id']
             )
-            bot.send_message(chat_id, "Thank you! Your submission has been recorded.")
+            sender.send_message(chat_id, "Thank you! Your submission has been recorded.")
             # Notify admins
             # (You can add admin notification logic here)
         else:
-            bot.send_message(chat_id, "Submission cancelled.")
+            sender.send_message(chat_id, "Submission cancelled.")
 
         if chat_id in cleanup_submissions:
             del cleanup_submissions[chat_id]
-        bot.answer_callback_query(call.id)
+        sender.answer_callback_query(call.id)
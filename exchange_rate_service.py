@@ -3,6 +3,7 @@ import logging
 from datetime import datetime, timedelta
 import threading
 import time
+import asyncio
 
 logger = logging.getLogger(__name__)
 
@@ -14,17 +15,18 @@ class ExchangeRateService:
         self.last_updated = datetime.now()
         self.update_interval = timedelta(hours=6)
         
+    def _api_urls(self):
+        # Using multiple APIs for redundancy
+        return [
+            f"https://api.exchangerate-api.com/v4/latest/{self.base_currency}",
+            f"https://open.er-api.com/v6/latest/{self.base_currency}",
+            f"https://api.exchangerate.host/latest?base={self.base_currency}"
+        ]
+
     def fetch_exchange_rate(self):
         """Fetch the latest USD to GHS exchange rate from API"""
         try:
-            # Using multiple APIs for redundancy
-            apis = [
-                f"https://api.exchangerate-api.com/v4/latest/{self.base_currency}",
-                f"https://open.er-api.com/v6/latest/{self.base_currency}",
-                f"https://api.exchangerate.host/latest?base={self.base_currency}"
-            ]
-            
-            for api_url in apis:
+            for api_url in self._api_urls():
                 try:
                     response = requests.get(api_url, timeout=10)
                     if response.status_code == 200:
@@ -42,9 +44,31 @@ class ExchangeRateService:
             logger.error(f"Error fetching exchange rate: {e}")
             return self.rate
             
+    async def fetch_exchange_rate_async(self):
+        """fetch_exchange_rate on the asyncio runtime's shared HTTP session"""
+        from async_runtime import get_http_session
+        session = get_http_session()
+        for api_url in self._api_urls():
+            try:
+                async with session.get(api_url) as response:
+                    if response.status == 200:
+                        data = await response.json(content_type=None)
+                        if 'rates' in data and self.target_currency in data['rates']:
+                            rate = data['rates'][self.target_currency]
+                            logger.info(f"Updated exchange rate: 1 USD = {rate} GHS")
+                            return rate
+            except Exception as e:
+                logger.warning(f"Failed to fetch from {api_url}: {e}")
+        return self.rate
+
     def update_rate(self):
         """Update the exchange rate"""
-        new_rate = self.fetch_exchange_rate()
+        self._apply_rate(self.fetch_exchange_rate())
+
+    async def update_rate_async(self):
+        self._apply_rate(await self.fetch_exchange_rate_async())
+
+    def _apply_rate(self, new_rate):
         if new_rate != self.rate:
             self.rate = new_rate
             self.last_updated = datetime.now()
@@ -73,15 +97,28 @@ class ExchangeRateService:
 # Create the service instance
 exchange_rate_service = ExchangeRateService()
 
-# Background thread for rate updates
+_updater_thread = None
+_updater_lock = threading.Lock()
+
+# Background thread for rate updates; its first pass replaces the default rate
 def start_rate_updater():
-    def update_rates():
-        while True:
-            exchange_rate_service.update_rate()
-            time.sleep(3600)  # Update every hour
-    thread = threading.Thread(target=update_rates, daemon=True)
-    thread.start()
+    global _updater_thread
+    with _updater_lock:
+        if _updater_thread and _updater_thread.is_alive():
+            return _updater_thread
+        def update_rates():
+            while True:
+                exchange_rate_service.update_rate()
+                time.sleep(3600)  # Update every hour
+        _updater_thread = threading.Thread(target=update_rates, name="exchange-rate-updater", daemon=True)
+        _updater_thread.start()
+        return _updater_thread
+
+async def rate_updater():
+    """Asyncio counterpart of start_rate_updater, for the async runtime"""
+    while True:
+        await exchange_rate_service.update_rate_async()
+        await asyncio.sleep(3600)  # Update every hour
 
-# Initialize the rate
-USD_TO_CEDIS_RATE = exchange_rate_service.get_rate()
-start_rate_updater()
+# Default rate until the updater (started during warm-up) has fetched a live one
+USD_TO_CEDIS_RATE = exchange_rate_service.rate
@@ -0,0 +1,323 @@
+import re
+import time
+import logging
+import threading
+from collections import deque, Counter
+from datetime import datetime, timezone
+from write_buffer import column_letter
+
+try:
+    from gspread.exceptions import WorksheetNotFound
+except ImportError:
+    class WorksheetNotFound(Exception):
+        pass
+
+logger = logging.getLogger(__name__)
+
+# Sheets API calls that count against the read quota; everything else is a write
+READ_CALLS = {'get_all_values', 'get_all_records', 'find', 'findall', 'cell', 'batch_get', 'row_values', 'col_values'}
+
+class QuotaExceeded(Exception):
+    """Raised like gspread's 429 APIError; the message matches what QuotaScheduler looks for"""
+
+def _column_number(letters):
+    number = 0
+    for char in letters:
+        number = number * 26 + ord(char) - 64
+    return number
+
+def _parse_cell(ref):
+    match = re.fullmatch(r'([A-Z]*)(\d*)', ref)
+    if not match:
+        raise ValueError(f"Bad cell reference {ref!r}")
+    letters, digits = match.groups()
+    return (int(digits) if digits else None), (_column_number(letters) if letters else None)
+
+def _parse_range(a1):
+    """'A2:C10', 'B5', 'A11:I' -> 1-based (first_row, first_col, last_row, last_col); None means open-ended"""
+    a1 = a1.split('!')[-1].replace('$', '').upper()
+    start, _, end = a1.partition(':')
+    first_row, first_col = _parse_cell(start)
+    last_row, last_col = _parse_cell(end) if end else (first_row, first_col)
+    return first_row or 1, first_col or 1, last_row, last_col
+
+def _render(value):
+    """Store values the way the Sheets UI shows them: everything is a string, 3.0 reads back as 3"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def _numericise(value):
+    if value == '':
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+class Cell:
+    def __init__(self, row, col, value):
+        self.row = row
+        self.col = col
+        self.value = value
+
+    def __repr__(self):
+        return f"<Cell R{self.row}C{self.col} {self.value!r}>"
+
+class FakeClient:
+    """In-memory stand-in for an authorised gspread client
+
+    Every API call sleeps `latency` seconds and is counted against per-minute read and
+    write quotas; a call over quota raises QuotaExceeded like the real 429 response.
+    """
+
+    def __init__(self, latency=0.0, reads_per_minute=None, writes_per_minute=None):
+        self.latency = latency
+        self.quotas = {'read': reads_per_minute, 'write': writes_per_minute}
+        self._windows = {'read': deque(), 'write': deque()}
+        self._lock = threading.Lock()
+        self._spreadsheets = {}
+        self.calls = Counter()
+        self.rejected = Counter()
+
+    def open_by_key(self, key):
+        with self._lock:
+            if key not in self._spreadsheets:
+                self._spreadsheets[key] = FakeSpreadsheet(self, key)
+            return self._spreadsheets[key]
+
+    def _charge(self, method):
+        """Apply simulated latency and quota to one API call"""
+        kind = 'read' if method in READ_CALLS else 'write'
+        with self._lock:
+            limit = self.quotas[kind]
+            window = self._windows[kind]
+            now = time.monotonic()
+            while window and now - window[0] >= 60:
+                window.popleft()
+            if limit is not None and len(window) >= limit:
+                self.rejected[method] += 1
+                raise QuotaExceeded(f"APIError: [429]: Quota exceeded for quota metric '{kind.title()} requests'")
+            window.append(now)
+            self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def stats(self):
+        """Call counts per method plus read/write totals"""
+        with self._lock:
+            calls = dict(self.calls)
+            return {
+                'calls': calls,
+                'reads': sum(count for method, count in calls.items() if method in READ_CALLS),
+                'writes': sum(count for method, count in calls.items() if method not in READ_CALLS),
+                'rejected': dict(self.rejected),
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls.clear()
+            self.rejected.clear()
+
+class FakeSpreadsheet:
+    def __init__(self, client, key):
+        self.client = client
+        self.id = key
+        self._worksheets = {}
+        self._lock = threading.RLock()
+        self._last_update = datetime.now(timezone.utc).isoformat()
+
+    def _touch(self):
+        self._last_update = datetime.now(timezone.utc).isoformat()
+
+    def worksheet(self, title):
+        with self._lock:
+            if title not in self._worksheets:
+                raise WorksheetNotFound(title)
+            return self._worksheets[title]
+
+    def worksheets(self):
+        with self._lock:
+            return list(self._worksheets.values())
+
+    def add_worksheet(self, title, rows=1000, cols=26):
+        with self._lock:
+            worksheet = FakeWorksheet(self, title)
+            self._worksheets[title] = worksheet
+            self._touch()
+            return worksheet
+
+    def get_lastUpdateTime(self):
+        # A Drive metadata request in gspread; not charged against the Sheets quotas
+        with self._lock:
+            return self._last_update
+
+class FakeWorksheet:
+    """Subset of gspread.Worksheet that SheetManager uses, backed by a list of rows"""
+
+    def __init__(self, spreadsheet, title, rows=None):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self._rows = [[_render(value) for value in row] for row in rows or []]
+
+    @property
+    def _lock(self):
+        return self.spreadsheet._lock
+
+    def _charge(self, method):
+        self.spreadsheet.client._charge(method)
+
+    def _read(self, first_row, first_col, last_row, last_col):
+        """Values in a 1-based inclusive range, trimmed of trailing empty rows like the API"""
+        last_row = len(self._rows) if last_row is None else min(last_row, len(self._rows))
+        values = []
+        for row in self._rows[first_row - 1:last_row]:
+            end = len(row) if last_col is None else last_col
+            values.append(row[first_col - 1:end])
+        while values and not any(values[-1]):
+            values.pop()
+        return values
+
+    def _write(self, row, col, value):
+        while len(self._rows) < row:
+            self._rows.append([])
+        cells = self._rows[row - 1]
+        while len(cells) < col:
+            cells.append('')
+        cells[col - 1] = _render(value)
+
+    def _updated_range(self, first_row, last_row, width):
+        return f"'{self.title}'!A{first_row}:{column_letter(max(width, 1))}{last_row}"
+
+    def load(self, rows):
+        """Replace the sheet contents without charging an API call, for seeding fixtures"""
+        with self._lock:
+            self._rows = [[_render(value) for value in row] for row in rows]
+            self.spreadsheet._touch()
+
+    def get_all_values(self):
+        self._charge('get_all_values')
+        with self._lock:
+            return self._read(1, 1, None, None)
+
+    def get_all_records(self):
+        self._charge('get_all_records')
+        with self._lock:
+            values = self._read(1, 1, None, None)
+        if not values:
+            return []
+        headers = values[0]
+        return [
+            {header: _numericise(row[i]) if i < len(row) else '' for i, header in enumerate(headers)}
+            for row in values[1:]
+        ]
+
+    def row_values(self, row):
+        self._charge('row_values')
+        with self._lock:
+            return list(self._rows[row - 1]) if row <= len(self._rows) else []
+
+    def col_values(self, col):
+        self._charge('col_values')
+        with self._lock:
+            values = [row[col - 1] if col <= len(row) else '' for row in self._rows]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def cell(self, row, col):
+        self._charge('cell')
+        with self._lock:
+            cells = self._rows[row - 1] if row <= len(self._rows) else []
+            return Cell(row, col, cells[col - 1] if col <= len(cells) else '')
+
+    def _matches(self, query):
+        for row_number, row in enumerate(self._rows, start=1):
+            for col_number, value in enumerate(row, start=1):
+                if (query.fullmatch(value) if hasattr(query, 'fullmatch') else value == str(query)):
+                    yield Cell(row_number, col_number, value)
+
+    def find(self, query):
+        self._charge('find')
+        with self._lock:
+            return next(self._matches(query), None)
+
+    def findall(self, query):
+        self._charge('findall')
+        with self._lock:
+            return list(self._matches(query))
+
+    def batch_get(self, ranges):
+        self._charge('batch_get')
+        with self._lock:
+            return [self._read(*_parse_range(a1)) for a1 in ranges]
+
+    def update_cell(self, row, col, value):
+        self._charge('update_cell')
+        with self._lock:
+            self._write(row, col, value)
+            self.spreadsheet._touch()
+        return {'updatedRange': f"'{self.title}'!{column_letter(col)}{row}", 'updatedCells': 1}
+
+    def batch_update(self, data, value_input_option='RAW'):
+        self._charge('batch_update')
+        cells = 0
+        with self._lock:
+            for entry in data:
+                first_row, first_col, _, _ = _parse_range(entry['range'])
+                for r, values in enumerate(entry['values']):
+                    for c, value in enumerate(values):
+                        self._write(first_row + r, first_col + c, value)
+                        cells += 1
+            self.spreadsheet._touch()
+        return {'totalUpdatedCells': cells}
+
+    def _append(self, rows):
+        with self._lock:
+            values = self._read(1, 1, None, None)
+            first_row = len(values) + 1
+            del self._rows[len(values):]
+            for row in rows:
+                self._rows.append([_render(value) for value in row])
+            self.spreadsheet._touch()
+            width = max((len(row) for row in rows), default=1)
+            return {'updates': {'updatedRange': self._updated_range(first_row, first_row + len(rows) - 1, width)}}
+
+    def delete_rows(self, start_index, end_index=None):
+        self._charge('delete_rows')
+        with self._lock:
+            del self._rows[start_index - 1:end_index or start_index]
+            self.spreadsheet._touch()
+
+    def append_row(self, values, value_input_option='RAW'):
+        self._charge('append_row')
+        return self._append([values])
+
+    def append_rows(self, values, value_input_option='RAW'):
+        self._charge('append_rows')
+        return self._append(values)
+
+# Header rows of the worksheets SheetManager opens, for seeding an emulated spreadsheet
+LEARN_EARN_WORKSHEETS = {
+    "LearnEarnAfrica": ["UserID", "Name", "Username", "Tokens", "Points", "MoMoNumber", "referral_code", "ReferralEarnings"],
+    "TokenLog": ["user_id", "transaction_id", "amount", "payment_method", "timestamp"],
+    "Redemptions": ["referrer_id", "referred_id", "timestamp"],
+}
+
+def create_learn_earn_spreadsheet(client=None, key="emulated", users=()):
+    """Build an emulated spreadsheet with the worksheets SheetManager expects, optionally seeded with user rows"""
+    client = client or FakeClient()
+    spreadsheet = client.open_by_key(key)
+    for title, header in LEARN_EARN_WORKSHEETS.items():
+        try:
+            spreadsheet.worksheet(title)
+        except WorksheetNotFound:
+            spreadsheet.add_worksheet(title=title).load([header])
+    if users:
+        spreadsheet.worksheet("LearnEarnAfrica").load([LEARN_EARN_WORKSHEETS["LearnEarnAfrica"]] + [list(row) for row in users])
+    return client
@@ -0,0 +1,63 @@
+"""Bulk-register users from a CSV file
+
+    python import_users.py partner_school.csv [--chunk-size 1000] [--dry-run]
+
+The CSV needs a user ID column (UserID / user_id / chat_id) and may have Name,
+Username and ReferrerID columns. Users that are already registered are skipped.
+"""
+import csv
+import sys
+import time
+import logging
+import argparse
+from sheet_manager import get_sheet_manager
+
+# Accepted header spellings, compared lower-cased with spaces and underscores removed
+COLUMN_ALIASES = {
+    'user_id': ('userid', 'chatid', 'telegramid', 'id'),
+    'name': ('name', 'firstname', 'fullname'),
+    'username': ('username', 'telegramusername'),
+    'referrer_id': ('referrerid', 'referrer', 'referredby'),
+}
+
+def _normalise(header):
+    return str(header).lower().replace('_', '').replace(' ', '').strip()
+
+def read_users(path):
+    """Yield {user_id, name, username, referrer_id} dicts from a CSV file"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        columns = {}
+        for header in reader.fieldnames or []:
+            for field, aliases in COLUMN_ALIASES.items():
+                if field not in columns and _normalise(header) in aliases:
+                    columns[field] = header
+        if 'user_id' not in columns:
+            raise ValueError(f"{path} has no user ID column (expected one of {COLUMN_ALIASES['user_id']})")
+        for row in reader:
+            user = {field: (row.get(header) or '').strip() for field, header in columns.items()}
+            if user['user_id']:
+                yield user
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-register users from a CSV file")
+    parser.add_argument('path', help="CSV file with a UserID column")
+    parser.add_argument('--chunk-size', type=int, default=None, help="rows per append call (default BULK_IMPORT_CHUNK or 1000)")
+    parser.add_argument('--dry-run', action='store_true', help="count new users without writing anything")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    started = time.time()
+    users = list(read_users(args.path))
+    storage = get_sheet_manager()
+    if args.dry_run:
+        new_ids = {user['user_id'] for user in users} - set(storage.get_users_data({user['user_id'] for user in users}))
+        print(f"{len(users)} rows, {len(new_ids)} new users")
+        return 0
+    added = storage.register_users(users, chunk_size=args.chunk_size)
+    storage.flush_writes()
+    print(f"Imported {added} new users from {len(users)} rows in {time.time() - started:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
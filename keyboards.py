@@ -0,0 +1,26 @@
+import json
+
+# Telegram reply markups as ready-to-send JSON strings. TeleBot passes a string
+# reply_markup through to the API unchanged, so a markup built once at import can
+# be attached to any number of replies without creating markup objects.
+
+def _dumps(markup):
+    return json.dumps(markup, ensure_ascii=False, separators=(',', ':'))
+
+def reply_keyboard(rows, resize_keyboard=True):
+    """Reply keyboard from rows of button labels"""
+    return _dumps({
+        'keyboard': [[{'text': label} for label in row] for row in rows],
+        'resize_keyboard': resize_keyboard,
+    })
+
+def inline_keyboard(rows):
+    """Inline keyboard from rows of (label, callback_data) pairs"""
+    return _dumps({
+        'inline_keyboard': [[{'text': label, 'callback_data': data} for label, data in row] for row in rows],
+    })
+
+def rows_of(items, width):
+    """Split items into rows of at most width, like a markup's row_width"""
+    items = list(items)
+    return [items[i:i + width] for i in range(0, len(items), width)]
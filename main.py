@@ -8,15 +8,12 @@ import schedule
 import traceback
 from datetime import datetime, timezone
 from dotenv import load_dotenv
-from googletrans import Translator
 from telebot import TeleBot, types
-from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from flask import Flask, request, abort
 
 from sheet_manager import (
     register_user,
     get_user_data,
-    update_user_tokens_points,
     reward_referrer,
     log_token_purchase,
     increment_referral_count,
@@ -26,8 +23,13 @@ from sheet_manager import (
     get_sheet_manager,
     find_user_by_referral_code,
     update_transaction_status,
+    find_transaction,
+    is_pending_transaction,
     log_cleanup_submission
 )
+from token_ledger import token_ledger
+from user_locks import user_lock
+from quota_scheduler import quota_scheduler
 from translation_service import translation_service
 from exchange_rate_service import exchange_rate_service
 from ui_enhancer import ui_enhancer
@@ -35,6 +37,14 @@ from user_preference_service import user_preference_service
 import quiz_manager
 from quiz_manager import player_progress
 from cleanup_handler import register_cleanup_handlers
+from startup import start_warm_up, startup_report
+from update_dispatcher import UpdateDispatcher, chat_key
+from request_context import request_scope
+from send_queue import create_outbox
+from broadcast import create_broadcast_engine
+from keyboards import reply_keyboard, inline_keyboard
+from router import Router
+from media_registry import MediaRegistry
 
 # --- Setup ---
 load_dotenv()
@@ -50,8 +60,17 @@ ADMIN_CHAT_IDS = [
 
 API_KEY = os.getenv("TELEGRAM_API_KEY") or "YOUR_FALLBACK_API_KEY"
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
-bot = TeleBot(API_KEY, parse_mode='HTML')
-translator = Translator()
+# Handlers run on update_dispatcher's workers rather than TeleBot's own unordered thread pool
+bot = TeleBot(API_KEY, parse_mode='HTML', threaded=False)
+# Handlers queue their replies here instead of blocking on the Bot API
+outbox = create_outbox(bot)
+broadcasts = create_broadcast_engine(bot, outbox)
+# Text buttons, commands and callback data are routed by dict lookup, not per-handler filters
+router = Router()
+router.install(bot)
+# Static images are uploaded once and then sent by Telegram file_id
+media = MediaRegistry(bot, os.getenv("MEDIA_REGISTRY_PATH", "media_registry.json"), outbox)
+media.register("welcome", os.getenv("WELCOME_IMAGE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "L&E.png")))
 app = Flask(__name__)
 
 
@@ -203,10 +222,7 @@ paused_games = {}
 pending_token_purchases = {}
 user_feedback_mode = {}
 user_actions = {}
-custom_token_requests = {}
 country_list_page = {}  # Add this line to your global state
-user_momo_pending = {}
-user_momo_pending = {}
 
 MOTIVATIONAL_MESSAGES = [
     "🌟 Believe in yourself! Every question you answer makes you smarter!",
@@ -247,7 +263,7 @@ def notify_admin_token_purchase(user_id, package_info, payment_method):
             f"⃣ Use Admin Dashboard to approve purchase"
         )
         for admin_id in ADMIN_CHAT_IDS:
-            bot.send_message(admin_id, message)
+            outbox.send_message(admin_id, message)
     except Exception as e:
         logger.error(f"Error notifying admin: {e}")
 
@@ -268,21 +284,18 @@ def send_feedback_to_admin(user_id, feedback_text):
             f"• Referrals: {int(user_data.get('ReferralEarnings', 0))}"
         )
         for admin_id in ADMIN_CHAT_IDS:
-            bot.send_message(admin_id, feedback_message)
+            outbox.send_message(admin_id, feedback_message)
     except Exception as e:
         logger.error(f"Error sending feedback to admin: {e}")
 
 def translate_text(text, lang_code):
-    try:
-        return translator.translate(text, dest=lang_code).text
-    except Exception as e:
-        logger.error(f"Translation error: {e}")
-        return text
+    return translation_service.translate_text(text, lang_code)
 
 # --- Registration & MoMo ---
-@bot.message_handler(commands=['start'])
+@router.command('start')
 def start_handler(message):
     chat_id = message.chat.id
+    broadcasts.mark_reachable(chat_id)
 
     # Extract referral code from start command
     referral_code = None
@@ -299,14 +312,17 @@ def start_handler(message):
         user = get_user_data(chat_id)
         # Reward referrer if this is a new referral
         if referrer_user and user:
-            reward_referrer(referrer_user['UserID'], 2)  # 2 tokens for referral
+            # Held across both so the logged balance is the one this reward produced
+            with user_lock(referrer_user['UserID']):
+                reward_referrer(referrer_user['UserID'], 2)  # 2 tokens for referral
+                token_ledger.log(referrer_user['UserID'], tokens=2, reason="referral", reference=chat_id)
             increment_referral_count(referrer_user['UserID'], chat_id)
             logger.info(f"Referral reward: User {referrer_user['UserID']} got 2 tokens for referring {chat_id}")
-            bot.send_message(referrer_user['UserID'], f"✅ You earned 2 tokens for referring {user['Name']}.")
-            bot.send_message(chat_id, f"✅ You joined with a referral code from {referrer_user['Name']}. They have been rewarded!")
+            outbox.send_message(referrer_user['UserID'], f"✅ You earned 2 tokens for referring {user['Name']}.")
+            outbox.send_message(chat_id, f"✅ You joined with a referral code from {referrer_user['Name']}. They have been rewarded!")
     if not user.get("MoMoNumber"):
-        bot.send_message(chat_id, "📱 Please enter your MoMo number to continue:")
-        user_momo_pending[chat_id] = "awaiting_momo"
+        outbox.send_message(chat_id, "📱 Please enter your MoMo number to continue:")
+        router.set_state(chat_id, "awaiting_momo")
         return
 
     welcome_msg = WELCOME_MESSAGE.format(
@@ -314,21 +330,19 @@ def start_handler(message):
         about_us=ABOUT_US,
         motivation=random.choice(MOTIVATIONAL_MESSAGES)
     )
-    with open('/home/mawutor/Downloads/Learn4Cash/L&E.png', 'rb') as photo:
-        bot.send_photo(chat_id, photo)
-    bot.send_message(chat_id, welcome_msg, reply_markup=create_main_menu(chat_id))
+    media.send_photo(chat_id, "welcome")
+    outbox.send_message(chat_id, welcome_msg, reply_markup=create_main_menu(chat_id))
 
-@bot.message_handler(func=lambda message: message.chat.id in user_momo_pending)
+@router.state("awaiting_momo")
 def momo_number_handler(message):
     chat_id = message.chat.id
-    if user_momo_pending[chat_id] == "awaiting_momo":
-        momo_number = message.text.strip()
-        update_user_momo(chat_id, momo_number)
-        del user_momo_pending[chat_id]
-        bot.send_message(chat_id, "✅ MoMo number saved!", reply_markup=create_main_menu(chat_id))
+    momo_number = message.text.strip()
+    update_user_momo(chat_id, momo_number)
+    router.clear_state(chat_id)
+    outbox.send_message(chat_id, "✅ MoMo number saved!", reply_markup=create_main_menu(chat_id))
 
 # --- Quiz Handler ---
-@bot.message_handler(func=lambda message: message.text == "🎲 Start Quiz")
+@router.text("🎲 Start Quiz")
 def start_quiz_handler(message):
     chat_id = message.chat.id
     start_new_quiz(chat_id)
@@ -337,23 +351,18 @@ def start_quiz_handler(message):
 def start_new_quiz(chat_id):
     user = get_user_data(chat_id)
     if not user:
-        bot.send_message(chat_id, "Please /start first.")
+        outbox.send_message(chat_id, "Please /start first.")
         return
     if float(user['Tokens']) <= 0:
-        bot.send_message(chat_id, "⚠️ You don't have any tokens! Use '$💰 Buy Tokens' to continue playing.")
+        outbox.send_message(chat_id, "⚠️ You don't have any tokens! Use '$💰 Buy Tokens' to continue playing.")
         return
     if chat_id in paused_games:
-        markup = InlineKeyboardMarkup()
-        markup.add(
-            InlineKeyboardButton("▶️ Resume Game", callback_data="resume_game"),
-            InlineKeyboardButton("🎲 New Game", callback_data="new_game")
-        )
-        bot.send_message(chat_id, "⌐️ You have a paused game. Would you like to resume or start a new one?", reply_markup=markup)
+        outbox.send_message(chat_id, "⌐️ You have a paused game. Would you like to resume or start a new one?", reply_markup=PAUSED_GAME_MENU)
         return
     
     quiz = quiz_manager.get_random_question(chat_id)
     if not quiz:
-        bot.send_message(chat_id, "❌ Error loading quiz. Please try again.")
+        outbox.send_message(chat_id, "❌ Error loading quiz. Please try again.")
         return
     
     lang = "English" # Hardcoded for now, can be changed later
@@ -368,122 +377,108 @@ def start_new_quiz(chat_id):
         'skipped': False,
         'original_answer': quiz['a']
     }
-    answer_markup = InlineKeyboardMarkup()
-    for choice in choices:
-        answer_markup.add(InlineKeyboardButton(choice, callback_data=f"answer:{choice}"))
-    answer_markup.add(
-        InlineKeyboardButton("⏩️ Skip", callback_data="skip_question"),
-        InlineKeyboardButton("⏰ Pause", callback_data="pause_game")
-    )
-    answer_markup.add(InlineKeyboardButton("🏠 Return to Main Menu", callback_data="return_main")
-    )
-    bot.send_message(chat_id, f"🧠 <b>Quiz:</b>\n{question}", reply_markup=answer_markup)
+    outbox.send_message(chat_id, f"🧠 <b>Quiz:</b>\n{question}", reply_markup=quiz_answer_markup(choices))
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("answer:"))
+@router.callback_prefix("answer:")
 def answer_handler(call):
     chat_id = call.message.chat.id
     user = get_user_data(chat_id)
-    if not user or chat_id not in current_question:
-        bot.answer_callback_query(call.id, "No active question.")
-        return
     answer = call.data.split("answer:")[1]
-    correct = current_question[chat_id]['correct']
-    tokens = float(user['Tokens'])
-    points = float(user['Points'])
-    bonus_earned = quiz_manager.update_player_progress(chat_id, answer == correct)
+    # Claim the question and score it in one per-user critical section, so a double tap is scored once
+    with user_lock(chat_id):
+        quiz = current_question.pop(chat_id, None) if user else None
+        if quiz:
+            correct = quiz['correct']
+            bonus_earned = quiz_manager.update_player_progress(chat_id, answer == correct)
+            if answer == correct:
+                balances = token_ledger.record(chat_id, tokens=-1, points=10, reason="quiz_correct")
+                if balances and bonus_earned:
+                    balances = token_ledger.record(chat_id, tokens=3, reason="streak_bonus")
+            else:
+                balances = token_ledger.record(chat_id, tokens=-1, reason="quiz_wrong")
+    if not quiz:
+        outbox.answer_callback_query(call.id, "No active question.")
+        return
+    if not balances:
+        outbox.answer_callback_query(call.id, "❌ Could not update your balance. Please try again.")
+        return
+    tokens, points = balances
     if answer == correct:
-        points += 10
-        tokens -= 1
-        update_user_tokens_points(chat_id, tokens, points)
-        bot.answer_callback_query(call.id, "✅ Correct! +10 points")
+        outbox.answer_callback_query(call.id, "✅ Correct! +10 points")
         if bonus_earned:
-            tokens += 3
-            update_user_tokens_points(chat_id, tokens, points)
-            bot.send_message(chat_id, "🔥 Streak bonus! +3 tokens")
+            outbox.send_message(chat_id, "🔥 Streak bonus! +3 tokens")
     else:
-        tokens -= 1
-        update_user_tokens_points(chat_id, tokens, points)
-        bot.answer_callback_query(call.id, "❌ Wrong answer!")
-        bot.send_message(chat_id, f"❌ Wrong! The correct answer was: <b>{current_question[chat_id]['original_answer']}</b>")
-    bot.send_message(chat_id, f"💰 Balance: {tokens} tokens | {points} points\n🔥 Current Streak: {quiz_manager.player_progress[chat_id]['current_streak']}")
-    del current_question[chat_id]
+        outbox.answer_callback_query(call.id, "❌ Wrong answer!")
+        outbox.send_message(chat_id, f"❌ Wrong! The correct answer was: <b>{quiz['original_answer']}</b>")
+    outbox.send_message(chat_id, f"💰 Balance: {tokens} tokens | {points} points\n🔥 Current Streak: {quiz_manager.player_progress[chat_id]['current_streak']}")
     if tokens > 0:
         start_new_quiz(chat_id)
     else:
-        bot.send_message(chat_id, "🌊 End You've run out of tokens. Use '$💰 Buy Tokens' to continue playing!", reply_markup=create_main_menu(chat_id))
+        outbox.send_message(chat_id, "🌊 End You've run out of tokens. Use '$💰 Buy Tokens' to continue playing!", reply_markup=create_main_menu(chat_id))
 
-@bot.callback_query_handler(func=lambda call: call.data == "skip_question")
+@router.callback("skip_question")
 def skip_question_handler(call):
     chat_id = call.message.chat.id
     if chat_id in current_question and not current_question[chat_id]['skipped']:
         current_question[chat_id]['skipped'] = True
-        bot.send_message(chat_id, "⏩️ Question skipped! No tokens deducted.")
+        outbox.send_message(chat_id, "⏩️ Question skipped! No tokens deducted.")
         del current_question[chat_id]
         start_new_quiz(chat_id)
     else:
-        bot.send_message(chat_id, "❌ You can only skip once per question.")
+        outbox.send_message(chat_id, "❌ You can only skip once per question.")
 
-@bot.callback_query_handler(func=lambda call: call.data == "pause_game")
+@router.callback("pause_game")
 def pause_game_handler(call):
     chat_id = call.message.chat.id
     if chat_id in current_question:
         paused_games[chat_id] = current_question[chat_id]
         del current_question[chat_id]
-        bot.send_message(chat_id, "⏰ Game paused. Use '🎮 Start Quiz' to resume.")
+        outbox.send_message(chat_id, "⏰ Game paused. Use '🎮 Start Quiz' to resume.")
     else:
-        bot.send_message(chat_id, "❌ No active game to pause.")
+        outbox.send_message(chat_id, "❌ No active game to pause.")
 
-@bot.callback_query_handler(func=lambda call: call.data == "resume_game")
+@router.callback("resume_game")
 def resume_game_handler(call):
     chat_id = call.message.chat.id
     if chat_id in paused_games:
         current_question[chat_id] = paused_games[chat_id]
         del paused_games[chat_id]
         quiz = current_question[chat_id]
-        answer_markup = InlineKeyboardMarkup()
-        for choice in quiz['choices']:
-            answer_markup.add(InlineKeyboardButton(choice, callback_data=f"answer:{choice}"))
-        answer_markup.add(InlineKeyboardButton("⏩️ Skip", callback_data="skip_question"), InlineKeyboardButton("⏰ Pause", callback_data="pause_game"))
-        bot.send_message(chat_id, f"🧠 <b>Quiz:</b>\n{quiz['question']}", reply_markup=answer_markup)
+        outbox.send_message(chat_id, f"🧠 <b>Quiz:</b>\n{quiz['question']}", reply_markup=quiz_answer_markup(quiz['choices'], with_return=False))
     else:
-        bot.send_message(chat_id, "❌ No paused game found.")
+        outbox.send_message(chat_id, "❌ No paused game found.")
 
-@bot.callback_query_handler(func=lambda call: call.data == "new_game")
+@router.callback("new_game")
 def new_game_handler(call):
     chat_id = call.message.chat.id
     if chat_id in paused_games:
         del paused_games[chat_id]
     start_new_quiz(chat_id)
 
-@bot.callback_query_handler(func=lambda call: call.data == "return_main")
+@router.callback("return_main")
 def return_main_handler(call):
     chat_id = call.message.chat.id
-    bot.send_message(chat_id, "Back to main menu.", reply_markup=create_main_menu(chat_id))
+    outbox.send_message(chat_id, "Back to main menu.", reply_markup=create_main_menu(chat_id))
     if chat_id in current_question:
         del current_question[chat_id]
 
 # --- Token Purchase Handler ---
-@bot.message_handler(func=lambda message: message.text == "💰 Buy Tokens")
+@router.text("💰 Buy Tokens")
 def buy_tokens_handler(message):
     chat_id = message.chat.id
-    markup = InlineKeyboardMarkup()
-    for label, data in TOKEN_PRICING.items():
-        price_text = f"{label} (₢{data['price_cedis']} / ${data['price_usd']})"
-        markup.add(InlineKeyboardButton(price_text, callback_data=f"buy:{label}"))
-    markup.add(InlineKeyboardButton("Custom Amount", callback_data="buy:custom"))
-    bot.send_message(chat_id, f"$💰 Choose a token package:\n\n{PAYMENT_INFO}", reply_markup=markup)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith("buy:"))
+    outbox.send_message(chat_id, f"$💰 Choose a token package:\n\n{PAYMENT_INFO}", reply_markup=TOKEN_PACKAGE_MENU)
+
+@router.callback_prefix("buy:")
 def buy_token_callback(call):
     chat_id = call.message.chat.id
     package_label = call.data.split("buy:")[1]
     if package_label == "custom":
-        custom_token_requests[chat_id] = {"waiting_for_amount": True}
-        bot.send_message(chat_id, "Please enter the number of tokens you want to buy:")
-        bot.answer_callback_query(call.id)
+        router.set_state(chat_id, "awaiting_token_amount")
+        outbox.send_message(chat_id, "Please enter the number of tokens you want to buy:")
+        outbox.answer_callback_query(call.id)
         return
     if package_label not in TOKEN_PRICING:
-        bot.answer_callback_query(call.id, "Invalid package.")
+        outbox.answer_callback_query(call.id, "Invalid package.")
         return
     amount = TOKEN_PRICING[package_label]['amount']
     price = TOKEN_PRICING[package_label]['price_cedis']
@@ -491,15 +486,15 @@ def buy_token_callback(call):
     log_token_purchase(chat_id, transaction_id, amount, "MTN MoMo or USDT")
     pending_token_purchases[chat_id] = {"amount": amount, "price_cedis": price, "price_usd": TOKEN_PRICING[package_label]['price_usd'], "package": package_label, "transaction_id": transaction_id}
     notify_admin_token_purchase(chat_id, pending_token_purchases[chat_id], "MTN MoMo or USDT")
-    bot.send_message(
+    outbox.send_message(
         chat_id,
         f"To buy {amount} tokens for GHS {price}, send payment via MTN MoMo or USDT. Your Transaction ID is `{transaction_id}`. An admin will approve it shortly.",
         parse_mode="Markdown",
-        reply_markup=InlineKeyboardMarkup().add(InlineKeyboardButton("📱 Notify Admin", callback_data="notify_admin_purchase"))
+        reply_markup=NOTIFY_ADMIN_MENU
     )
-    bot.answer_callback_query(call.id)
+    outbox.answer_callback_query(call.id)
 
-@bot.message_handler(func=lambda message: message.chat.id in custom_token_requests and custom_token_requests[message.chat.id].get('waiting_for_amount'))
+@router.state("awaiting_token_amount")
 def custom_token_handler(message):
     chat_id = message.chat.id
     if message.text.isdigit():
@@ -508,115 +503,104 @@ def custom_token_handler(message):
         price_usd = round(price_cedis / USD_TO_CEDIS_RATE, 2)
         pending_token_purchases[chat_id] = {"amount": amount, "price_cedis": price_cedis, "price_usd": price_usd, "package": "Custom"}
         notify_admin_token_purchase(chat_id, pending_token_purchases[chat_id], "MTN MoMo or USDT")
-        bot.send_message(chat_id, f"To buy {amount} tokens for GHS {price_cedis}, send payment via MTN MoMo or USDT and reply with your transaction ID.\n\n{PAYMENT_INFO}")
-        del custom_token_requests[chat_id]
+        outbox.send_message(chat_id, f"To buy {amount} tokens for GHS {price_cedis}, send payment via MTN MoMo or USDT and reply with your transaction ID.\n\n{PAYMENT_INFO}")
+        router.clear_state(chat_id)
     else:
-        bot.send_message(chat_id, "Please enter a valid number for tokens.")
+        outbox.send_message(chat_id, "Please enter a valid number for tokens.")
 
 # --- Redeem Rewards Handler ---
-@bot.message_handler(func=lambda message: message.text == "🎁 Redeem Rewards")
+@router.text("🎁 Redeem Rewards")
 def redeem_rewards_handler(message):
     chat_id = message.chat.id
     user = get_user_data(chat_id)
     points = user.get('Points', 0)
-    
-    markup = InlineKeyboardMarkup()
-    for category_id, category_info in REWARD_CATEGORIES.items():
-        markup.add(InlineKeyboardButton(category_info["name"], callback_data=f"category:{category_id}"))
-    
-    bot.send_message(chat_id, f"🎁 You have {points} points. Choose a reward category:", reply_markup=markup)
+    outbox.send_message(chat_id, f"🎁 You have {points} points. Choose a reward category:", reply_markup=REWARD_CATEGORY_MENU)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("category:"))
+@router.callback_prefix("category:")
 def category_selection_handler(call):
     chat_id = call.message.chat.id
     category_id = call.data.split("category:")[1]
     
     if category_id not in REWARD_CATEGORIES:
-        bot.answer_callback_query(call.id, "Invalid category.")
+        outbox.answer_callback_query(call.id, "Invalid category.")
         return
     
     user = get_user_data(chat_id)
     points = user.get('Points', 0)
     category_info = REWARD_CATEGORIES[category_id]
     
-    # Get rewards for this category
-    category_rewards = {k: v for k, v in REDEEM_OPTIONS.items() if v.get('category') == category_id}
-    
-    if not category_rewards:
-        bot.answer_callback_query(call.id, "No rewards available in this category.")
+    markup = REWARD_MENUS.get(category_id)
+    if markup is None:
+        outbox.answer_callback_query(call.id, "No rewards available in this category.")
         return
     
-    markup = InlineKeyboardMarkup()
-    for reward_name, reward_info in category_rewards.items():
-        markup.add(InlineKeyboardButton(f"{reward_name} ({reward_info['points']} pts)", callback_data=f"redeem:{reward_name}"))
-    
-    markup.add(InlineKeyboardButton("⬅️ Back to Categories", callback_data="back_to_categories"))
-    
     bot.edit_message_text(
         f"🎁 {category_info['name']}\n{category_info['description']}\n\nYou have {points} points. Choose a reward:",
         chat_id,
         call.message.message_id,
         reply_markup=markup
     )
-    bot.answer_callback_query(call.id)
+    outbox.answer_callback_query(call.id)
 
-@bot.callback_query_handler(func=lambda call: call.data == "back_to_categories")
+@router.callback("back_to_categories")
 def back_to_categories_handler(call):
     chat_id = call.message.chat.id
     user = get_user_data(chat_id)
     points = user.get('Points', 0)
     
-    markup = InlineKeyboardMarkup()
-    for category_id, category_info in REWARD_CATEGORIES.items():
-        markup.add(InlineKeyboardButton(category_info["name"], callback_data=f"category:{category_id}"))
-    
     bot.edit_message_text(
         f"🎁 You have {points} points. Choose a reward category:",
         chat_id,
         call.message.message_id,
-        reply_markup=markup
+        reply_markup=REWARD_CATEGORY_MENU
     )
-    bot.answer_callback_query(call.id)
+    outbox.answer_callback_query(call.id)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("redeem:"))
+@router.callback_prefix("redeem:")
 def redeem_callback_handler(call):
     chat_id = call.message.chat.id
     label = call.data.split("redeem:")[1]
     reward = REDEEM_OPTIONS.get(label)
     user = get_user_data(chat_id)
     if not reward or not user:
-        bot.answer_callback_query(call.id, "Invalid reward or user.")
+        outbox.answer_callback_query(call.id, "Invalid reward or user.")
         return
     if user['Points'] < reward['points']:
-        bot.answer_callback_query(call.id, "Not enough points.")
+        outbox.answer_callback_query(call.id, "Not enough points.")
         return
     tokens_to_add = reward.get('amount', 0)
-    update_user_tokens_points(chat_id, user['Tokens'] + tokens_to_add, user['Points'] - reward['points'])
-    bot.send_message(chat_id, f"🎉 You redeemed: {reward['reward']}!\nOur team will contact you for delivery if applicable.")
-    bot.answer_callback_query(call.id)
+    # Refuse the debit if a concurrent redemption already spent the points
+    if not token_ledger.record(chat_id, tokens=tokens_to_add, points=-reward['points'], reason="redeem", reference=label, allow_overdraft=False):
+        outbox.answer_callback_query(call.id, "Not enough points.")
+        return
+    outbox.send_message(chat_id, f"🎉 You redeemed: {reward['reward']}!\nOur team will contact you for delivery if applicable.")
+    outbox.answer_callback_query(call.id)
 
 # --- Daily Reward Handler ---
-@bot.message_handler(func=lambda message: message.text == "🎁 Daily Reward")
+@router.text("🎁 Daily Reward")
 def daily_reward_handler(message):
     chat_id = message.chat.id
     user = get_user_data(chat_id)
     if not user:
-        bot.send_message(chat_id, "Please /start first.")
+        outbox.send_message(chat_id, "Please /start first.")
         return
-    rewarded, new_tokens = check_and_give_daily_reward(chat_id)
+    with user_lock(chat_id):
+        rewarded, new_tokens = check_and_give_daily_reward(chat_id)
+        if rewarded:
+            token_ledger.log(chat_id, tokens=1, reason="daily_reward")
     if rewarded:
-        bot.send_message(chat_id, f"🎉 You claimed your daily reward! +1 token\n💰 Total tokens: {new_tokens}")
+        outbox.send_message(chat_id, f"🎉 You claimed your daily reward! +1 token\n💰 Total tokens: {new_tokens}")
     else:
-        bot.send_message(chat_id, "⏰ You've already claimed your daily reward today. Come back tomorrow!")
-    bot.send_message(chat_id, "Back to main menu:", reply_markup=create_main_menu(chat_id))
+        outbox.send_message(chat_id, "⏰ You've already claimed your daily reward today. Come back tomorrow!")
+    outbox.send_message(chat_id, "Back to main menu:", reply_markup=create_main_menu(chat_id))
 
 # --- Stats Handler ---
-@bot.message_handler(func=lambda message: message.text == "📊 My Stats")
+@router.text("📊 My Stats")
 def stats_handler(message):
     chat_id = message.chat.id
     user = get_user_data(chat_id)
     if not user:
-        bot.send_message(chat_id, "Please /start first.")
+        outbox.send_message(chat_id, "Please /start first.")
         return
     quiz_manager.init_player_progress(chat_id)
     progress = quiz_manager.player_progress[chat_id]
@@ -636,10 +620,10 @@ def stats_handler(message):
 ⏩️ <b>Skips Used:</b> {progress['skips_used']}
 ⏰ <b>Games Paused:</b> {progress['games_paused']}
     """
-    bot.send_message(chat_id, stats_message, reply_markup=create_main_menu(chat_id))
+    outbox.send_message(chat_id, stats_message, reply_markup=create_main_menu(chat_id))
 
 # --- Progress Handler ---
-@bot.message_handler(func=lambda message: message.text == "📈 Progress")
+@router.text("📈 Progress")
 def progress_handler(message):
     chat_id = message.chat.id
     quiz_manager.init_player_progress(chat_id)
@@ -655,15 +639,15 @@ def progress_handler(message):
 ⏩️ <b>Skips Used:</b> {progress['skips_used']}
 ⏰ <b>Games Paused:</b> {progress['games_paused']}
     """
-    bot.send_message(chat_id, progress_message, reply_markup=create_main_menu(chat_id))
+    outbox.send_message(chat_id, progress_message, reply_markup=create_main_menu(chat_id))
 
 # --- Referral Handler ---
-@bot.message_handler(func=lambda message: message.text == "👥 Referral")
+@router.text("👥 Referral")
 def referral_handler(message):
     chat_id = message.chat.id
     user = get_user_data(chat_id)
     if not user:
-        bot.send_message(chat_id, "Please /start first.")
+        outbox.send_message(chat_id, "Please /start first.")
         return
     referral_code = user.get("referral_code", f"REF{str(chat_id)[-6:]}")
     referral_message = f"""
@@ -672,10 +656,10 @@ def referral_handler(message):
 🔗 Share this link: <code>https://t.me/LearnEarnAfricaBot?start={referral_code}</code>
 👥 Total Referrals: <b>{int(user.get('ReferralEarnings', 0))}</b>
     """
-    bot.send_message(chat_id, referral_message, reply_markup=create_main_menu(chat_id))
+    outbox.send_message(chat_id, referral_message, reply_markup=create_main_menu(chat_id))
 
 # --- Leaderboard Handler ---
-@bot.message_handler(func=lambda message: message.text == "🏆 Leaderboard")
+@router.text("🏆 Leaderboard")
 def leaderboard_handler(message):
     chat_id = message.chat.id
     sheet_manager = get_sheet_manager()
@@ -684,10 +668,10 @@ def leaderboard_handler(message):
     leaderboard_message = "🏆 <b>Top 10 Leaderboard</b>\n\n"
     for i, user in enumerate(sorted_users, 1):
         leaderboard_message += f"{i}. {user['Name']} (@{user.get('Username', 'None')}) - {user.get('Points', 0)} points\n"
-    bot.send_message(chat_id, leaderboard_message, reply_markup=create_main_menu(chat_id))
+    outbox.send_message(chat_id, leaderboard_message, reply_markup=create_main_menu(chat_id))
 
 # --- Help Handler ---
-@bot.message_handler(func=lambda message: message.text == "ℹ️ Help")
+@router.text("ℹ️ Help")
 def help_handler(message):
     chat_id = message.chat.id
     help_message = f"""
@@ -726,19 +710,19 @@ def help_handler(message):
 
 {ABOUT_US}
     """
-    bot.send_message(chat_id, help_message, reply_markup=create_main_menu(chat_id))
+    outbox.send_message(chat_id, help_message, reply_markup=create_main_menu(chat_id))
 
 # --- Admin Menu Handler ---
-@bot.message_handler(func=lambda message: message.text == "🛮️ Admin Menu")
+@router.text("🛮️ Admin Menu")
 def admin_menu_handler(message):
     chat_id = message.chat.id
     if not is_admin(chat_id):
-        bot.send_message(chat_id, "Unauthorized.")
+        outbox.send_message(chat_id, "Unauthorized.")
         return
-    bot.send_message(chat_id, "🛠️ Admin Menu", reply_markup=create_admin_menu())
+    outbox.send_message(chat_id, "🛠️ Admin Menu", reply_markup=create_admin_menu())
 
 # --- Admin Dashboard Handler ---
-@bot.message_handler(func=lambda message: message.text == "📊 Admin Dashboard" and is_admin(message.chat.id))
+@router.text("📊 Admin Dashboard", guard=is_admin)
 def admin_dashboard_handler(message):
     chat_id = message.chat.id
     sheet_manager = get_sheet_manager()
@@ -748,6 +732,7 @@ def admin_dashboard_handler(message):
     total_points = sum(float(user.get('Points', 0)) for user in users)
     total_referrals = sum(int(user.get('ReferralEarnings', 0)) for user in users)
     pending_transactions = sheet_manager.get_pending_transactions()
+    quota = quota_scheduler.budget()
     dashboard_message = f"""
 📊 <b>Admin Dashboard</b>
 
@@ -756,58 +741,57 @@ def admin_dashboard_handler(message):
 📌 Total Points Earned: {total_points}
 👥 Total Referrals: {total_referrals}
 📃 Pending Token Purchases: {len(pending_transactions)}
+📶 Sheets Quota: {quota['read']['available']} reads / {quota['write']['available']} writes available
     """
-    bot.send_message(chat_id, dashboard_message, reply_markup=create_admin_menu())
+    outbox.send_message(chat_id, dashboard_message, reply_markup=create_admin_menu())
 
 # --- Run Daily Lottery Handler ---
-@bot.message_handler(func=lambda message: message.text == "🏹‍⚠️ Run Daily Lottery" and is_admin(message.chat.id))
+@router.text("🏹‍⚠️ Run Daily Lottery", guard=is_admin)
 def daily_lottery_handler(message):
     chat_id = message.chat.id
     sheet_manager = get_sheet_manager()
     users = sheet_manager.get_all_users()
     eligible_users = [user for user in users if float(user.get('Tokens', 0)) > 0]
     if not eligible_users:
-        bot.send_message(chat_id, "No eligible users for the lottery.", reply_markup=create_admin_menu())
+        outbox.send_message(chat_id, "No eligible users for the lottery.", reply_markup=create_admin_menu())
         return
     winner = random.choice(eligible_users)
     winner_id = winner['UserID']
-    current_tokens = float(winner.get('Tokens', 0))
-    sheet_manager.update_user_tokens_points(winner_id, current_tokens + 5, winner.get('Points', 0))
+    token_ledger.record(winner_id, tokens=5, reason="daily_lottery")
     log_token_purchase(winner_id, f"LOTTERY_{int(time.time())}", 5, "Daily_Lottery")
-    bot.send_message(winner_id, "🎉 Congratulations! You won 5 tokens in the daily lottery!")
-    bot.send_message(chat_id, f"🏹‍⚠️ Daily Lottery Winner: {winner['Name']} (@{winner.get('Username', 'None')}) - 5 tokens awarded.", reply_markup=create_admin_menu())
+    outbox.send_message(winner_id, "🎉 Congratulations! You won 5 tokens in the daily lottery!")
+    outbox.send_message(chat_id, f"🏹‍⚠️ Daily Lottery Winner: {winner['Name']} (@{winner.get('Username', 'None')}) - 5 tokens awarded.", reply_markup=create_admin_menu())
 
 # --- Run Weekly Raffle Handler ---
-@bot.message_handler(func=lambda message: message.text == "㊗️ Run Weekly Raffle" and is_admin(message.chat.id))
+@router.text("㊗️ Run Weekly Raffle", guard=is_admin)
 def weekly_raffle_handler(message):
     chat_id = message.chat.id
     sheet_manager = get_sheet_manager()
     users = sheet_manager.get_all_users()
     eligible_users = [user for user in users if float(user.get('Points', 0)) >= 100]
     if not eligible_users:
-        bot.send_message(chat_id, "No eligible users for the raffle.", reply_markup=create_admin_menu())
+        outbox.send_message(chat_id, "No eligible users for the raffle.", reply_markup=create_admin_menu())
         return
     winner = random.choice(eligible_users)
     winner_id = winner['UserID']
-    current_tokens = float(winner.get('Tokens', 0))
-    sheet_manager.update_user_tokens_points(winner_id, current_tokens + 10, winner.get('Points', 0))
+    token_ledger.record(winner_id, tokens=10, reason="weekly_raffle")
     log_token_purchase(winner_id, f"RAFFLE_{int(time.time())}", 10, "Weekly_Raffle")
-    bot.send_message(winner_id, "㊗️ Congratulations! You won 10 tokens in the weekly raffle!")
-    bot.send_message(chat_id, f"㊗️ Weekly Raffle Winner: {winner['Name']} (@{winner.get('Username', 'None')}) - 10 tokens awarded.", reply_markup=create_admin_menu())
+    outbox.send_message(winner_id, "㊗️ Congratulations! You won 10 tokens in the weekly raffle!")
+    outbox.send_message(chat_id, f"㊗️ Weekly Raffle Winner: {winner['Name']} (@{winner.get('Username', 'None')}) - 10 tokens awarded.", reply_markup=create_admin_menu())
 
 # --- View Pending Tokens Handler ---
-@bot.message_handler(func=lambda message: message.text == "�참 View Pending Tokens" and is_admin(message.chat.id))
+@router.text("�참 View Pending Tokens", guard=is_admin)
 def view_pending_tokens_handler(message):
     chat_id = message.chat.id
     sheet_manager = get_sheet_manager()
     pending_transactions = sheet_manager.get_pending_transactions()
     if not pending_transactions:
-        bot.send_message(chat_id, "No pending token purchases.", reply_markup=create_admin_menu())
+        outbox.send_message(chat_id, "No pending token purchases.", reply_markup=create_admin_menu())
         return
     pending_message = "�참 <b>Pending Token Purchases</b>\n\n"
+    users = sheet_manager.get_users_data({str(tx.get('user_id')) for tx in pending_transactions})
     for tx in pending_transactions:
-        user_id = tx.get('user_id')
-        user = sheet_manager.get_user_data(user_id)
+        user = users.get(str(tx.get('user_id')), {'Name': f"Unknown ({tx.get('user_id')})"})
         pending_message += f"""
 👤 User: {user['Name']} (@{user.get('Username', 'None')})
 📦 Amount: {tx['amount']} tokens
@@ -815,77 +799,104 @@ def view_pending_tokens_handler(message):
 💰 Payment Method: {tx.get('payment_method', 'N/A')}
 ⏰ Time: {tx.get('timestamp')}
         """
-    bot.send_message(chat_id, pending_message, reply_markup=create_admin_menu())
+    outbox.send_message(chat_id, pending_message, reply_markup=create_admin_menu())
 
 # --- Approve Token Purchase Handler ---
-@bot.message_handler(func=lambda message: message.text == "✅ Approve Token Purchase" and is_admin(message.chat.id))
+@router.text("✅ Approve Token Purchase", guard=is_admin)
 def approve_token_purchase_handler(message):
     chat_id = message.chat.id
-    bot.send_message(chat_id, "Please enter the Transaction ID to approve:")
+    outbox.send_message(chat_id, "Please enter the Transaction ID to approve:")
     bot.register_next_step_handler(message, process_approve_token_purchase)
 
 def process_approve_token_purchase(message):
     chat_id = message.chat.id
     if not is_admin(chat_id):
-        bot.send_message(chat_id, "Unauthorized.")
+        outbox.send_message(chat_id, "Unauthorized.")
         return
     transaction_id = message.text.strip()
-    sheet_manager = get_sheet_manager()
-    pending_transactions = sheet_manager.get_pending_transactions()
-    for tx in pending_transactions:
-        if tx['transaction_id'] == transaction_id:
-            user_id = int(tx['user_id'])
-            amount = float(tx['amount'])
-            user = sheet_manager.get_user_data(user_id)
-            if user:
-                current_tokens = float(user.get('Tokens', 0))
-                sheet_manager.update_user_tokens_points(user_id, current_tokens + amount, user.get('Points', 0))
-                new_transaction_id = f"APPROVED_{transaction_id}"
-                update_transaction_status(transaction_id, new_transaction_id)
-                bot.send_message(user_id, f"✅ Your purchase of {amount} tokens has been approved! Total tokens: {current_tokens + amount}")
-                bot.send_message(chat_id, f"✅ Approved {amount} tokens for user {user['Name']} (@{user.get('Username', 'None')}).")
-                return
-    bot.send_message(chat_id, "❌ Transaction ID not found or already processed.", reply_markup=create_admin_menu())
+    # Looks in the pending index, then the monthly archives and the live TokenLog
+    tx = find_transaction(transaction_id)
+    if not tx or not is_pending_transaction(tx['transaction_id']):
+        report_settled_transaction(chat_id, transaction_id)
+        return
+    user_id = int(tx['user_id'])
+    amount = float(tx['amount'])
+    user = get_user_data(user_id)
+    if not user:
+        outbox.send_message(chat_id, f"❌ User {user_id} of transaction {transaction_id} not found.", reply_markup=create_admin_menu())
+        return
+    with user_lock(user_id):
+        # Another admin may have approved it while we waited for the lock
+        tx = find_transaction(transaction_id)
+        still_pending = bool(tx) and is_pending_transaction(tx['transaction_id'])
+        balances = None
+        if still_pending:
+            balances = token_ledger.record(user_id, tokens=amount, reason="token_purchase", reference=transaction_id)
+            if balances:
+                update_transaction_status(transaction_id, f"APPROVED_{transaction_id}")
+    if not still_pending:
+        report_settled_transaction(chat_id, transaction_id)
+        return
+    if not balances:
+        outbox.send_message(chat_id, f"❌ Approval of {transaction_id} failed: could not credit user {user_id}. It is still pending.", reply_markup=create_admin_menu())
+        return
+    new_tokens, _ = balances
+    outbox.send_message(user_id, f"✅ Your purchase of {amount} tokens has been approved! Total tokens: {new_tokens}")
+    outbox.send_message(chat_id, f"✅ Approved {amount} tokens for user {user['Name']} (@{user.get('Username', 'None')}).")
+
+def report_settled_transaction(chat_id, transaction_id):
+    """Tell an admin why a transaction can't be approved: already approved (live or archived) or unknown"""
+    approved = find_transaction(f"APPROVED_{transaction_id}")
+    if approved:
+        where = approved.get('partition', 'TokenLog')
+        outbox.send_message(chat_id, f"ℹ️ Transaction {transaction_id} was already approved ({where}, {approved.get('timestamp', '')}).", reply_markup=create_admin_menu())
+    else:
+        outbox.send_message(chat_id, "❌ Transaction ID not found or already processed.", reply_markup=create_admin_menu())
 
 # --- Broadcast Message Handler ---
-@bot.message_handler(func=lambda message: message.text == "💌 Broadcast Message" and is_admin(message.chat.id))
+@router.text("💌 Broadcast Message", guard=is_admin)
 def broadcast_handler(message):
     chat_id = message.chat.id
-    bot.send_message(chat_id, "Please enter the message to broadcast to all users:")
+    outbox.send_message(chat_id, "Please enter the message to broadcast to all users:")
     bot.register_next_step_handler(message, process_broadcast_message)
 
 def process_broadcast_message(message):
     chat_id = message.chat.id
     if not is_admin(chat_id):
-        bot.send_message(chat_id, "Unauthorized.")
+        outbox.send_message(chat_id, "Unauthorized.")
         return
     broadcast_text = message.text.strip()
-    sheet_manager = get_sheet_manager()
-    users = sheet_manager.get_all_users()
-    for user in users:
-        user_id = user['UserID']
-        try:
-            bot.send_message(user_id, f"💌 <b>Announcement</b>\n\n{broadcast_text}")
-        except Exception as e:
-            logger.error(f"Failed to send broadcast to {user_id}: {e}")
-    bot.send_message(chat_id, f"💌 Broadcast sent to {len(users)} users.", reply_markup=create_admin_menu())
+    # Sent in the background; the engine posts and updates a progress message for the admin
+    job = broadcasts.start(chat_id, f"💌 <b>Announcement</b>\n\n{broadcast_text}")
+    outbox.send_message(chat_id, f"💌 Broadcast {job['id']} started.", reply_markup=create_admin_menu())
+
+@router.callback_prefix("broadcast_cancel:")
+def broadcast_cancel_handler(call):
+    if not is_admin(call.message.chat.id):
+        outbox.answer_callback_query(call.id, "Unauthorized.")
+        return
+    job_id = call.data.split(":", 1)[1]
+    if broadcasts.cancel(job_id):
+        outbox.answer_callback_query(call.id, "Broadcast will stop after the current batch.")
+    else:
+        outbox.answer_callback_query(call.id, "Broadcast is not running.")
 
 # --- User Stats Handler ---
-@bot.message_handler(func=lambda message: message.text == "📈 User Stats" and is_admin(message.chat.id))
+@router.text("📈 User Stats", guard=is_admin)
 def user_stats_handler(message):
     chat_id = message.chat.id
-    bot.send_message(chat_id, "Please enter the User ID to view stats:")
+    outbox.send_message(chat_id, "Please enter the User ID to view stats:")
     bot.register_next_step_handler(message, process_user_stats)
 
 def process_user_stats(message):
     chat_id = message.chat.id
     if not is_admin(chat_id):
-        bot.send_message(chat_id, "Unauthorized.")
+        outbox.send_message(chat_id, "Unauthorized.")
         return
     user_id = message.text.strip()
     user = get_user_data(user_id)
     if not user:
-        bot.send_message(chat_id, "User not found.", reply_markup=create_admin_menu())
+        outbox.send_message(chat_id, "User not found.", reply_markup=create_admin_menu())
         return
     quiz_manager.init_player_progress(user_id)
     progress = quiz_manager.player_progress[user_id]
@@ -904,13 +915,13 @@ def process_user_stats(message):
 ⏩️ <b>Skips Used:</b> {progress['skips_used']}
 ⏰ <b>Games Paused:</b> {progress['games_paused']}
     """
-    bot.send_message(chat_id, stats_message, reply_markup=create_admin_menu())
+    outbox.send_message(chat_id, stats_message, reply_markup=create_admin_menu())
 
 # --- Back to User Menu ---
-@bot.message_handler(func=lambda message: message.text == "⬅️ Back to User Menu" and is_admin(message.chat.id))
+@router.text("⬅️ Back to User Menu", guard=is_admin)
 def back_to_user_menu_handler(message):
     chat_id = message.chat.id
-    bot.send_message(chat_id, "Returning to user menu...", reply_markup=create_main_menu(chat_id))
+    outbox.send_message(chat_id, "Returning to user menu...", reply_markup=create_main_menu(chat_id))
 
 # --- Current Affairs Handler ---
 def fetch_current_affairs():
@@ -927,54 +938,57 @@ def fetch_current_affairs():
         logger.error(f"Current affairs fetch error: {e}")
         return "Error fetching news."
 
-@bot.message_handler(func=lambda message: message.text == "🌍 Current Affairs")
+@router.text("🌍 Current Affairs")
 def current_affairs_handler(message):
     chat_id = message.chat.id
-    bot.send_message(chat_id, "Fetching latest African and global business news...")
+    outbox.send_message(chat_id, "Fetching latest African and global business news...")
     news = fetch_current_affairs()
-    bot.send_message(chat_id, news, parse_mode="HTML", disable_web_page_preview=True)
+    outbox.send_message(chat_id, news, parse_mode="HTML", disable_web_page_preview=True)
 
 # --- Country Bio Handler ---
-@bot.callback_query_handler(func=lambda call: call.data.startswith("countrybio:"))
+@router.callback_prefix("countrybio:")
 def country_bio_handler(call):
     chat_id = call.message.chat.id
     country_name = call.data.split("countrybio:")[1]
     country = next((c for c in quiz_manager.AFRICAN_COUNTRIES if c["name"] == country_name), None)
     if not country:
-        bot.answer_callback_query(call.id, "Country not found.")
+        outbox.answer_callback_query(call.id, "Country not found.")
         return
     bio = country.get('bio', 'No bio available.')
     website = country.get('website', '#')
     text = f"🌍 <b>{country['name']}</b>\n\n{bio}\n\n🔗 <a href='{website}'>Official Website</a>"
-    bot.send_message(chat_id, text, parse_mode="HTML", disable_web_page_preview=False)
-    bot.answer_callback_query(call.id)
+    outbox.send_message(chat_id, text, parse_mode="HTML", disable_web_page_preview=False)
+    outbox.answer_callback_query(call.id)
 
 # --- Pagination for Country List ---
 COUNTRIES_PER_PAGE = 8  # You can adjust this number
 
-def get_country_page_markup(page=0):
+def _country_page_markup(page):
     start = page * COUNTRIES_PER_PAGE
     end = start + COUNTRIES_PER_PAGE
-    markup = InlineKeyboardMarkup()
-    for country in quiz_manager.AFRICAN_COUNTRIES[start:end]:
-        markup.add(InlineKeyboardButton(country["name"], callback_data=f"countrybio:{country['name']}"))
+    rows = [[(country["name"], f"countrybio:{country['name']}")] for country in quiz_manager.AFRICAN_COUNTRIES[start:end]]
     nav_buttons = []
     if page > 0:
-        nav_buttons.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"countrylist:prev:{page-1}"))
+        nav_buttons.append(("⬅️ Prev", f"countrylist:prev:{page-1}"))
     if end < len(quiz_manager.AFRICAN_COUNTRIES):
-        nav_buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f"countrylist:next:{page+1}"))
+        nav_buttons.append(("Next ➡️", f"countrylist:next:{page+1}"))
     if nav_buttons:
-        markup.add(*nav_buttons)
-    return markup
+        rows.append(nav_buttons)
+    return inline_keyboard(rows)
+
+COUNTRY_PAGE_MENUS = [_country_page_markup(page) for page in range(max(1, -(-len(quiz_manager.AFRICAN_COUNTRIES) // COUNTRIES_PER_PAGE)))]
+
+def get_country_page_markup(page=0):
+    return COUNTRY_PAGE_MENUS[page] if 0 <= page < len(COUNTRY_PAGE_MENUS) else _country_page_markup(page)
 
-@bot.message_handler(func=lambda message: message.text == "🌍 African Countries")
+@router.text("🌍 African Countries")
 def list_african_countries_handler(message):
     chat_id = message.chat.id
     country_list_page[chat_id] = 0
     markup = get_country_page_markup(0)
-    bot.send_message(chat_id, "🌍 <b>Select an African country to learn more:</b>", reply_markup=markup, parse_mode="HTML")
+    outbox.send_message(chat_id, "🌍 <b>Select an African country to learn more:</b>", reply_markup=markup, parse_mode="HTML")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("countrylist:"))
+@router.callback_prefix("countrylist:")
 def countrylist_pagination_handler(call):
     chat_id = call.message.chat.id
     _, direction, page = call.data.split(":")
@@ -982,51 +996,93 @@ def countrylist_pagination_handler(call):
     country_list_page[chat_id] = page
     markup = get_country_page_markup(page)
     bot.edit_message_reply_markup(chat_id, call.message.message_id, reply_markup=markup)
-    bot.answer_callback_query(call.id)
+    outbox.answer_callback_query(call.id)
 
 # --- Menu Creation Functions ---
-def create_main_menu(chat_id):
-    markup = ReplyKeyboardMarkup(resize_keyboard=True)
-    user = get_user_data(chat_id)
-    if not user:
-        return markup
-    
-    # Basic menu for all users
-    markup.add(KeyboardButton("🎲 Start Quiz"), KeyboardButton("🎁 Daily Reward"))
-    markup.add(KeyboardButton("💰 Buy Tokens"), KeyboardButton("🎁 Redeem Rewards"))
-    markup.add(KeyboardButton("📊 My Stats"), KeyboardButton("📈 Progress"))
-    markup.add(KeyboardButton("🏆 Leaderboard"), KeyboardButton("👥 Referral"))
-    markup.add(KeyboardButton("🌍 African Countries"), KeyboardButton("🛒 Marketplace"))
-    markup.add(KeyboardButton("🗑️ Community Cleanup"), KeyboardButton("ℹ️ Help"), KeyboardButton("💬 Send Feedback")
+# Static menus are serialised once; replies attach the JSON string as is
+MAIN_MENU_ROWS = [
+    ["🎲 Start Quiz", "🎁 Daily Reward"],
+    ["💰 Buy Tokens", "🎁 Redeem Rewards"],
+    ["📊 My Stats", "📈 Progress"],
+    ["🏆 Leaderboard", "👥 Referral"],
+    ["🌍 African Countries", "🛒 Marketplace"],
+    ["🗑️ Community Cleanup", "ℹ️ Help", "💬 Send Feedback"]
+]
+# Unregistered users get an empty keyboard until /start registers them
+NO_MENU = reply_keyboard([])
+USER_MAIN_MENU = reply_keyboard(MAIN_MENU_ROWS)
+ADMIN_MAIN_MENU = reply_keyboard(MAIN_MENU_ROWS + [["🛮️ Admin Menu"]])
+ADMIN_MENU = reply_keyboard([
+    ["📊 Admin Dashboard", "🏹‍⚠️ Run Daily Lottery"],
+    ["㊗️ Run Weekly Raffle", "�참 View Pending Tokens"],
+    ["✅ Approve Token Purchase", "💌 Broadcast Message"],
+    ["📈 User Stats", "⬅️ Back to User Menu"]
+])
+TOKEN_PACKAGE_MENU = inline_keyboard(
+    [[(f"{label} (₢{data['price_cedis']} / ${data['price_usd']})", f"buy:{label}")] for label, data in TOKEN_PRICING.items()]
+    + [[("Custom Amount", "buy:custom")]]
+)
+NOTIFY_ADMIN_MENU = inline_keyboard([[("📱 Notify Admin", "notify_admin_purchase")]])
+REWARD_CATEGORY_MENU = inline_keyboard([[(category_info["name"], f"category:{category_id}")] for category_id, category_info in REWARD_CATEGORIES.items()])
+# category_id -> menu of its rewards; categories without rewards are left out
+REWARD_MENUS = {
+    category_id: inline_keyboard(
+        [[(f"{reward_name} ({reward_info['points']} pts)", f"redeem:{reward_name}")] for reward_name, reward_info in REDEEM_OPTIONS.items() if reward_info.get('category') == category_id]
+        + [[("⬅️ Back to Categories", "back_to_categories")]]
     )
-    
-    # Add admin menu for admins
-    if is_admin(chat_id):
-        markup.add(KeyboardButton("🛮️ Admin Menu"))
-    
-    return markup
+    for category_id in REWARD_CATEGORIES
+    if any(reward_info.get('category') == category_id for reward_info in REDEEM_OPTIONS.values())
+}
+PAUSED_GAME_MENU = inline_keyboard([[("▶️ Resume Game", "resume_game"), ("🎲 New Game", "new_game")]])
+MARKETPLACE_MENU = inline_keyboard([[("🔔 Notify Me When Available", "notify_me_marketplace")]])
+
+def create_main_menu(chat_id):
+    # The user record is memoised for the update, so this lookup is usually free
+    if not get_user_data(chat_id):
+        return NO_MENU
+    return ADMIN_MAIN_MENU if is_admin(chat_id) else USER_MAIN_MENU
 
 def create_admin_menu():
-    markup = ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add(KeyboardButton("📊 Admin Dashboard"), KeyboardButton("🏹‍⚠️ Run Daily Lottery"))
-    markup.add(KeyboardButton("㊗️ Run Weekly Raffle"), KeyboardButton("�참 View Pending Tokens"))
-    markup.add(KeyboardButton("✅ Approve Token Purchase"), KeyboardButton("💌 Broadcast Message"))
-    markup.add(KeyboardButton("📈 User Stats"), KeyboardButton("⬅️ Back to User Menu"))
-    return markup
+    return ADMIN_MENU
+
+def quiz_answer_markup(choices, with_return=True):
+    """Answer buttons for a question, serialised directly without markup objects"""
+    rows = [[(choice, f"answer:{choice}")] for choice in choices]
+    rows.append([("⏩️ Skip", "skip_question"), ("⏰ Pause", "pause_game")])
+    if with_return:
+        rows.append([("🏠 Return to Main Menu", "return_main")])
+    return inline_keyboard(rows)
 
 # --- Bot Webhook ---
+def process_update(update):
+    # Users read while handling the update are loaded once and shared by every helper
+    with request_scope(chat_key(update)):
+        bot.process_new_updates([update])
+
+update_dispatcher = UpdateDispatcher(
+    process_update,
+    workers=int(os.getenv("WEBHOOK_WORKERS", "8")),
+    max_pending=int(os.getenv("WEBHOOK_MAX_PENDING", "1000"))
+)
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
     if request.headers.get('content-type') == 'application/json':
         json_string = request.get_data().decode('utf-8')
         update = types.Update.de_json(json_string)
-        bot.process_new_updates([update])
+        if not update_dispatcher.submit(update):
+            # Backlog full: Telegram redelivers on non-2xx, by which time workers have caught up
+            abort(503)
         return ''
     else:
         abort(403)
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return dict(startup_report(), updates=update_dispatcher.stats(), outbox=outbox.stats(), broadcasts=broadcasts.stats(), media=media.stats())
+
 # --- Marketplace Handlers ---
-@bot.message_handler(func=lambda message: message.text == "🛒 Marketplace")
+@router.text("🛒 Marketplace")
 def marketplace_menu_handler(message):
     logger.info("Marketplace handler called")
     chat_id = message.chat.id
@@ -1038,35 +1094,46 @@ def marketplace_menu_handler(message):
         "• <b>Support community projects:</b> Donate your points to support educational and environmental initiatives.\n\n"
         "Stay tuned for updates! We're working hard to bring you an exciting marketplace experience."
     )
-    markup = InlineKeyboardMarkup()
-    markup.add(InlineKeyboardButton("🔔 Notify Me When Available", callback_data="notify_me_marketplace"))
-    bot.send_message(chat_id, marketplace_message, reply_markup=markup, parse_mode='HTML')
+    outbox.send_message(chat_id, marketplace_message, reply_markup=MARKETPLACE_MENU, parse_mode='HTML')
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "notify_me_marketplace")
+@router.callback("notify_me_marketplace")
 def notify_me_marketplace_handler(call):
     chat_id = call.message.chat.id
     user = get_user_data(chat_id)
-    bot.answer_callback_query(call.id, "✅ You will be notified when the marketplace is live!")
-    bot.send_message(chat_id, "Thanks for your interest! We'll let you know as soon as the Marketplace is open.")
+    outbox.answer_callback_query(call.id, "✅ You will be notified when the marketplace is live!")
+    outbox.send_message(chat_id, "Thanks for your interest! We'll let you know as soon as the Marketplace is open.")
     
     # Notify admin
     if user:
         admin_message = f"\u2709\ufe0f User @{user.get('Username', user.get('Name', chat_id))} is interested in the Marketplace feature."
         for admin_id in ADMIN_CHAT_IDS:
             try:
-                bot.send_message(admin_id, admin_message)
+                outbox.send_message(admin_id, admin_message)
             except Exception as e:
                 logger.error(f"Failed to send marketplace interest notification to admin {admin_id}: {e}")
 
-@bot.callback_query_handler(func=lambda call: call.data == "notify_admin_purchase")
+@router.callback("notify_admin_purchase")
 def notify_admin_purchase_handler(call):
     chat_id = call.message.chat.id
     user = get_user_data(chat_id)
     for admin_id in ADMIN_CHAT_IDS:
-        bot.send_message(admin_id, f"User @{user.get('Username', chat_id)} has requested admin attention for a token purchase.")
-    bot.send_message(chat_id, "✅ Admin has been notified. Please wait for approval.")
+        outbox.send_message(admin_id, f"User @{user.get('Username', chat_id)} has requested admin attention for a token purchase.")
+    outbox.send_message(chat_id, "✅ Admin has been notified. Please wait for approval.")
+
+register_cleanup_handlers(bot, router, outbox)
 
 if __name__ == "__main__":
-    register_cleanup_handlers(bot)
-    app.run(host="0.0.0.0", port=int(os.environ.get('PORT', 8080)))
+    # Broadcasts interrupted by the last shutdown continue from their checkpoint
+    broadcasts.resume()
+    port = int(os.environ.get('PORT', 8080))
+    if os.getenv("RUNTIME", "threads").lower() == "async":
+        # aiohttp server and asyncio dispatch; handlers and gspread run on a bounded executor
+        import async_runtime
+        from exchange_rate_service import rate_updater
+        start_warm_up(rate_updater=False)
+        async_runtime.run(bot, port, health=lambda: dict(startup_report(), outbox=outbox.stats()), background=[rate_updater])
+    else:
+        # Sheets, exchange rate and translator load in the background so the port binds straight away
+        start_warm_up()
+        app.run(host="0.0.0.0", port=port)
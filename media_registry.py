@@ -0,0 +1,181 @@
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+def is_stale_file_id(error):
+    """True if Telegram rejected a file_id (expired, or issued to another bot)"""
+    if getattr(error, 'error_code', None) != 400:
+        return False
+    description = str(getattr(error, 'description', None) or error).lower()
+    return 'file identifier' in description or 'file_id' in description or 'remote file' in description
+
+class MediaRegistry:
+    """Static media uploaded once and sent by Telegram file_id afterwards
+
+    Assets are registered by name with a local path. The first send uploads the
+    file and stores the returned file_id, together with the file's size and
+    mtime, in a JSON file; later sends (across restarts too) pass only the ID.
+    If Telegram rejects a stored ID, or the file on disk changed, the asset is
+    uploaded again. Uploads go through the outbound queue like any other send;
+    sends of an asset made while its upload is in flight are held and go out by
+    file_id once it completes, so each asset is uploaded once.
+    """
+
+    def __init__(self, bot, path, outbox=None):
+        self.bot = bot
+        self.path = path
+        # Sends and uploads go through the outbound queue when one is given
+        self.outbox = outbox
+        self._assets = {}    # name -> local file path
+        self._entries = None  # name -> {file_id, size, mtime}
+        self._checked = set()
+        self._uploading = {}  # name -> [(chat_id, kwargs)] waiting for the upload in flight
+        self._lock = threading.Lock()
+        self.uploads = 0
+
+    def register(self, name, file_path):
+        self._assets[name] = file_path
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except Exception as e:
+                logger.error(f"Error reading media registry {self.path}, starting empty: {e}")
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _fingerprint(self, name):
+        stat = os.stat(self._assets[name])
+        return stat.st_size, int(stat.st_mtime)
+
+    def file_id(self, name):
+        """Stored file_id of an asset, or None if it needs uploading"""
+        with self._lock:
+            entry = self._load().get(name)
+            if entry is None:
+                return None
+            if name not in self._checked:
+                # Once per process: a changed file on disk invalidates its old upload
+                try:
+                    if self._fingerprint(name) != (entry.get('size'), entry.get('mtime')):
+                        logger.info(f"Media {name} changed on disk, will upload again")
+                        del self._entries[name]
+                        return None
+                except OSError:
+                    pass  # Keep sending the uploaded copy if the local file went away
+                self._checked.add(name)
+            return entry['file_id']
+
+    def _forget(self, name, file_id):
+        with self._lock:
+            entry = self._load().get(name)
+            if entry and entry['file_id'] == file_id:
+                del self._entries[name]
+                self._save()
+
+    def _upload(self, name, chat_id, kwargs):
+        """Send the file itself; its file_id is stored when Telegram returns it"""
+        with self._lock:
+            entry = self._load().get(name)
+            # Another send may have finished the upload since file_id() was checked
+            file_id = entry['file_id'] if entry and name in self._checked else None
+            waiting = self._uploading.get(name)
+            if file_id is None and waiting is not None:
+                waiting.append((chat_id, kwargs))
+                return
+            if file_id is None:
+                self._uploading[name] = []
+        if file_id:
+            self._send_by_id(name, file_id, chat_id, kwargs)
+            return
+        try:
+            size, mtime = self._fingerprint(name)
+            # Bytes rather than an open file, so a send retried after a 429 uploads it again
+            with open(self._assets[name], 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            logger.error(f"Error reading media {name}: {e}")
+            self._uploaded(name, None, None, None)
+            return
+
+        def store_file_id(result, error):
+            file_id = None
+            if error is None:
+                try:
+                    file_id = result.photo[-1].file_id
+                except Exception as e:
+                    logger.error(f"Error reading the file_id of uploaded media {name}: {e}")
+            self._uploaded(name, file_id, size, mtime)
+
+        if self.outbox is not None:
+            self.outbox.send('send_photo', chat_id, data, callback=store_file_id, **kwargs)
+            return
+        result = error = None
+        try:
+            result = self.bot.send_photo(chat_id, data, **kwargs)
+        except Exception as e:
+            logger.error(f"Error uploading media {name} to {chat_id}: {e}")
+            error = e
+        store_file_id(result, error)
+
+    def _uploaded(self, name, file_id, size, mtime):
+        """Record a finished upload and release the sends that waited for it"""
+        with self._lock:
+            waiting = self._uploading.pop(name, [])
+            if file_id:
+                self._load()[name] = {'file_id': file_id, 'size': size, 'mtime': mtime}
+                self._checked.add(name)
+                self._save()
+                self.uploads += 1
+        if file_id:
+            logger.info(f"Uploaded media {name}, sending by file_id from now on")
+        for chat_id, kwargs in waiting:
+            if file_id:
+                self._send_by_id(name, file_id, chat_id, kwargs)
+            else:
+                # The first of them tries the upload again, the rest wait for it
+                self._upload(name, chat_id, kwargs)
+
+    def _send_by_id(self, name, file_id, chat_id, kwargs):
+        def retry_if_stale(result, error):
+            if error is not None and is_stale_file_id(error):
+                logger.info(f"Telegram rejected the file_id of {name}, uploading again")
+                self._forget(name, file_id)
+                self._upload(name, chat_id, kwargs)
+
+        if self.outbox is not None:
+            self.outbox.send('send_photo', chat_id, file_id, callback=retry_if_stale, **kwargs)
+            return
+        try:
+            self.bot.send_photo(chat_id, file_id, **kwargs)
+        except Exception as e:
+            if not is_stale_file_id(e):
+                logger.error(f"Error sending media {name} to {chat_id}: {e}")
+            retry_if_stale(None, e)
+
+    def send_photo(self, chat_id, name, **kwargs):
+        """Send a registered image, by file_id when it has been uploaded before"""
+        if name not in self._assets:
+            raise KeyError(f"Unknown media asset {name!r}")
+        file_id = self.file_id(name)
+        if file_id:
+            self._send_by_id(name, file_id, chat_id, kwargs)
+        else:
+            self._upload(name, chat_id, kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {'assets': len(self._assets), 'cached': len(self._load()), 'uploads': self.uploads}
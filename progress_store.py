@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from sheet_manager import get_sheet_manager
+from storage_backend import QUIZ_PROGRESS_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Counters kept per player; used_questions (the question pool) is stored alongside them
+PROGRESS_COUNTERS = [field for field in QUIZ_PROGRESS_FIELDS if field not in ('user_id', 'used_questions', 'updated_at')]
+
+def new_record():
+    progress = {counter: 0 for counter in PROGRESS_COUNTERS}
+    progress['questions_until_bonus'] = 10
+    return {'progress': progress, 'used_questions': []}
+
+def _to_int(value, default=0):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return default
+
+class ProgressStore:
+    """Write-behind cache of quiz progress, loaded per user on first access
+
+    quiz_manager mutates the cached records in place and marks them dirty; dirty
+    records are saved to the storage backend in one batch every flush_interval
+    seconds, so answering a question never waits on a storage write.
+    """
+
+    def __init__(self, storage, flush_interval=5.0):
+        # A backend, or a zero-argument callable returning one so it can be created on first use
+        self._storage = storage
+        self.flush_interval = flush_interval
+        self._records = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="quiz-progress", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    @property
+    def storage(self):
+        return self._storage() if callable(self._storage) else self._storage
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _decode(self, row):
+        record = new_record()
+        for counter in PROGRESS_COUNTERS:
+            record['progress'][counter] = _to_int(row.get(counter), record['progress'][counter])
+        try:
+            record['used_questions'] = list(json.loads(row.get('used_questions') or '[]'))
+        except ValueError:
+            pass
+        return record
+
+    def _encode(self, user_id, record):
+        row = {'user_id': user_id, 'used_questions': json.dumps(record['used_questions']), 'updated_at': datetime.now(timezone.utc).isoformat()}
+        row.update({counter: record['progress'][counter] for counter in PROGRESS_COUNTERS})
+        return row
+
+    def get(self, user_id):
+        """The live {'progress', 'used_questions'} record of a user, shared by every caller"""
+        key = str(user_id)
+        with self._lock:
+            record = self._records.get(key)
+        if record is not None:
+            return record
+        loaded = None
+        try:
+            row = self.storage.load_quiz_progress([key]).get(key)
+            loaded = self._decode(row) if row else None
+        except Exception as e:
+            logger.error(f"Error loading quiz progress for {user_id}: {e}")
+        with self._lock:
+            return self._records.setdefault(key, loaded or new_record())
+
+    def mark_dirty(self, user_id):
+        with self._lock:
+            self._dirty.add(str(user_id))
+
+    def flush(self):
+        """Save every dirty record to the storage backend in one batch"""
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                rows = [self._encode(user_id, self._records[user_id]) for user_id in dirty if user_id in self._records]
+            if not rows:
+                return 0
+            try:
+                self.storage.save_quiz_progress(rows)
+                return len(rows)
+            except Exception as e:
+                logger.error(f"Error saving quiz progress for {len(rows)} players, will retry: {e}")
+                with self._lock:
+                    self._dirty |= dirty
+                return 0
+
+progress_store = ProgressStore(get_sheet_manager, flush_interval=float(os.getenv("QUIZ_PROGRESS_FLUSH_INTERVAL", "5")))
+
+def get_progress_store():
+    return progress_store
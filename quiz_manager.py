@@ -1,4 +1,5 @@
 import random
+from progress_store import progress_store
 
 # --- African Countries Data ---
 AFRICAN_COUNTRIES = [
@@ -196,24 +197,20 @@ ALL_QUIZZES = [
     {"q": "Which African country has the most billionaires?", "a": "South Africa", "choices": ["Nigeria", "Egypt", "South Africa", "Morocco"]}
 ]
 
+# Views onto progress_store's records, which persist them write-behind; filled per user on first access
 player_progress = {}
 user_question_pools = {}
 
 def init_player_progress(user_id):
     if user_id not in player_progress:
-        player_progress[user_id] = {
-            'current_streak': 0,
-            'best_streak': 0,
-            'total_correct': 0,
-            'total_questions': 0,
-            'questions_until_bonus': 10,
-            'skips_used': 0,
-            'games_paused': 0
-        }
+        record = progress_store.get(user_id)
+        player_progress[user_id] = record['progress']
+        user_question_pools[user_id] = record['used_questions']
 
 def update_player_progress(user_id, is_correct):
     init_player_progress(user_id)
     progress = player_progress[user_id]
+    progress_store.mark_dirty(user_id)
     progress['total_questions'] += 1
     if is_correct:
         progress['current_streak'] += 1
@@ -230,16 +227,17 @@ def update_player_progress(user_id, is_correct):
     return False
 
 def get_random_question(user_id):
-    if user_id not in user_question_pools:
-        user_question_pools[user_id] = []
+    init_player_progress(user_id)
     
-    used_questions = user_question_pools[user_id]
+    used_questions = set(user_question_pools[user_id])
     available_questions = [q for q in ALL_QUIZZES if q['q'] not in used_questions]
     
     if not available_questions:
-        user_question_pools[user_id] = []
+        # Cleared in place: the list is shared with the persisted record
+        user_question_pools[user_id].clear()
         available_questions = ALL_QUIZZES
         
     selected_quiz = random.choice(available_questions)
     user_question_pools[user_id].append(selected_quiz['q'])
+    progress_store.mark_dirty(user_id)
     return selected_quiz
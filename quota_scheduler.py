@@ -0,0 +1,121 @@
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Lower value = admitted first
+PRIORITY_USER = 0        # reads/writes a user is waiting on
+PRIORITY_BACKGROUND = 1  # logging appends, ledger/mirror flushes
+PRIORITY_ADMIN = 2       # whole-sheet scans for admin views
+
+class TokenBucket:
+    def __init__(self, per_minute, capacity=None):
+        # Burst size; defaults to a full minute's worth
+        self.capacity = float(per_minute if capacity is None else capacity)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self):
+        self._refill()
+        return self.tokens
+
+    def try_take(self):
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self):
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def drain(self):
+        self._refill()
+        self.tokens = 0.0
+
+class QuotaScheduler:
+    """Admit Google Sheets calls against per-minute read/write quotas, highest priority first"""
+
+    def __init__(self, reads_per_minute=60, writes_per_minute=60, max_wait=60.0):
+        self.max_wait = max_wait
+        self._buckets = {'read': TokenBucket(reads_per_minute), 'write': TokenBucket(writes_per_minute)}
+        self._waiters = {'read': [], 'write': []}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self.admitted = {'read': 0, 'write': 0}
+        self.rejected = {'read': 0, 'write': 0}
+
+    def acquire(self, kind='read', priority=PRIORITY_USER, timeout=None):
+        """Block until a call of this kind may be made; False if the wait times out"""
+        timeout = self.max_wait if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        bucket = self._buckets[kind]
+        waiters = self._waiters[kind]
+        entry = (priority, next(self._counter))
+        with self._cond:
+            heapq.heappush(waiters, entry)
+            try:
+                while True:
+                    if waiters[0] == entry and bucket.try_take():
+                        self.admitted[kind] += 1
+                        return True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    # Only the head of the queue waits for a refill; the rest wait to be woken
+                    wait = bucket.wait_time() if waiters[0] == entry else remaining
+                    self._cond.wait(min(max(wait, 0.01), remaining))
+            finally:
+                waiters.remove(entry)
+                heapq.heapify(waiters)
+                self._cond.notify_all()
+
+    def call(self, func, *args, kind='read', priority=PRIORITY_USER, attempts=5, **kwargs):
+        """Run a Sheets API call once quota is available, requeueing if Google still rejects it"""
+        for _ in range(attempts):
+            if not self.acquire(kind, priority):
+                self.rejected[kind] += 1
+                raise Exception(f"Timed out waiting for Google Sheets {kind} quota")
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if "Quota exceeded" not in str(e):
+                    raise
+                # Our estimate was off (other clients share the quota): empty the bucket and queue again
+                logger.warning(f"Quota exceeded on {kind} despite scheduling, requeueing")
+                with self._cond:
+                    self._buckets[kind].drain()
+        raise Exception("Max retries exceeded for Google Sheets API")
+
+    def budget(self):
+        """Currently available calls per kind, and how many callers are queued"""
+        with self._cond:
+            return {
+                kind: {'available': int(bucket.available()), 'queued': len(self._waiters[kind])}
+                for kind, bucket in self._buckets.items()
+            }
+
+    def has_budget(self, kind='read', reserve=0):
+        """True if a call can be made now while keeping `reserve` calls for user-facing work"""
+        with self._cond:
+            return not self._waiters[kind] and self._buckets[kind].available() >= 1 + reserve
+
+quota_scheduler = QuotaScheduler(
+    reads_per_minute=int(os.getenv("SHEETS_READS_PER_MINUTE", "60")),
+    writes_per_minute=int(os.getenv("SHEETS_WRITES_PER_MINUTE", "60")),
+    max_wait=float(os.getenv("SHEETS_MAX_QUEUE_WAIT", "60"))
+)
+
+def get_quota_scheduler():
+    return quota_scheduler
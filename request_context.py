@@ -0,0 +1,72 @@
+import time
+import contextvars
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar('request_context', default=None)
+
+class RequestContext:
+    """State of one Telegram update: the chat it came from and the user records read while handling it
+
+    Each user is loaded at most once per update and every helper sees the same
+    record. Writes made through sheet_manager and the token ledger update the
+    record in place (or drop it so the next read reloads it).
+    """
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.started_at = time.monotonic()
+        self.reads = 0
+        self._users = {}  # user_id -> user record, or None for an unknown user
+
+    def user(self, user_id, load):
+        key = str(user_id)
+        if key not in self._users:
+            self._users[key] = load(user_id)
+            self.reads += 1
+        return self._users[key]
+
+    def remember(self, user):
+        if user:
+            self._users[str(user['UserID'])] = user
+
+    def update_user(self, user_id, **fields):
+        user = self._users.get(str(user_id))
+        if user is not None:
+            user.update(fields)
+
+    def forget(self, user_id):
+        self._users.pop(str(user_id), None)
+
+@contextmanager
+def request_scope(chat_id):
+    """Handle one update inside a fresh RequestContext"""
+    context = RequestContext(chat_id)
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
+
+def current_context():
+    """The RequestContext of the update being handled, or None outside one"""
+    return _current.get()
+
+def cached_user(user_id, load):
+    """load(user_id), memoised for the current update"""
+    context = _current.get()
+    return context.user(user_id, load) if context else load(user_id)
+
+def remember_user(user):
+    context = _current.get()
+    if context:
+        context.remember(user)
+
+def update_cached_user(user_id, **fields):
+    context = _current.get()
+    if context:
+        context.update_user(user_id, **fields)
+
+def forget_user(user_id):
+    context = _current.get()
+    if context:
+        context.forget(user_id)
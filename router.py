@@ -0,0 +1,143 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Router:
+    """Table-driven dispatch of text messages and callback queries
+
+    TeleBot tries every registered filter in turn for each update, so routing
+    cost grows with the number of features. The router is installed as one
+    message handler and one callback handler and finds the target with dict
+    lookups instead:
+
+    - messages: a command, then the chat's conversation state, then the exact
+      button text;
+    - callbacks: the exact callback data, then the part up to the first ':'
+      for handlers registered with a prefix such as "buy:".
+
+    Handlers can take a guard, called with the chat ID; if it returns False the
+    update is treated as unrouted, as a failing TeleBot filter would be.
+    Next-step handlers registered on the bot still run before the router.
+    """
+
+    def __init__(self):
+        self._commands = {}
+        self._texts = {}
+        self._states = {}
+        self._callbacks = {}
+        self._prefixes = {}
+        self._chat_states = {}  # chat_id -> (state, data)
+
+    # --- Registration ---
+
+    def _register(self, table, keys, guard):
+        def decorator(handler):
+            for key in keys:
+                if key in table:
+                    logger.warning(f"Route {key!r} registered twice, {handler.__name__} replaces {table[key][0].__name__}")
+                table[key] = (handler, guard)
+            return handler
+        return decorator
+
+    def command(self, *names, guard=None):
+        return self._register(self._commands, names, guard)
+
+    def text(self, *labels, guard=None):
+        """Handle messages whose text is exactly one of labels"""
+        return self._register(self._texts, labels, guard)
+
+    def state(self, *states):
+        """Handle any text message from a chat in one of these conversation states"""
+        return self._register(self._states, states, None)
+
+    def callback(self, *data, guard=None):
+        """Handle callback queries whose data is exactly one of data"""
+        return self._register(self._callbacks, data, guard)
+
+    def callback_prefix(self, *prefixes, guard=None):
+        """Handle callback queries whose data starts with a prefix ending in ':'"""
+        for prefix in prefixes:
+            if not prefix.endswith(':'):
+                raise ValueError(f"Callback prefix {prefix!r} must end with ':'")
+        return self._register(self._prefixes, prefixes, guard)
+
+    # --- Conversation state ---
+
+    def set_state(self, chat_id, state, **data):
+        """Send the chat's next text messages to the handler of state"""
+        self._chat_states[chat_id] = (state, data)
+
+    def get_state(self, chat_id):
+        """(state, data) of a chat, or (None, None)"""
+        return self._chat_states.get(chat_id, (None, None))
+
+    def clear_state(self, chat_id):
+        self._chat_states.pop(chat_id, None)
+
+    # --- Dispatch ---
+
+    def _allowed(self, route, chat_id):
+        if route is None:
+            return None
+        handler, guard = route
+        return handler if guard is None or guard(chat_id) else None
+
+    def route_message(self, message):
+        """Handler for a text message, or None"""
+        text = message.text or ''
+        chat_id = message.chat.id
+        if text.startswith('/'):
+            name = text.split(maxsplit=1)[0][1:].split('@', 1)[0]
+            handler = self._allowed(self._commands.get(name), chat_id)
+            if handler:
+                return handler
+        state = self._chat_states.get(chat_id)
+        if state is not None:
+            route = self._states.get(state[0])
+            if route is not None:
+                return route[0]
+        return self._allowed(self._texts.get(text), chat_id)
+
+    def route_callback(self, call):
+        """Handler for a callback query, or None"""
+        data = call.data or ''
+        chat_id = call.message.chat.id if call.message else call.from_user.id
+        route = self._callbacks.get(data)
+        if route is None and ':' in data:
+            route = self._prefixes.get(data.split(':', 1)[0] + ':')
+        return self._allowed(route, chat_id)
+
+    def dispatch_message(self, message):
+        """Run the handler of a text message; False if it has none"""
+        handler = self.route_message(message)
+        if handler is None:
+            return False
+        handler(message)
+        return True
+
+    def dispatch_callback(self, call):
+        """Run the handler of a callback query; False if it has none"""
+        handler = self.route_callback(call)
+        if handler is None:
+            return False
+        handler(call)
+        return True
+
+    def install(self, bot):
+        """Register the router as the bot's text message and callback query handler
+
+        Both take every update of their kind and resolve the route once; an
+        unrouted update is dropped, as it was when no TeleBot filter matched.
+        """
+        bot.message_handler(func=lambda message: True)(self.dispatch_message)
+        bot.callback_query_handler(func=lambda call: True)(self.dispatch_callback)
+
+    def stats(self):
+        return {
+            'commands': len(self._commands),
+            'texts': len(self._texts),
+            'states': len(self._states),
+            'callbacks': len(self._callbacks),
+            'callback_prefixes': len(self._prefixes),
+            'chats_in_conversation': len(self._chat_states),
+        }
@@ -0,0 +1,261 @@
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+from collections import deque
+from quota_scheduler import TokenBucket
+from request_context import current_context
+
+logger = logging.getLogger(__name__)
+
+# Lower value = sent first
+PRIORITY_CALLBACK = 0  # answer_callback_query: the user's button spinner is waiting on it
+PRIORITY_CHAT = 1      # replies to the user's own actions
+PRIORITY_BULK = 2      # broadcasts and admin notifications
+
+# Telegram's limit on message text length; merged messages stay under it
+MAX_TEXT_LENGTH = 4096
+
+class Outbound:
+    __slots__ = ('method', 'key', 'args', 'kwargs', 'priority', 'callback', 'attempts', 'scope')
+
+    def __init__(self, method, key, args, kwargs, priority, callback=None):
+        self.method = method
+        self.key = key
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.callback = callback
+        self.attempts = 0
+        # RequestContext of the update that queued the send, or None outside one
+        self.scope = current_context()
+
+    def merge(self, other):
+        """Fold a following text message to the same chat into this one, if they can share a message"""
+        if self.method != 'send_message' or other.method != 'send_message' or self.priority != other.priority:
+            return False
+        # Only replies to one update are merged; replies to separate updates stay separate messages
+        if self.scope is None or self.scope is not other.scope:
+            return False
+        # Each callback expects the outcome of its own message
+        if self.callback is not None or other.callback is not None:
+            return False
+        # A keyboard belongs to its own text
+        if self.kwargs.get('reply_markup') is not None or other.kwargs.get('reply_markup') is not None:
+            return False
+        options = {k: v for k, v in self.kwargs.items() if k not in ('text', 'reply_markup')}
+        other_options = {k: v for k, v in other.kwargs.items() if k not in ('text', 'reply_markup')}
+        text = f"{self.kwargs['text']}\n\n{other.kwargs['text']}"
+        if options != other_options or len(text) > MAX_TEXT_LENGTH:
+            return False
+        self.kwargs['text'] = text
+        return True
+
+def _retry_after(error):
+    """Seconds Telegram asked us to wait for a 429, or None for other errors"""
+    if getattr(error, 'error_code', None) != 429:
+        return None
+    result = getattr(error, 'result_json', None) or {}
+    return float(result.get('parameters', {}).get('retry_after', 1))
+
+class OutboundQueue:
+    """Non-blocking Telegram sender with global and per-chat rate limits
+
+    Handlers enqueue sends and return; worker threads deliver them in priority
+    order within Telegram's limits (about 30 messages/s overall, ~1/s per chat),
+    keep each chat's messages in order, back off on 429 retry_after, and merge
+    consecutive plain texts sent to one chat while handling the same update
+    into a single message.
+    """
+
+    def __init__(self, bot, messages_per_second=30, per_chat_per_second=1.0, per_chat_burst=3,
+                 workers=4, max_attempts=3):
+        self.bot = bot
+        self.per_chat_per_second = per_chat_per_second
+        self.per_chat_burst = per_chat_burst
+        self.max_attempts = max_attempts
+        self._global = TokenBucket(messages_per_second * 60, capacity=messages_per_second)
+        self._queues = {}    # key -> deque of Outbound, present while queued or in flight
+        self._buckets = {}   # chat -> TokenBucket, swept once idle buckets pile up
+        self._bucket_sweep_at = 1000
+        self._not_before = {}  # key -> monotonic time set by a 429
+        self._inflight = set()
+        self._ready = []     # (priority, seq, key) of chats allowed to send now
+        self._delayed = []   # (ready_at, seq, key) of chats waiting on their own limit
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._callback_ids = itertools.count()
+        self.sent = 0
+        self.merged = 0
+        self.retried = 0
+        self.failed = 0
+        self._threads = [
+            threading.Thread(target=self._run, name=f"telegram-sender-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # --- Enqueueing ---
+
+    def send_message(self, chat_id, text, priority=PRIORITY_CHAT, callback=None, **kwargs):
+        """Queue a text message; callback(result, error) is called once it is sent or given up on"""
+        kwargs['text'] = text
+        self._submit(Outbound('send_message', chat_id, (chat_id,), kwargs, priority, callback))
+
+    def answer_callback_query(self, callback_query_id, text=None, priority=PRIORITY_CALLBACK, **kwargs):
+        # Not a chat message, so it only counts against the global limit
+        key = ('callback', next(self._callback_ids))
+        self._submit(Outbound('answer_callback_query', key, (callback_query_id, text), kwargs, priority))
+
+    def send(self, method, chat_id, *args, priority=PRIORITY_CHAT, callback=None, **kwargs):
+        """Queue any other bot.<method>(chat_id, *args, **kwargs) send, e.g. send_photo"""
+        self._submit(Outbound(method, chat_id, (chat_id,) + args, kwargs, priority, callback))
+
+    def _submit(self, item):
+        with self._cond:
+            chat_queue = self._queues.get(item.key)
+            if chat_queue is None:
+                chat_queue = self._queues[item.key] = deque([item])
+                self._schedule(item.key)
+                self._cond.notify()
+            elif chat_queue and chat_queue[-1].merge(item):
+                self.merged += 1
+            else:
+                chat_queue.append(item)
+
+    # --- Scheduling (caller holds self._cond) ---
+
+    def _bucket(self, key):
+        if isinstance(key, tuple):
+            return None
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.per_chat_per_second * 60, capacity=self.per_chat_burst)
+        return bucket
+
+    def _schedule(self, key):
+        """Queue a chat whose head message is ready to be considered"""
+        bucket = self._bucket(key)
+        now = time.monotonic()
+        wait = max(bucket.wait_time() if bucket else 0.0, self._not_before.get(key, 0.0) - now)
+        if wait > 0:
+            heapq.heappush(self._delayed, (now + wait, next(self._counter), key))
+        else:
+            heapq.heappush(self._ready, (self._queues[key][0].priority, next(self._counter), key))
+
+    def _next_item(self):
+        """Block until a message may be sent and claim it"""
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, _, key = heapq.heappop(self._delayed)
+                self._schedule(key)
+            timeout = self._delayed[0][0] - now if self._delayed else None
+            if self._ready:
+                global_wait = self._global.wait_time()
+                if global_wait <= 0:
+                    _, _, key = heapq.heappop(self._ready)
+                    bucket = self._bucket(key)
+                    if bucket and not bucket.try_take():
+                        self._schedule(key)
+                        continue
+                    self._global.try_take()
+                    self._inflight.add(key)
+                    return self._queues[key].popleft()
+                timeout = global_wait if timeout is None else min(timeout, global_wait)
+            self._cond.wait(timeout)
+
+    def _finish(self, item, retry_after=None):
+        key = item.key
+        with self._cond:
+            self._inflight.discard(key)
+            chat_queue = self._queues[key]
+            if retry_after is not None:
+                chat_queue.appendleft(item)
+                self._not_before[key] = time.monotonic() + retry_after
+            else:
+                self._not_before.pop(key, None)
+            if chat_queue:
+                self._schedule(key)
+            else:
+                del self._queues[key]
+                if len(self._buckets) > self._bucket_sweep_at:
+                    self._sweep_buckets()
+            self._cond.notify_all()
+
+    def _sweep_buckets(self):
+        """Forget idle chats whose bucket has refilled; a new one would start in the same state"""
+        for key, bucket in list(self._buckets.items()):
+            if key not in self._queues and bucket.available() >= bucket.capacity:
+                del self._buckets[key]
+        self._bucket_sweep_at = max(1000, 2 * len(self._buckets))
+
+    # --- Delivery ---
+
+    def _run(self):
+        while True:
+            with self._cond:
+                item = self._next_item()
+            retry_after = None
+            result = error = None
+            try:
+                item.attempts += 1
+                result = getattr(self.bot, item.method)(*item.args, **item.kwargs)
+                self.sent += 1
+            except Exception as e:
+                retry_after = _retry_after(e)
+                if retry_after is not None and item.attempts < self.max_attempts:
+                    logger.warning(f"Telegram rate limit on {item.key}, retrying {item.method} in {retry_after}s")
+                    self.retried += 1
+                else:
+                    logger.error(f"Error sending {item.method} to {item.key}: {e}")
+                    self.failed += 1
+                    retry_after = None
+                    error = e
+            self._finish(item, retry_after)
+            if item.callback is not None and retry_after is None:
+                try:
+                    item.callback(result, error)
+                except Exception as e:
+                    logger.error(f"Error in send callback for {item.key}: {e}")
+
+    def stats(self):
+        with self._cond:
+            lanes = {PRIORITY_CALLBACK: 0, PRIORITY_CHAT: 0, PRIORITY_BULK: 0}
+            for chat_queue in self._queues.values():
+                for item in chat_queue:
+                    lanes[item.priority] = lanes.get(item.priority, 0) + 1
+            return {
+                'queued': sum(lanes.values()),
+                'queued_by_priority': lanes,
+                'chats': len(self._queues),
+                'in_flight': len(self._inflight),
+                'sent': self.sent,
+                'merged': self.merged,
+                'retried': self.retried,
+                'failed': self.failed,
+            }
+
+    def drain(self, timeout=10.0):
+        """Wait until everything queued has been sent; False on timeout"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._queues:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+def create_outbox(bot):
+    """OutboundQueue configured from TELEGRAM_* environment variables"""
+    return OutboundQueue(
+        bot,
+        messages_per_second=float(os.getenv("TELEGRAM_MESSAGES_PER_SECOND", "30")),
+        per_chat_per_second=float(os.getenv("TELEGRAM_CHAT_MESSAGES_PER_SECOND", "1")),
+        per_chat_burst=int(os.getenv("TELEGRAM_CHAT_BURST", "3")),
+        workers=int(os.getenv("TELEGRAM_SEND_WORKERS", "4"))
+    )
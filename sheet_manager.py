@@ -1,10 +1,21 @@
 import os
-import time
+import re
 import logging
+import atexit
+import threading
+import time
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
+from write_buffer import WriteBuffer, column_letter
+from sheet_schema import UserSheetSchema, USER_FIELDS
+from sheet_watcher import SheetWatcher
+from quota_scheduler import quota_scheduler, PRIORITY_USER, PRIORITY_BACKGROUND, PRIORITY_ADMIN
+from storage_backend import StorageBackend, MirroredStorage, LEDGER_FIELDS, QUIZ_PROGRESS_FIELDS
+from transaction_archive import TransactionIndex, partition_title, row_month, row_key, contiguous_ranges
+from user_locks import user_lock
+from request_context import cached_user, remember_user, update_cached_user, forget_user
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -18,18 +29,31 @@ else:
     # Running locally
     load_dotenv()  # Load local environment variables
 
-class SheetManager:
-    def __init__(self):
-        scope = [
-            "https://spreadsheets.google.com/feeds",
-            "https://www.googleapis.com/auth/drive"
-        ]
-        creds_path = os.getenv("GOOGLE_CREDENTIALS_PATH")
-        if not creds_path or not os.path.exists(creds_path):
-            raise ValueError(f"Google credentials file not found at {creds_path}")
-        creds = ServiceAccountCredentials.from_json_keyfile_name(creds_path, scope)
-        self.client = gspread.authorize(creds)
-        spreadsheet_id = os.getenv("SPREADSHEET_ID")
+# Fields admins edit by hand; refresh_users re-reads only these columns for known rows
+REFRESHED_FIELDS = ('Tokens', 'Points', 'MoMoNumber', 'ReferralEarnings', 'LastClaimDate')
+
+# TokenLog columns, in sheet order
+TRANSACTION_FIELDS = ('user_id', 'transaction_id', 'amount', 'payment_method', 'timestamp')
+
+def is_pending_transaction(transaction_id):
+    # Approval renames PENDING_x to APPROVED_PENDING_x, so only the prefix marks an open purchase
+    return str(transaction_id).startswith("PENDING")
+
+class SheetManager(StorageBackend):
+    def __init__(self, client=None, spreadsheet_id=None):
+        # client is an authorised gspread client, or e.g. a fake_gspread.FakeClient for offline runs
+        if client is None:
+            scope = [
+                "https://spreadsheets.google.com/feeds",
+                "https://www.googleapis.com/auth/drive"
+            ]
+            creds_path = os.getenv("GOOGLE_CREDENTIALS_PATH")
+            if not creds_path or not os.path.exists(creds_path):
+                raise ValueError(f"Google credentials file not found at {creds_path}")
+            creds = ServiceAccountCredentials.from_json_keyfile_name(creds_path, scope)
+            client = gspread.authorize(creds)
+        self.client = client
+        spreadsheet_id = spreadsheet_id or os.getenv("SPREADSHEET_ID")
         if not spreadsheet_id or spreadsheet_id == "your-google-sheet-id-here":
             raise ValueError("Invalid or missing SPREADSHEET_ID in .env file")
         self.spreadsheet = self.client.open_by_key(spreadsheet_id)
@@ -41,297 +65,789 @@ class SheetManager:
         except gspread.exceptions.WorksheetNotFound:
             self.cleanup_sheet = self.spreadsheet.add_worksheet(title="Cleanup Submissions", rows="100", cols="20")
             self.cleanup_sheet.append_row(["UserID", "Name", "Username", "Location", "MediaURL", "Timestamp", "Status"])
-
-    def _retry_on_quota_exceeded(self, func, *args, **kwargs):
-        attempts = 5
-        for i in range(attempts):
-            try:
-                return func(*args, **kwargs)
-            except gspread.exceptions.APIError as e:
-                if "Quota exceeded" in str(e):
-                    wait_time = 2 ** i
-                    logger.warning(f"Quota exceeded, retrying in {wait_time}s...")
-                    time.sleep(wait_time)
-                else:
-                    raise e
-        raise Exception("Max retries exceeded for Google Sheets API")
+        try:
+            self.ledger_sheet = self.spreadsheet.worksheet("Ledger")
+        except gspread.exceptions.WorksheetNotFound:
+            self.ledger_sheet = self.spreadsheet.add_worksheet(title="Ledger", rows="1000", cols="10")
+            self.ledger_sheet.append_row(LEDGER_FIELDS)
+        try:
+            self.progress_sheet = self.spreadsheet.worksheet("QuizProgress")
+        except gspread.exceptions.WorksheetNotFound:
+            self.progress_sheet = self.spreadsheet.add_worksheet(title="QuizProgress", rows="1000", cols="10")
+            self.progress_sheet.append_row(QUIZ_PROGRESS_FIELDS)
+        # In-process user table keyed by UserID, loaded once and kept current by the write methods
+        self._users = {}
+        # UserID -> sheet row number, so mutations go straight to their range without a find()
+        self._user_rows = {}
+        self._next_user_row = 2
+        # referral_code -> UserID, so /start REFxxxxxx deep links resolve without a sheet read
+        self._referral_index = {}
+        self._users_loaded = False
+        self._users_lock = threading.RLock()
+        # Held for the first load only; the table is swapped in under _users_lock
+        self._users_load_lock = threading.Lock()
+        self._registering = set()
+        # UserID -> {field: generation} of local writes ('*' = whole record, for registrations).
+        # Sheet reads snapshot the generation first and keep anything written after it,
+        # whether or not the write has been flushed by the time the read returns.
+        self._write_generation = 0
+        self._written = {}
+        # transaction_id -> (TokenLog row, record) for purchases awaiting approval
+        self._pending_transactions = {}
+        self._pending_loaded = False
+        self._pending_lock = threading.Lock()
+        self._pending_load_lock = threading.Lock()
+        self._transaction_positions = list(range(len(TRANSACTION_FIELDS)))
+        # Serialises TokenLog appends and row updates with archival, which rewrites the live partition
+        self._transactions_lock = threading.RLock()
+        # Settled rows of past months live in "TokenLog YYYY-MM" worksheets, found through a local index
+        self._archive_sheets = {}
+        self._transaction_index = TransactionIndex(os.getenv("TRANSACTION_INDEX_PATH", "transaction_index.json"))
+        # QuizProgress: user_id -> (row number, record), read in one call the first time any player loads
+        self._progress = None
+        self._next_progress_row = 2
+        self._progress_lock = threading.Lock()
+        # Header -> column resolution, recompiled only when the header row changes
+        self._schema = UserSheetSchema([])
+        # Cell writes to the users sheet are coalesced per row and flushed as one batch_update
+        self._write_buffer = WriteBuffer(
+            self.users_sheet,
+            flush_interval=float(os.getenv("SHEET_FLUSH_INTERVAL", "2")),
+            max_pending_cells=int(os.getenv("SHEET_FLUSH_MAX_CELLS", "200")),
+            executor=self._sheets_call
+        )
+        self._write_buffer.start()
+        atexit.register(self._write_buffer.flush)
+        # Picks up balances/statuses admins edit by hand in the spreadsheet
+        self._watcher = SheetWatcher(self.spreadsheet, self.refresh_users, interval=float(os.getenv("SHEET_WATCH_INTERVAL", "30")))
+        self._watcher.start()
+        self._archive_interval = float(os.getenv("TOKENLOG_ARCHIVE_INTERVAL", "21600"))
+        if self._archive_interval > 0:
+            threading.Thread(target=self._run_archiver, name="tokenlog-archiver", daemon=True).start()
+
+    def _sheets_call(self, func, *args, kind='write', priority=PRIORITY_USER, **kwargs):
+        """Run a Sheets API call through the shared quota scheduler instead of failing on quota"""
+        return quota_scheduler.call(func, *args, kind=kind, priority=priority, **kwargs)
 
     def register_user(self, user_id, name, username, referrer_id):
         try:
-            def do_register():
-                existing = self.users_sheet.findall(str(user_id))
-                if not existing:
-                    referral_code = f"REF{str(user_id)[-6:]}"
-                    row = [str(user_id), name, username or "", 3.0, 0.0, "", referral_code, 0.0, referrer_id or ""]
-                    self.users_sheet.append_row(row)
-                    logger.info(f"Registered user: {user_id}")
-            self._retry_on_quota_exceeded(do_register)
+            self._ensure_users_loaded()
+            with self._users_lock:
+                # Claim the ID so a concurrent /start can't append a duplicate row while we wait on the API
+                if str(user_id) in self._users or str(user_id) in self._registering:
+                    return
+                self._registering.add(str(user_id))
+            try:
+                row, user = self._new_user(user_id, name, username, referrer_id)
+                response = self._sheets_call(self.users_sheet.append_row, row)
+                with self._users_lock:
+                    self._add_cached_users([user], self._appended_row_number(response, self._next_user_row))
+                logger.info(f"Registered user: {user_id}")
+            finally:
+                with self._users_lock:
+                    self._registering.discard(str(user_id))
         except Exception as e:
             logger.error(f"Error registering user {user_id}: {e}")
 
+    def _new_user(self, user_id, name, username, referrer_id):
+        """Sheet row and cached record of a newly registered user"""
+        referral_code = f"REF{str(user_id)[-6:]}"
+        row = [str(user_id), name, username or "", 3.0, 0.0, "", referral_code, 0.0, referrer_id or ""]
+        user = {
+            'UserID': str(user_id),
+            'Name': name,
+            'Username': username or "",
+            'Tokens': 3.0,
+            'Points': 0.0,
+            'ReferralEarnings': 0.0,
+            'MoMoNumber': "",
+            'referral_code': referral_code,
+            'LastClaimDate': str(referrer_id or "")
+        }
+        return row, user
+
+    def _add_cached_users(self, users, first_row):
+        """Index users appended as consecutive rows starting at first_row; caller holds _users_lock"""
+        for row_number, user in enumerate(users, start=first_row):
+            self._users[user['UserID']] = user
+            self._user_rows[user['UserID']] = row_number
+            self._referral_index[user['referral_code']] = user['UserID']
+            self._mark_written(user['UserID'], ('*',))
+        self._next_user_row = max(self._next_user_row, first_row + len(users))
+
+    def _mark_written(self, user_id, fields):
+        """Record a local write to a cached user; caller holds _users_lock"""
+        self._write_generation += 1
+        written = self._written.setdefault(str(user_id), {})
+        for field in fields:
+            written[field] = self._write_generation
+
+    def _read_snapshot(self):
+        """(generation, pending rows) to take before reading the users sheet; caller holds _users_lock"""
+        return self._write_generation, self._write_buffer.pending_rows()
+
+    def _local_fields(self, user_id, snapshot):
+        """Fields of a cached user that a sheet read started at snapshot may not reflect
+
+        Returns ['*'] when the whole record must be kept: the user was registered
+        after the snapshot or their row had unflushed writes before or after it.
+        Caller holds _users_lock.
+        """
+        generation, pending_at_start = snapshot
+        row_number = self._user_rows.get(user_id)
+        if row_number is not None and (row_number in pending_at_start or row_number in self._write_buffer.pending_rows()):
+            return ['*']
+        fields = [field for field, written_at in self._written.get(user_id, {}).items() if written_at > generation]
+        return ['*'] if '*' in fields else fields
+
+    def register_users(self, users, chunk_size=None):
+        """Register many users with chunked append_rows calls
+
+        users is an iterable of dicts with user_id, name and optional username and
+        referrer_id. IDs already registered (or repeated in the input) are skipped.
+        Returns the number of users added.
+        """
+        chunk_size = chunk_size or int(os.getenv("BULK_IMPORT_CHUNK", "1000"))
+        self._ensure_users_loaded()
+        with self._users_lock:
+            new_users = {}
+            for user in users:
+                user_id = str(user['user_id']).strip()
+                if not user_id or user_id in self._users or user_id in self._registering or user_id in new_users:
+                    continue
+                new_users[user_id] = self._new_user(user_id, user.get('name') or 'Unknown', user.get('username'), user.get('referrer_id'))
+            self._registering.update(new_users)
+        added = 0
+        pending = list(new_users.items())
+        try:
+            for start in range(0, len(pending), chunk_size):
+                chunk = pending[start:start + chunk_size]
+                response = self._sheets_call(self.users_sheet.append_rows, [row for _, (row, _) in chunk], priority=PRIORITY_BACKGROUND)
+                with self._users_lock:
+                    self._add_cached_users([user for _, (_, user) in chunk], self._appended_row_number(response, self._next_user_row))
+                    self._registering.difference_update(user_id for user_id, _ in chunk)
+                added += len(chunk)
+                logger.info(f"Bulk registered {added}/{len(pending)} users")
+        except Exception as e:
+            logger.error(f"Error bulk registering users after {added} of {len(pending)}: {e}")
+        finally:
+            with self._users_lock:
+                self._registering.difference_update(new_users)
+        return added
+
+    def _load_users(self, priority=PRIORITY_USER):
+        """Download the users sheet and (re)build the in-process user table"""
+        with self._users_lock:
+            snapshot = self._read_snapshot()
+        all_values = self._sheets_call(self.users_sheet.get_all_values, kind='read', priority=priority)
+        started = time.time()
+        users = {}
+        user_rows = {}
+        if all_values:
+            if not self._schema.matches(all_values[0]):
+                self._schema = UserSheetSchema(all_values[0])
+                logger.info(f"Resolved users sheet columns: {self._schema.column_map}")
+            for row_number, user in self._schema.decode_rows(all_values[1:]):
+                users[user['UserID']] = user
+                user_rows[user['UserID']] = row_number
+        with self._users_lock:
+            # Writes made while the sheet was downloading are newer in the table than in the download
+            next_user_row = len(all_values) + 1 if all_values else 2
+            for user_id, cached in self._users.items():
+                fields = self._local_fields(user_id, snapshot)
+                if not fields:
+                    continue
+                if fields == ['*'] or user_id not in users:
+                    users[user_id] = cached
+                    user_rows[user_id] = self._user_rows[user_id]
+                    next_user_row = max(next_user_row, user_rows[user_id] + 1)
+                else:
+                    users[user_id].update({field: cached[field] for field in fields if field in cached})
+            self._users = users
+            self._user_rows = user_rows
+            self._referral_index = {user['referral_code']: user_id for user_id, user in users.items() if user['referral_code']}
+            self._next_user_row = next_user_row
+            self._users_loaded = True
+        logger.info(f"Loaded {len(users)} users into cache ({time.time() - started:.3f}s to decode)")
+
+    def _ensure_users_loaded(self):
+        if not self._users_loaded:
+            with self._users_load_lock:
+                if not self._users_loaded:
+                    self._load_users()
+
+    def _get_user_row(self, user_id):
+        """Look up the sheet row of a user from the row index"""
+        self._ensure_users_loaded()
+        with self._users_lock:
+            return self._user_rows.get(str(user_id))
+
+    def _appended_row_number(self, response, fallback):
+        """Read the row number of an appended row from the append response"""
+        try:
+            updated_range = response['updates']['updatedRange']
+            match = re.search(r'![A-Z]+(\d+)', updated_range)
+            if match:
+                return int(match.group(1))
+        except (KeyError, TypeError):
+            pass
+        return fallback
+
+    def _cached_value(self, user_id, field, default=0.0):
+        with self._users_lock:
+            user = self._users.get(str(user_id))
+            return user.get(field, default) if user else default
+
+    def flush_writes(self):
+        """Flush buffered cell writes to the sheet immediately"""
+        return self._write_buffer.flush()
+
+    def _update_cached_user(self, user_id, **fields):
+        """Apply written values to the cached user record, if present"""
+        with self._users_lock:
+            user = self._users.get(str(user_id))
+            if user is not None:
+                user.update(fields)
+                self._mark_written(user_id, fields)
+
+    def refresh_users(self):
+        """Reconcile the user table with out-of-band edits using one batched read
+
+        Reads the UserID column and the editable columns of known rows plus any rows
+        appended after them, instead of the whole sheet. Falls back to a full reload if
+        rows were inserted, deleted or reordered.
+        """
+        try:
+            if not self._users_loaded:
+                self._ensure_users_loaded()
+                return
+            schema = self._schema
+            with self._users_lock:
+                last_row = self._next_user_row - 1
+                expected = {row_number: user_id for user_id, row_number in self._user_rows.items()}
+                snapshot = self._read_snapshot()
+            if last_row < 2:
+                self._load_users(priority=PRIORITY_BACKGROUND)
+                return
+            id_col = column_letter(schema.column('UserID'))
+            columns = [schema.column(field) for field in REFRESHED_FIELDS]
+            first_col, last_col = min(columns), max(columns)
+            width = column_letter(max(schema.column(field) for field in USER_FIELDS))
+            ranges = [
+                f"{id_col}2:{id_col}{last_row}",
+                f"{column_letter(first_col)}2:{column_letter(last_col)}{last_row}",
+                f"A{last_row + 1}:{width}",
+            ]
+            id_values, field_values, new_rows = self._sheets_call(self.users_sheet.batch_get, ranges, kind='read', priority=PRIORITY_BACKGROUND)
+
+            sheet_ids = {offset + 2: str(row[0]) for offset, row in enumerate(id_values) if row and str(row[0]).strip()}
+            if sheet_ids != expected:
+                logger.info("Users sheet rows were inserted, deleted or moved; reloading")
+                self._load_users(priority=PRIORITY_BACKGROUND)
+                return
+
+            changed = 0
+            with self._users_lock:
+                for offset, values in enumerate(field_values):
+                    row_number = offset + 2
+                    user_id = expected.get(row_number)
+                    user = self._users.get(user_id)
+                    if user is None:
+                        continue
+                    # Our own writes since the read started win over what the sheet showed
+                    local_fields = self._local_fields(user_id, snapshot)
+                    if local_fields == ['*']:
+                        continue
+                    for field, value in schema.decode_fields(values, first_col, REFRESHED_FIELDS).items():
+                        if field not in local_fields and user.get(field) != value:
+                            user[field] = value
+                            changed += 1
+                added = 0
+                for row_number, user in schema.decode_rows(new_rows, first_row=last_row + 1):
+                    if user['UserID'] in self._users:
+                        continue
+                    self._users[user['UserID']] = user
+                    self._user_rows[user['UserID']] = row_number
+                    self._referral_index[user['referral_code']] = user['UserID']
+                    self._next_user_row = max(self._next_user_row, row_number + 1)
+                    added += 1
+            if changed or added:
+                logger.info(f"Reconciled users sheet: {changed} fields changed, {added} users added")
+        except Exception as e:
+            logger.error(f"Error refreshing users from sheet: {e}")
+
     def get_user_data(self, user_id):
-        """Get user data with flexible column mapping"""
+        """Get user data from the in-process user table"""
         try:
-            all_values = self.users_sheet.get_all_values()
-            if not all_values:
-                return None
-                
-            headers = all_values[0]
-            
-            # Create flexible mapping
-            column_map = {}
-            for i, header in enumerate(headers):
-                header_lower = str(header).lower().strip()
-                if 'userid' in header_lower or 'user_id' in header_lower:
-                    column_map['UserID'] = i
-                elif 'name' in header_lower and 'user' not in header_lower:
-                    column_map['Name'] = i
-                elif 'username' in header_lower:
-                    column_map['Username'] = i
-                elif 'tokens' in header_lower:
-                    column_map['Tokens'] = i
-                elif 'points' in header_lower:
-                    column_map['Points'] = i
-                elif 'momo' in header_lower or 'mobile' in header_lower:
-                    column_map['MoMoNumber'] = i
-                elif 'referral_code' in header_lower or 'referralcode' in header_lower:
-                    column_map['referral_code'] = i
-                elif 'referralearnings' in header_lower or 'referral_earnings' in header_lower:
-                    column_map['ReferralEarnings'] = i
-            
-            # Use default positions if not found
-            default_map = {
-                'UserID': 0,
-                'Name': 1,
-                'Username': 2,
-                'Tokens': 3,
-                'Points': 4,
-                'MoMoNumber': 5,
-                'referral_code': 6,
-                'ReferralEarnings': 7
-            }
-            
-            # Merge with actual mapping
-            final_map = {**default_map, **column_map}
-            
-            # Find user
-            for row in all_values[1:]:
-                if len(row) > final_map['UserID'] and str(row[final_map['UserID']]) == str(user_id):
-                    return {
-                        'UserID': str(row[final_map['UserID']]),
-                        'Name': str(row[final_map['Name']]) if len(row) > final_map['Name'] else 'Unknown',
-                        'Username': str(row[final_map['Username']]) if len(row) > final_map['Username'] else '',
-                        'Tokens': float(row[final_map['Tokens']]) if len(row) > final_map['Tokens'] and str(row[final_map['Tokens']]).strip() and str(row[final_map['Tokens']]).replace('.', '', 1).isdigit() else 0.0,
-                        'Points': float(row[final_map['Points']]) if len(row) > final_map['Points'] and str(row[final_map['Points']]).strip() and str(row[final_map['Points']]).replace('.', '', 1).isdigit() else 0.0,
-                        'ReferralEarnings': float(row[final_map['ReferralEarnings']]) if len(row) > final_map['ReferralEarnings'] and str(row[final_map['ReferralEarnings']]).strip() and str(row[final_map['ReferralEarnings']]).replace('.', '', 1).isdigit() else 0.0,
-                        'MoMoNumber': str(row[final_map['MoMoNumber']]) if len(row) > final_map['MoMoNumber'] else '',
-                        'referral_code': str(row[final_map['referral_code']]) if len(row) > final_map['referral_code'] else f"REF{str(user_id)[-6:]}"
-                    }
-            return None
+            self._ensure_users_loaded()
+            with self._users_lock:
+                user = self._users.get(str(user_id))
+                return dict(user) if user else None
         except Exception as e:
             logger.error(f"Error fetching user data for {user_id}: {e}")
             return None
 
     def update_user_tokens_points(self, user_id, tokens, points):
         try:
-            def do_update():
-                cell = self.users_sheet.find(str(user_id))
-                if cell:
-                    row = cell.row
-                    self.users_sheet.update_cell(row, 4, float(tokens))
-                    self.users_sheet.update_cell(row, 5, float(points))
-                    logger.info(f"Updated tokens: {tokens}, points: {points} for user {user_id}")
-            self._retry_on_quota_exceeded(do_update)
+            row = self._get_user_row(user_id)
+            if row:
+                with user_lock(user_id):
+                    self._write_buffer.stage(row, {self._schema.column('Tokens'): float(tokens), self._schema.column('Points'): float(points)})
+                    self._update_cached_user(user_id, Tokens=float(tokens), Points=float(points))
+                logger.info(f"Updated tokens: {tokens}, points: {points} for user {user_id}")
         except Exception as e:
             logger.error(f"Error updating tokens/points for {user_id}: {e}")
 
     def reward_referrer(self, referrer_id, tokens):
         try:
-            def do_reward():
-                cell = self.users_sheet.find(str(referrer_id))
-                if cell:
-                    row = cell.row
-                    current_tokens = float(self.users_sheet.cell(row, 4).value or 0)
-                    current_earnings = float(self.users_sheet.cell(row, 8).value or 0)
-                    self.users_sheet.update_cell(row, 4, current_tokens + float(tokens))
-                    self.users_sheet.update_cell(row, 8, current_earnings + float(tokens))
-                    logger.info(f"Rewarded {tokens} tokens to referrer {referrer_id}")
-            self._retry_on_quota_exceeded(do_reward)
+            row = self._get_user_row(referrer_id)
+            if row:
+                # Same per-user lock as TokenLedger.record, so a quiz answer can't overwrite the reward
+                with user_lock(referrer_id), self._users_lock:
+                    new_tokens = float(self._cached_value(referrer_id, 'Tokens')) + float(tokens)
+                    new_earnings = float(self._cached_value(referrer_id, 'ReferralEarnings')) + float(tokens)
+                    self._write_buffer.stage(row, {self._schema.column('Tokens'): new_tokens, self._schema.column('ReferralEarnings'): new_earnings})
+                    self._update_cached_user(referrer_id, Tokens=new_tokens, ReferralEarnings=new_earnings)
+                logger.info(f"Rewarded {tokens} tokens to referrer {referrer_id}")
         except Exception as e:
             logger.error(f"Error rewarding referrer {referrer_id}: {e}")
 
     def log_token_purchase(self, user_id, transaction_id, amount, payment_method):
         try:
-            def do_log():
-                timestamp = datetime.now(timezone.utc).isoformat()
-                row = [str(user_id), transaction_id, float(amount), payment_method or "N/A", timestamp]
-                self.transactions_sheet.append_row(row)
-                logger.info(f"Logged token purchase for {user_id}: {amount} tokens")
-            self._retry_on_quota_exceeded(do_log)
+            timestamp = datetime.now(timezone.utc).isoformat()
+            row = [str(user_id), transaction_id, float(amount), payment_method or "N/A", timestamp]
+            if is_pending_transaction(transaction_id):
+                self._ensure_pending_loaded()
+            with self._transactions_lock:
+                response = self._sheets_call(self.transactions_sheet.append_row, row, priority=PRIORITY_BACKGROUND)
+                if is_pending_transaction(transaction_id):
+                    with self._pending_lock:
+                        record = dict(zip(TRANSACTION_FIELDS, row))
+                        self._pending_transactions[str(transaction_id)] = (self._appended_row_number(response, None), record)
+            logger.info(f"Logged token purchase for {user_id}: {amount} tokens")
         except Exception as e:
             logger.error(f"Error logging token purchase for {user_id}: {e}")
 
     def increment_referral_count(self, referrer_id, referred_id):
         try:
-            def do_increment():
-                cell = self.users_sheet.find(str(referrer_id))
-                if cell:
-                    row = cell.row
-                    current_count = int(self.users_sheet.cell(row, 8).value or 0)
-                    self.users_sheet.update_cell(row, 8, current_count + 1)
-                    self.referrals_sheet.append_row([str(referrer_id), str(referred_id), datetime.now(timezone.utc).isoformat()])
-                    logger.info(f"Incremented referral count for {referrer_id}")
-            self._retry_on_quota_exceeded(do_increment)
+            row = self._get_user_row(referrer_id)
+            if row:
+                with user_lock(referrer_id), self._users_lock:
+                    new_count = float(self._cached_value(referrer_id, 'ReferralEarnings')) + 1
+                    self._write_buffer.stage(row, {self._schema.column('ReferralEarnings'): new_count})
+                    self._update_cached_user(referrer_id, ReferralEarnings=new_count)
+                referral_row = [str(referrer_id), str(referred_id), datetime.now(timezone.utc).isoformat()]
+                self._sheets_call(self.referrals_sheet.append_row, referral_row, priority=PRIORITY_BACKGROUND)
+                logger.info(f"Incremented referral count for {referrer_id}")
         except Exception as e:
             logger.error(f"Error incrementing referral count for {referrer_id}: {e}")
 
     def log_point_redemption(self, user_id, reward):
         try:
-            def do_log_redemption():
-                timestamp = datetime.now(timezone.utc).isoformat()
-                row = [str(user_id), reward, timestamp]
-                self.transactions_sheet.append_row(row)
-                logger.info(f"Logged point redemption for {user_id}: {reward}")
-            self._retry_on_quota_exceeded(do_log_redemption)
+            timestamp = datetime.now(timezone.utc).isoformat()
+            row = [str(user_id), reward, timestamp]
+            with self._transactions_lock:
+                self._sheets_call(self.transactions_sheet.append_row, row, priority=PRIORITY_BACKGROUND)
+            logger.info(f"Logged point redemption for {user_id}: {reward}")
         except Exception as e:
             logger.error(f"Error logging point redemption for {user_id}: {e}")
 
     def update_user_momo(self, user_id, momo_number):
         try:
-            def do_update_momo():
-                cell = self.users_sheet.find(str(user_id))
-                if cell:
-                    row = cell.row
-                    self.users_sheet.update_cell(row, 6, str(momo_number))
-                    logger.info(f"Updated MoMo number for {user_id}: {momo_number}")
-            self._retry_on_quota_exceeded(do_update_momo)
+            row = self._get_user_row(user_id)
+            if row:
+                self._write_buffer.stage(row, {self._schema.column('MoMoNumber'): str(momo_number)})
+                self._update_cached_user(user_id, MoMoNumber=str(momo_number))
+                logger.info(f"Updated MoMo number for {user_id}: {momo_number}")
         except Exception as e:
             logger.error(f"Error updating MoMo number for {user_id}: {e}")
 
     def check_and_give_daily_reward(self, user_id):
         try:
-            def do_check_reward():
-                cell = self.users_sheet.find(str(user_id))
-                if not cell:
-                    return False, 0
-                row = cell.row
-                last_claim = self.users_sheet.cell(row, 9).value or ""
-                today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-                if last_claim != today:
-                    current_tokens = float(self.users_sheet.cell(row, 4).value or 0)
-                    self.users_sheet.update_cell(row, 4, current_tokens + 1)
-                    self.users_sheet.update_cell(row, 9, today)
-                    logger.info(f"Daily reward of 1 token given to {user_id}")
-                    return True, current_tokens + 1
-                return False, float(self.users_sheet.cell(row, 4).value or 0)
-            return self._retry_on_quota_exceeded(do_check_reward)
+            row = self._get_user_row(user_id)
+            if not row:
+                return False, 0
+            today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+            # Decide and commit in one critical section so a double tap can't claim twice;
+            # both cells go out together in the next batch_update
+            with user_lock(user_id), self._users_lock:
+                current_tokens = float(self._cached_value(user_id, 'Tokens'))
+                if self._cached_value(user_id, 'LastClaimDate', '') == today:
+                    return False, current_tokens
+                new_tokens = current_tokens + 1
+                self._write_buffer.stage(row, {self._schema.column('Tokens'): new_tokens, self._schema.column('LastClaimDate'): today})
+                self._update_cached_user(user_id, Tokens=new_tokens, LastClaimDate=today)
+            logger.info(f"Daily reward of 1 token given to {user_id}")
+            return True, new_tokens
         except Exception as e:
             logger.error(f"Error checking daily reward for {user_id}: {e}")
             return False, 0
 
     def update_last_claim_date(self, user_id, date):
         try:
-            def do_update_date():
-                cell = self.users_sheet.find(str(user_id))
-                if cell:
-                    row = cell.row
-                    self.users_sheet.update_cell(row, 9, str(date))
-                    logger.info(f"Updated last claim date for {user_id}: {date}")
-            self._retry_on_quota_exceeded(do_update_date)
+            row = self._get_user_row(user_id)
+            if row:
+                self._write_buffer.stage(row, {self._schema.column('LastClaimDate'): str(date)})
+                self._update_cached_user(user_id, LastClaimDate=str(date))
+                logger.info(f"Updated last claim date for {user_id}: {date}")
         except Exception as e:
             logger.error(f"Error updating last claim date for {user_id}: {e}")
 
     def get_all_users(self):
         try:
-            def do_get_users():
-                records = self.users_sheet.get_all_records()
-                return [row for row in records]
-            return self._retry_on_quota_exceeded(do_get_users)
+            if self._users_loaded and not quota_scheduler.has_budget('read', reserve=int(os.getenv("SHEETS_USER_READ_RESERVE", "10"))):
+                # Leave the remaining read quota to user-facing calls and answer from the user table
+                logger.info("Read quota low, serving all users from cache")
+                with self._users_lock:
+                    return [dict(user) for user in self._users.values()]
+            # Read-your-writes: push buffered cells before reading the whole sheet back
+            self._write_buffer.flush()
+            self._load_users(priority=PRIORITY_ADMIN)
+            with self._users_lock:
+                return [dict(user) for user in self._users.values()]
         except Exception as e:
             logger.error(f"Error fetching all users: {e}")
             return []
 
+    def _load_pending_transactions(self):
+        """Scan TokenLog once for open purchases and index them by transaction ID"""
+        with self._transactions_lock:
+            all_values = self._sheets_call(self.transactions_sheet.get_all_values, kind='read', priority=PRIORITY_ADMIN)
+            self._index_pending(all_values)
+
+    def _transaction_record(self, row):
+        positions = self._transaction_positions
+        return {field: row[index] if index < len(row) else '' for field, index in zip(TRANSACTION_FIELDS, positions)}
+
+    def _index_pending(self, all_values):
+        """Rebuild the pending index from the live TokenLog partition's values"""
+        pending = {}
+        if all_values:
+            headers = [str(header).strip() for header in all_values[0]]
+            self._transaction_positions = [headers.index(field) if field in headers else i for i, field in enumerate(TRANSACTION_FIELDS)]
+            for row_number, row in enumerate(all_values[1:], start=2):
+                record = self._transaction_record(row)
+                if is_pending_transaction(record['transaction_id']):
+                    pending[str(record['transaction_id'])] = (row_number, record)
+        with self._pending_lock:
+            self._pending_transactions = pending
+            self._pending_loaded = True
+        logger.info(f"Loaded {len(pending)} pending transactions")
+
+    def _ensure_pending_loaded(self):
+        if not self._pending_loaded:
+            with self._pending_load_lock:
+                if not self._pending_loaded:
+                    self._load_pending_transactions()
+
     def get_pending_transactions(self):
         try:
-            def do_get_transactions():
-                records = self.transactions_sheet.get_all_records()
-                return [row for row in records if "PENDING" in str(row.get("transaction_id", ""))]
-            return self._retry_on_quota_exceeded(do_get_transactions)
+            self._ensure_pending_loaded()
+            with self._pending_lock:
+                return [dict(record) for _, record in self._pending_transactions.values()]
         except Exception as e:
             logger.error(f"Error fetching pending transactions: {e}")
             return []
 
+    def warm_up(self):
+        self._ensure_users_loaded()
+        self._ensure_pending_loaded()
+
+    def get_users_data(self, user_ids):
+        self._ensure_users_loaded()
+        with self._users_lock:
+            return {str(user_id): dict(self._users[str(user_id)]) for user_id in user_ids if str(user_id) in self._users}
+
     def find_user_by_referral_code(self, referral_code):
         try:
-            def do_find():
-                users = self.get_all_users()
-                for user in users:
-                    if str(user.get('referral_code', '')) == str(referral_code):
-                        return user
-                return None
-            return self._retry_on_quota_exceeded(do_find)
+            self._ensure_users_loaded()
+            with self._users_lock:
+                user = self._users.get(self._referral_index.get(str(referral_code)))
+                return dict(user) if user else None
         except Exception as e:
             logger.error(f"Error finding user by referral code {referral_code}: {e}")
             return None
 
     def update_transaction_status(self, transaction_id, new_status):
         try:
-            def do_update():
-                cell = self.transactions_sheet.find(str(transaction_id))
-                if cell:
-                    row = cell.row
-                    self.transactions_sheet.update_cell(row, 2, str(new_status))
+            self._ensure_pending_loaded()
+            with self._transactions_lock:
+                with self._pending_lock:
+                    row_number, _ = self._pending_transactions.get(str(transaction_id), (None, None))
+                if not row_number:
+                    # Only the live partition; archived rows are settled and never change status
+                    cell = self._sheets_call(self.transactions_sheet.find, str(transaction_id), kind='read')
+                    row_number = cell.row if cell else None
+                if row_number:
+                    self._sheets_call(self.transactions_sheet.update_cell, row_number, 2, str(new_status))
+                    with self._pending_lock:
+                        self._pending_transactions.pop(str(transaction_id), None)
                     logger.info(f"Updated transaction {transaction_id} to {new_status}")
-            self._retry_on_quota_exceeded(do_update)
         except Exception as e:
             logger.error(f"Error updating transaction status for {transaction_id}: {e}")
 
+    def find_transaction(self, transaction_id):
+        """Look up a TokenLog record by transaction ID in the live partition or the monthly archives"""
+        try:
+            self._ensure_pending_loaded()
+            with self._pending_lock:
+                _, record = self._pending_transactions.get(str(transaction_id), (None, None))
+            if record:
+                return dict(record, partition=self.transactions_sheet.title)
+            archived = self._transaction_index.get(transaction_id)
+            if archived:
+                month, row_number = archived
+                worksheet = self._archive_worksheet(month)
+                row = self._sheets_call(worksheet.row_values, row_number, kind='read')
+                return dict(self._transaction_record(row), partition=worksheet.title)
+            with self._transactions_lock:
+                cell = self._sheets_call(self.transactions_sheet.find, str(transaction_id), kind='read')
+                row = self._sheets_call(self.transactions_sheet.row_values, cell.row, kind='read') if cell else None
+            return dict(self._transaction_record(row), partition=self.transactions_sheet.title) if row else None
+        except Exception as e:
+            logger.error(f"Error finding transaction {transaction_id}: {e}")
+            return None
+
+    def _archive_worksheet(self, month, header=None):
+        """Open (or, given a header, create) the archive worksheet of a month"""
+        if month not in self._archive_sheets:
+            title = partition_title(month)
+            try:
+                worksheet = self._sheets_call(self.spreadsheet.worksheet, title, kind='read', priority=PRIORITY_BACKGROUND)
+            except gspread.exceptions.WorksheetNotFound:
+                if header is None:
+                    raise
+                worksheet = self._sheets_call(self.spreadsheet.add_worksheet, title=title, rows="1000", cols="10", priority=PRIORITY_BACKGROUND)
+                self._sheets_call(worksheet.append_row, header, priority=PRIORITY_BACKGROUND)
+            self._archive_sheets[month] = worksheet
+        return self._archive_sheets[month]
+
+    def archive_transactions(self, before_month=None):
+        """Move settled TokenLog rows older than before_month ('YYYY-MM', default this month) into monthly worksheets
+
+        Pending purchases and rows without a timestamp stay in the live partition.
+        Returns the number of rows archived.
+        """
+        before_month = before_month or datetime.now(timezone.utc).strftime("%Y-%m")
+        try:
+            with self._transactions_lock:
+                all_values = self._sheets_call(self.transactions_sheet.get_all_values, kind='read', priority=PRIORITY_BACKGROUND)
+                if len(all_values) < 2:
+                    return 0
+                self._index_pending(all_values)
+                by_month = {}
+                for row in all_values[1:]:
+                    month = row_month(row)
+                    if month and month < before_month and not is_pending_transaction(self._transaction_record(row)['transaction_id']):
+                        by_month.setdefault(month, []).append(row)
+                if not by_month:
+                    return 0
+                for month, rows in sorted(by_month.items()):
+                    worksheet = self._archive_worksheet(month, header=all_values[0])
+                    response = self._sheets_call(worksheet.append_rows, rows, priority=PRIORITY_BACKGROUND)
+                    first_row = self._appended_row_number(response, None)
+                    if first_row:
+                        # Redemption rows (user, reward, timestamp) carry no transaction ID
+                        self._transaction_index.add({
+                            self._transaction_record(row)['transaction_id']: (month, first_row + offset)
+                            for offset, row in enumerate(rows) if len(row) >= len(TRANSACTION_FIELDS)
+                        })
+                # Delete only the archived rows, located again in a fresh read so rows added or moved
+                # since the first read (admin edits, other processes) are left where they are
+                current = self._sheets_call(self.transactions_sheet.get_all_values, kind='read', priority=PRIORITY_BACKGROUND)
+                remaining = {}
+                for rows in by_month.values():
+                    for row in rows:
+                        remaining[row_key(row)] = remaining.get(row_key(row), 0) + 1
+                archived_rows = set()
+                for row_number, row in enumerate(current[1:], start=2):
+                    key = row_key(row)
+                    if remaining.get(key):
+                        remaining[key] -= 1
+                        archived_rows.add(row_number)
+                # Bottom-up, so each deletion leaves the row numbers of the ranges above it valid
+                for first, last in reversed(contiguous_ranges(archived_rows)):
+                    self._sheets_call(self.transactions_sheet.delete_rows, first, last, priority=PRIORITY_BACKGROUND)
+                missing = sum(remaining.values())
+                if missing:
+                    logger.warning(f"{missing} archived TokenLog rows changed before they could be removed from the live partition")
+                self._index_pending(current[:1] + [row for row_number, row in enumerate(current[1:], start=2) if row_number not in archived_rows])
+            archived = len(archived_rows)
+            logger.info(f"Archived {archived} TokenLog rows into {len(by_month)} monthly partitions")
+            return archived
+        except Exception as e:
+            logger.error(f"Error archiving TokenLog rows: {e}")
+            return 0
+
+    def _run_archiver(self):
+        while True:
+            time.sleep(self._archive_interval)
+            self.archive_transactions()
+
+    def log_cleanup_submission(self, user_id, name, username, location, media_url):
+        try:
+            timestamp = datetime.now(timezone.utc).isoformat()
+            row = [str(user_id), name, username or "", location, media_url, timestamp, "Pending"]
+            self._sheets_call(self.cleanup_sheet.append_row, row, priority=PRIORITY_BACKGROUND)
+            logger.info(f"Logged cleanup submission for {user_id}")
+        except Exception as e:
+            logger.error(f"Error logging cleanup submission for {user_id}: {e}")
+
+    def append_ledger_events(self, events):
+        rows = [[event[field] for field in LEDGER_FIELDS] for event in events]
+        self._sheets_call(self.ledger_sheet.append_rows, rows, value_input_option='USER_ENTERED', priority=PRIORITY_BACKGROUND)
+        logger.info(f"Appended {len(rows)} ledger events")
+
+    def _ensure_progress_loaded(self):
+        with self._progress_lock:
+            if self._progress is None:
+                all_values = self._sheets_call(self.progress_sheet.get_all_values, kind='read')
+                progress = {}
+                for row_number, row in enumerate(all_values[1:], start=2):
+                    if row and str(row[0]).strip():
+                        progress[str(row[0])] = (row_number, dict(zip(QUIZ_PROGRESS_FIELDS, row)))
+                self._progress = progress
+                self._next_progress_row = max(len(all_values) + 1, 2)
+                logger.info(f"Loaded quiz progress for {len(progress)} players")
+
+    def load_quiz_progress(self, user_ids):
+        self._ensure_progress_loaded()
+        with self._progress_lock:
+            return {str(user_id): dict(self._progress[str(user_id)][1]) for user_id in user_ids if str(user_id) in self._progress}
+
+    def save_quiz_progress(self, records):
+        self._ensure_progress_loaded()
+        last_col = column_letter(len(QUIZ_PROGRESS_FIELDS))
+        with self._progress_lock:
+            updates, appends = [], []
+            for record in records:
+                values = [record[field] for field in QUIZ_PROGRESS_FIELDS]
+                row_number, _ = self._progress.get(str(record['user_id']), (None, None))
+                if row_number:
+                    updates.append({'range': f"A{row_number}:{last_col}{row_number}", 'values': [values]})
+                else:
+                    appends.append(record)
+        # RAW so the JSON question list is stored verbatim
+        if updates:
+            self._sheets_call(self.progress_sheet.batch_update, updates, value_input_option='RAW', priority=PRIORITY_BACKGROUND)
+        if appends:
+            response = self._sheets_call(
+                self.progress_sheet.append_rows, [[record[field] for field in QUIZ_PROGRESS_FIELDS] for record in appends],
+                value_input_option='RAW', priority=PRIORITY_BACKGROUND
+            )
+        with self._progress_lock:
+            first_row = self._appended_row_number(response, self._next_progress_row) if appends else None
+            for offset, record in enumerate(appends):
+                self._progress[str(record['user_id'])] = (first_row + offset, dict(record))
+            if appends:
+                self._next_progress_row = max(self._next_progress_row, first_row + len(appends))
+            for record in records:
+                row_number, _ = self._progress[str(record['user_id'])]
+                self._progress[str(record['user_id'])] = (row_number, dict(record))
+        logger.info(f"Saved quiz progress for {len(records)} players ({len(appends)} new)")
+
+    def get_ledger_events(self, user_id=None):
+        records = self._sheets_call(self.ledger_sheet.get_all_records, kind='read', priority=PRIORITY_ADMIN)
+        if user_id is None:
+            return records
+        return [record for record in records if str(record.get('user_id')) == str(user_id)]
+
+def create_storage():
+    """Build the storage backend selected by STORAGE_BACKEND (sheets, sqlite or emulator)"""
+    backend = os.getenv("STORAGE_BACKEND", "sheets").lower()
+    if backend == "emulator":
+        # In-memory spreadsheet with simulated latency and quotas, for offline runs and load measurements
+        from fake_gspread import FakeClient, create_learn_earn_spreadsheet
+        reads, writes = os.getenv("EMULATOR_READS_PER_MINUTE"), os.getenv("EMULATOR_WRITES_PER_MINUTE")
+        client = create_learn_earn_spreadsheet(FakeClient(
+            latency=float(os.getenv("EMULATOR_LATENCY", "0")),
+            reads_per_minute=int(reads) if reads else None,
+            writes_per_minute=int(writes) if writes else None
+        ))
+        return SheetManager(client=client, spreadsheet_id="emulated")
+    if backend == "sqlite":
+        from sqlite_storage import SQLiteStorage
+        storage = SQLiteStorage()
+        # Optionally keep the admins' spreadsheet view up to date in the background
+        if os.getenv("SHEET_MIRROR", "").lower() in ("1", "true", "yes"):
+            return MirroredStorage(storage, SheetManager())
+        return storage
+    return SheetManager()
+
 def log_cleanup_submission(user_id, name, username, location, media_url):
-    sheet_manager_instance.log_cleanup_submission(user_id, name, username, location, media_url)
+    get_sheet_manager().log_cleanup_submission(user_id, name, username, location, media_url)
 
-sheet_manager_instance = SheetManager()
+# Created on first use so importing this module doesn't authorise gspread or open the spreadsheet
+sheet_manager_instance = None
+_instance_lock = threading.Lock()
 
 def get_sheet_manager():
+    global sheet_manager_instance
+    if sheet_manager_instance is None:
+        with _instance_lock:
+            if sheet_manager_instance is None:
+                sheet_manager_instance = create_storage()
     return sheet_manager_instance
 
+# Reads below are memoised per Telegram update (request_context); writes keep that copy current
+
 def register_user(user_id, name, username, referrer_id):
-    sheet_manager_instance.register_user(user_id, name, username, referrer_id)
+    get_sheet_manager().register_user(user_id, name, username, referrer_id)
+    forget_user(user_id)
+
+def register_users(users, chunk_size=None):
+    return get_sheet_manager().register_users(users, chunk_size)
 
 def get_user_data(user_id):
-    return sheet_manager_instance.get_user_data(user_id)
+    return cached_user(user_id, lambda user_id: get_sheet_manager().get_user_data(user_id))
 
 def update_user_tokens_points(user_id, tokens, points):
-    sheet_manager_instance.update_user_tokens_points(user_id, tokens, points)
+    get_sheet_manager().update_user_tokens_points(user_id, tokens, points)
+    update_cached_user(user_id, Tokens=tokens, Points=points)
 
 def reward_referrer(referrer_id, tokens):
-    sheet_manager_instance.reward_referrer(referrer_id, tokens)
+    get_sheet_manager().reward_referrer(referrer_id, tokens)
+    forget_user(referrer_id)
 
 def log_token_purchase(user_id, transaction_id, amount, payment_method):
-    sheet_manager_instance.log_token_purchase(user_id, transaction_id, amount, payment_method)
+    get_sheet_manager().log_token_purchase(user_id, transaction_id, amount, payment_method)
 
 def increment_referral_count(referrer_id, referred_id):
-    sheet_manager_instance.increment_referral_count(referrer_id, referred_id)
+    get_sheet_manager().increment_referral_count(referrer_id, referred_id)
+    forget_user(referrer_id)
 
 def log_point_redemption(user_id, reward):
-    sheet_manager_instance.log_point_redemption(user_id, reward)
+    get_sheet_manager().log_point_redemption(user_id, reward)
 
 def update_user_momo(user_id, momo_number):
-    sheet_manager_instance.update_user_momo(user_id, momo_number)
+    get_sheet_manager().update_user_momo(user_id, momo_number)
+    update_cached_user(user_id, MoMoNumber=momo_number)
 
 def check_and_give_daily_reward(user_id):
-    return sheet_manager_instance.check_and_give_daily_reward(user_id)
+    result = get_sheet_manager().check_and_give_daily_reward(user_id)
+    forget_user(user_id)
+    return result
 
 def update_last_claim_date(user_id, date):
-    sheet_manager_instance.update_last_claim_date(user_id, date)
+    get_sheet_manager().update_last_claim_date(user_id, date)
+    update_cached_user(user_id, LastClaimDate=str(date))
 
 def get_all_users():
-    return sheet_manager_instance.get_all_users()
+    return get_sheet_manager().get_all_users()
 
 def get_pending_transactions():
-    return sheet_manager_instance.get_pending_transactions()
+    return get_sheet_manager().get_pending_transactions()
 
 def find_user_by_referral_code(referral_code):
-    return sheet_manager_instance.find_user_by_referral_code(referral_code)
+    user = get_sheet_manager().find_user_by_referral_code(referral_code)
+    remember_user(user)
+    return user
 
 def update_transaction_status(transaction_id, new_status):
-    sheet_manager_instance.update_transaction_status(transaction_id, new_status)
\ No newline at end of file
+    get_sheet_manager().update_transaction_status(transaction_id, new_status)
+
+def find_transaction(transaction_id):
+    return get_sheet_manager().find_transaction(transaction_id)
+
+def archive_transactions(before_month=None):
+    return get_sheet_manager().archive_transactions(before_month)
\ No newline at end of file
@@ -0,0 +1,96 @@
+def _to_str(value):
+    return str(value)
+
+def _to_amount(value):
+    # Same rule the original per-field parsing used: plain non-negative numbers only, else 0
+    text = str(value)
+    return float(text) if text.replace('.', '', 1).isdigit() else 0.0
+
+# field -> (default column, converter, value when the row is too short)
+USER_FIELDS = {
+    'UserID': (0, _to_str, ''),
+    'Name': (1, _to_str, 'Unknown'),
+    'Username': (2, _to_str, ''),
+    'Tokens': (3, _to_amount, 0.0),
+    'Points': (4, _to_amount, 0.0),
+    'MoMoNumber': (5, _to_str, ''),
+    'referral_code': (6, _to_str, None),
+    'ReferralEarnings': (7, _to_amount, 0.0),
+    # Column 9 has no header of its own: register_user writes the referrer there and the daily reward overwrites it
+    'LastClaimDate': (8, _to_str, ''),
+}
+
+def _match_header(header):
+    """Return the user field a header names, using the flexible matching rules"""
+    header_lower = str(header).lower().strip()
+    if 'userid' in header_lower or 'user_id' in header_lower:
+        return 'UserID'
+    elif 'name' in header_lower and 'user' not in header_lower:
+        return 'Name'
+    elif 'username' in header_lower:
+        return 'Username'
+    elif 'tokens' in header_lower:
+        return 'Tokens'
+    elif 'points' in header_lower:
+        return 'Points'
+    elif 'momo' in header_lower or 'mobile' in header_lower:
+        return 'MoMoNumber'
+    elif 'referral_code' in header_lower or 'referralcode' in header_lower:
+        return 'referral_code'
+    elif 'referralearnings' in header_lower or 'referral_earnings' in header_lower:
+        return 'ReferralEarnings'
+    return None
+
+class UserSheetSchema:
+    """Users-sheet header resolved once into a precompiled (field, index, converter) row decoder"""
+
+    def __init__(self, headers):
+        self.headers = tuple(str(header) for header in headers)
+        column_map = {field: index for field, (index, _, _) in USER_FIELDS.items()}
+        for i, header in enumerate(self.headers):
+            field = _match_header(header)
+            if field:
+                column_map[field] = i
+        self.column_map = column_map
+        self._fields = tuple(
+            (field, column_map[field], converter, default)
+            for field, (_, converter, default) in USER_FIELDS.items()
+        )
+        self._id_index = column_map['UserID']
+
+    def matches(self, headers):
+        """True if the header row is unchanged and this decoder can be reused"""
+        return self.headers == tuple(str(header) for header in headers)
+
+    def column(self, field):
+        """1-based sheet column of a field, for cell writes"""
+        return self.column_map[field] + 1
+
+    def user_id(self, row):
+        return str(row[self._id_index]).strip() if len(row) > self._id_index else ''
+
+    def decode(self, row):
+        size = len(row)
+        user = {
+            field: converter(row[index]) if index < size else default
+            for field, index, converter, default in self._fields
+        }
+        if user['referral_code'] is None:
+            user['referral_code'] = f"REF{user['UserID'][-6:]}"
+        return user
+
+    def decode_rows(self, rows, first_row=2):
+        """Yield (row number, user) for every row that has a UserID"""
+        for row_number, row in enumerate(rows, start=first_row):
+            if self.user_id(row):
+                yield row_number, self.decode(row)
+
+    def decode_fields(self, values, first_column, fields):
+        """Decode selected fields from a partial row that starts at sheet column first_column"""
+        size = len(values)
+        decoded = {}
+        for field in fields:
+            index = self.column_map[field] - (first_column - 1)
+            _, converter, default = USER_FIELDS[field]
+            decoded[field] = converter(values[index]) if 0 <= index < size else default
+        return decoded
@@ -0,0 +1,44 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class SheetWatcher:
+    """Poll the spreadsheet's Drive modified time and run a reconcile callback only when it changes"""
+
+    def __init__(self, spreadsheet, on_change, interval=30.0):
+        self.spreadsheet = spreadsheet
+        self.on_change = on_change
+        self.interval = interval
+        self.last_modified = None
+        self.checks = 0
+        self.reconciles = 0
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._run, name="sheet-watcher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.check()
+
+    def check(self):
+        """Reconcile if the spreadsheet changed since the last check; True if it did"""
+        try:
+            # Drive metadata call: one small request, not counted against the Sheets read quota
+            modified = self.spreadsheet.get_lastUpdateTime()
+            self.checks += 1
+            if modified == self.last_modified:
+                return False
+            self.last_modified = modified
+            self.on_change()
+            self.reconciles += 1
+            return True
+        except Exception as e:
+            logger.error(f"Error checking spreadsheet revision: {e}")
+            return False
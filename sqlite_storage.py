@@ -0,0 +1,368 @@
+import os
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+from storage_backend import StorageBackend, LEDGER_FIELDS, QUIZ_PROGRESS_FIELDS
+from user_locks import user_lock
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    name TEXT,
+    username TEXT,
+    tokens REAL NOT NULL DEFAULT 0,
+    points REAL NOT NULL DEFAULT 0,
+    momo_number TEXT NOT NULL DEFAULT '',
+    referral_code TEXT,
+    referral_earnings REAL NOT NULL DEFAULT 0,
+    referrer_id TEXT NOT NULL DEFAULT '',
+    last_claim_date TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_users_referral_code ON users (referral_code);
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    transaction_id TEXT NOT NULL,
+    amount REAL,
+    payment_method TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_transaction_id ON transactions (transaction_id);
+CREATE TABLE IF NOT EXISTS referrals (
+    referrer_id TEXT NOT NULL,
+    referred_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ledger (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    tokens_delta REAL NOT NULL DEFAULT 0,
+    points_delta REAL NOT NULL DEFAULT 0,
+    tokens_after REAL NOT NULL,
+    points_after REAL NOT NULL,
+    reason TEXT,
+    reference TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_ledger_user_id ON ledger (user_id);
+CREATE TABLE IF NOT EXISTS quiz_progress (
+    user_id TEXT PRIMARY KEY,
+    current_streak INTEGER NOT NULL DEFAULT 0,
+    best_streak INTEGER NOT NULL DEFAULT 0,
+    total_correct INTEGER NOT NULL DEFAULT 0,
+    total_questions INTEGER NOT NULL DEFAULT 0,
+    questions_until_bonus INTEGER NOT NULL DEFAULT 10,
+    skips_used INTEGER NOT NULL DEFAULT 0,
+    games_paused INTEGER NOT NULL DEFAULT 0,
+    used_questions TEXT NOT NULL DEFAULT '[]',
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS cleanup_submissions (
+    user_id TEXT NOT NULL,
+    name TEXT,
+    username TEXT,
+    location TEXT,
+    media_url TEXT,
+    timestamp TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'Pending'
+);
+"""
+
+# Column -> key used by get_user_data/get_all_users, matching the Google Sheet headers
+USER_COLUMNS = (
+    ('user_id', 'UserID'),
+    ('name', 'Name'),
+    ('username', 'Username'),
+    ('tokens', 'Tokens'),
+    ('points', 'Points'),
+    ('momo_number', 'MoMoNumber'),
+    ('referral_code', 'referral_code'),
+    ('referral_earnings', 'ReferralEarnings'),
+    ('last_claim_date', 'LastClaimDate'),
+)
+USER_SELECT = "SELECT " + ", ".join(column for column, _ in USER_COLUMNS) + " FROM users"
+
+class SQLiteStorage(StorageBackend):
+    """Local SQLite (WAL mode) implementation of the SheetManager API"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.getenv("SQLITE_DB_PATH", "learn_earn.db")
+        self._local = threading.local()
+        # SQLite allows a single writer; serialise writes in-process instead of hitting SQLITE_BUSY
+        self._write_lock = threading.Lock()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+        logger.info(f"Using SQLite storage at {self.db_path}")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, sql, params=()):
+        with self._write_lock:
+            conn = self._connection()
+            with conn:
+                return conn.execute(sql, params)
+
+    def _row_to_user(self, row):
+        user = {key: value for (_, key), value in zip(USER_COLUMNS, row)}
+        user['Username'] = user['Username'] or ''
+        user['Tokens'] = float(user['Tokens'] or 0)
+        user['Points'] = float(user['Points'] or 0)
+        user['ReferralEarnings'] = float(user['ReferralEarnings'] or 0)
+        user['referral_code'] = user['referral_code'] or f"REF{user['UserID'][-6:]}"
+        user['LastClaimDate'] = user['LastClaimDate'] or ''
+        return user
+
+    def register_user(self, user_id, name, username, referrer_id):
+        try:
+            referral_code = f"REF{str(user_id)[-6:]}"
+            cursor = self._write(
+                "INSERT OR IGNORE INTO users (user_id, name, username, tokens, points, referral_code, referrer_id) "
+                "VALUES (?, ?, ?, 3.0, 0.0, ?, ?)",
+                (str(user_id), name, username or "", referral_code, str(referrer_id or ""))
+            )
+            if cursor.rowcount:
+                logger.info(f"Registered user: {user_id}")
+        except Exception as e:
+            logger.error(f"Error registering user {user_id}: {e}")
+
+    def register_users(self, users, chunk_size=None):
+        chunk_size = chunk_size or int(os.getenv("BULK_IMPORT_CHUNK", "1000"))
+        rows = [
+            (str(user['user_id']).strip(), user.get('name') or 'Unknown', user.get('username') or "",
+             f"REF{str(user['user_id']).strip()[-6:]}", str(user.get('referrer_id') or ""))
+            for user in users if str(user['user_id']).strip()
+        ]
+        added = 0
+        try:
+            for start in range(0, len(rows), chunk_size):
+                with self._write_lock:
+                    conn = self._connection()
+                    with conn:
+                        before = conn.total_changes
+                        conn.executemany(
+                            "INSERT OR IGNORE INTO users (user_id, name, username, tokens, points, referral_code, referrer_id) "
+                            "VALUES (?, ?, ?, 3.0, 0.0, ?, ?)",
+                            rows[start:start + chunk_size]
+                        )
+                        added += conn.total_changes - before
+            logger.info(f"Bulk registered {added} of {len(rows)} users")
+        except Exception as e:
+            logger.error(f"Error bulk registering users after {added} of {len(rows)}: {e}")
+        return added
+
+    def get_user_data(self, user_id):
+        try:
+            row = self._connection().execute(USER_SELECT + " WHERE user_id = ?", (str(user_id),)).fetchone()
+            return self._row_to_user(row) if row else None
+        except Exception as e:
+            logger.error(f"Error fetching user data for {user_id}: {e}")
+            return None
+
+    def update_user_tokens_points(self, user_id, tokens, points):
+        try:
+            self._write("UPDATE users SET tokens = ?, points = ? WHERE user_id = ?", (float(tokens), float(points), str(user_id)))
+            logger.info(f"Updated tokens: {tokens}, points: {points} for user {user_id}")
+        except Exception as e:
+            logger.error(f"Error updating tokens/points for {user_id}: {e}")
+
+    def reward_referrer(self, referrer_id, tokens):
+        try:
+            # The increment is atomic in SQL, but must not land between TokenLedger.record's read and write
+            with user_lock(referrer_id):
+                self._write(
+                    "UPDATE users SET tokens = tokens + ?, referral_earnings = referral_earnings + ? WHERE user_id = ?",
+                    (float(tokens), float(tokens), str(referrer_id))
+                )
+            logger.info(f"Rewarded {tokens} tokens to referrer {referrer_id}")
+        except Exception as e:
+            logger.error(f"Error rewarding referrer {referrer_id}: {e}")
+
+    def log_token_purchase(self, user_id, transaction_id, amount, payment_method):
+        try:
+            timestamp = datetime.now(timezone.utc).isoformat()
+            self._write(
+                "INSERT INTO transactions (user_id, transaction_id, amount, payment_method, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (str(user_id), transaction_id, float(amount), payment_method or "N/A", timestamp)
+            )
+            logger.info(f"Logged token purchase for {user_id}: {amount} tokens")
+        except Exception as e:
+            logger.error(f"Error logging token purchase for {user_id}: {e}")
+
+    def increment_referral_count(self, referrer_id, referred_id):
+        try:
+            timestamp = datetime.now(timezone.utc).isoformat()
+            with self._write_lock:
+                conn = self._connection()
+                with conn:
+                    cursor = conn.execute("UPDATE users SET referral_earnings = referral_earnings + 1 WHERE user_id = ?", (str(referrer_id),))
+                    if cursor.rowcount:
+                        conn.execute("INSERT INTO referrals (referrer_id, referred_id, timestamp) VALUES (?, ?, ?)", (str(referrer_id), str(referred_id), timestamp))
+            logger.info(f"Incremented referral count for {referrer_id}")
+        except Exception as e:
+            logger.error(f"Error incrementing referral count for {referrer_id}: {e}")
+
+    def log_point_redemption(self, user_id, reward):
+        try:
+            timestamp = datetime.now(timezone.utc).isoformat()
+            self._write("INSERT INTO transactions (user_id, transaction_id, timestamp) VALUES (?, ?, ?)", (str(user_id), reward, timestamp))
+            logger.info(f"Logged point redemption for {user_id}: {reward}")
+        except Exception as e:
+            logger.error(f"Error logging point redemption for {user_id}: {e}")
+
+    def update_user_momo(self, user_id, momo_number):
+        try:
+            self._write("UPDATE users SET momo_number = ? WHERE user_id = ?", (str(momo_number), str(user_id)))
+            logger.info(f"Updated MoMo number for {user_id}: {momo_number}")
+        except Exception as e:
+            logger.error(f"Error updating MoMo number for {user_id}: {e}")
+
+    def check_and_give_daily_reward(self, user_id):
+        try:
+            today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+            with user_lock(user_id), self._write_lock:
+                conn = self._connection()
+                with conn:
+                    cursor = conn.execute(
+                        "UPDATE users SET tokens = tokens + 1, last_claim_date = ? WHERE user_id = ? AND last_claim_date != ?",
+                        (today, str(user_id), today)
+                    )
+                    row = conn.execute("SELECT tokens FROM users WHERE user_id = ?", (str(user_id),)).fetchone()
+            if not row:
+                return False, 0
+            if cursor.rowcount:
+                logger.info(f"Daily reward of 1 token given to {user_id}")
+                return True, float(row[0])
+            return False, float(row[0])
+        except Exception as e:
+            logger.error(f"Error checking daily reward for {user_id}: {e}")
+            return False, 0
+
+    def update_last_claim_date(self, user_id, date):
+        try:
+            self._write("UPDATE users SET last_claim_date = ? WHERE user_id = ?", (str(date), str(user_id)))
+            logger.info(f"Updated last claim date for {user_id}: {date}")
+        except Exception as e:
+            logger.error(f"Error updating last claim date for {user_id}: {e}")
+
+    def get_all_users(self):
+        try:
+            return [self._row_to_user(row) for row in self._connection().execute(USER_SELECT)]
+        except Exception as e:
+            logger.error(f"Error fetching all users: {e}")
+            return []
+
+    def get_pending_transactions(self):
+        try:
+            rows = self._connection().execute(
+                "SELECT user_id, transaction_id, amount, payment_method, timestamp FROM transactions WHERE transaction_id LIKE 'PENDING%'"
+            ).fetchall()
+            return [
+                {'user_id': user_id, 'transaction_id': transaction_id, 'amount': amount, 'payment_method': payment_method, 'timestamp': timestamp}
+                for user_id, transaction_id, amount, payment_method, timestamp in rows
+            ]
+        except Exception as e:
+            logger.error(f"Error fetching pending transactions: {e}")
+            return []
+
+    def get_users_data(self, user_ids):
+        try:
+            ids = [str(user_id) for user_id in user_ids]
+            if not ids:
+                return {}
+            rows = self._connection().execute(USER_SELECT + f" WHERE user_id IN ({', '.join('?' for _ in ids)})", ids).fetchall()
+            return {user['UserID']: user for user in map(self._row_to_user, rows)}
+        except Exception as e:
+            logger.error(f"Error fetching users {user_ids}: {e}")
+            return {}
+
+    def find_user_by_referral_code(self, referral_code):
+        try:
+            row = self._connection().execute(USER_SELECT + " WHERE referral_code = ?", (str(referral_code),)).fetchone()
+            return self._row_to_user(row) if row else None
+        except Exception as e:
+            logger.error(f"Error finding user by referral code {referral_code}: {e}")
+            return None
+
+    def update_transaction_status(self, transaction_id, new_status):
+        try:
+            self._write(
+                "UPDATE transactions SET transaction_id = ? WHERE id = (SELECT MIN(id) FROM transactions WHERE transaction_id = ?)",
+                (str(new_status), str(transaction_id))
+            )
+            logger.info(f"Updated transaction {transaction_id} to {new_status}")
+        except Exception as e:
+            logger.error(f"Error updating transaction status for {transaction_id}: {e}")
+
+    def find_transaction(self, transaction_id):
+        try:
+            row = self._connection().execute(
+                "SELECT user_id, transaction_id, amount, payment_method, timestamp FROM transactions WHERE transaction_id = ? ORDER BY id LIMIT 1",
+                (str(transaction_id),)
+            ).fetchone()
+            if not row:
+                return None
+            user_id, transaction_id, amount, payment_method, timestamp = row
+            return {'user_id': user_id, 'transaction_id': transaction_id, 'amount': amount, 'payment_method': payment_method, 'timestamp': timestamp}
+        except Exception as e:
+            logger.error(f"Error finding transaction {transaction_id}: {e}")
+            return None
+
+    def log_cleanup_submission(self, user_id, name, username, location, media_url):
+        try:
+            timestamp = datetime.now(timezone.utc).isoformat()
+            self._write(
+                "INSERT INTO cleanup_submissions (user_id, name, username, location, media_url, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(user_id), name, username or "", location, media_url, timestamp)
+            )
+            logger.info(f"Logged cleanup submission for {user_id}")
+        except Exception as e:
+            logger.error(f"Error logging cleanup submission for {user_id}: {e}")
+
+    def append_ledger_events(self, events):
+        with self._write_lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO ledger ({', '.join(LEDGER_FIELDS)}) VALUES ({', '.join('?' for _ in LEDGER_FIELDS)})",
+                    [tuple(event[field] for field in LEDGER_FIELDS) for event in events]
+                )
+
+    def get_ledger_events(self, user_id=None):
+        sql = f"SELECT {', '.join(LEDGER_FIELDS)} FROM ledger"
+        params = ()
+        if user_id is not None:
+            sql += " WHERE user_id = ?"
+            params = (str(user_id),)
+        rows = self._connection().execute(sql + " ORDER BY id", params).fetchall()
+        return [dict(zip(LEDGER_FIELDS, row)) for row in rows]
+
+    def load_quiz_progress(self, user_ids):
+        ids = [str(user_id) for user_id in user_ids]
+        if not ids:
+            return {}
+        rows = self._connection().execute(
+            f"SELECT {', '.join(QUIZ_PROGRESS_FIELDS)} FROM quiz_progress WHERE user_id IN ({', '.join('?' for _ in ids)})", ids
+        ).fetchall()
+        return {row[0]: dict(zip(QUIZ_PROGRESS_FIELDS, row)) for row in rows}
+
+    def save_quiz_progress(self, records):
+        updates = ', '.join(f"{field} = excluded.{field}" for field in QUIZ_PROGRESS_FIELDS[1:])
+        with self._write_lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO quiz_progress ({', '.join(QUIZ_PROGRESS_FIELDS)}) VALUES ({', '.join('?' for _ in QUIZ_PROGRESS_FIELDS)}) "
+                    f"ON CONFLICT(user_id) DO UPDATE SET {updates}",
+                    [tuple(record[field] for field in QUIZ_PROGRESS_FIELDS) for record in records]
+                )
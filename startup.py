@@ -0,0 +1,76 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class StartupWarmUp:
+    """Initialise slow singletons in the background and record how long each step took"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._steps = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _run_step(self, name, func):
+        started = time.time()
+        with self._lock:
+            self._steps[name] = {'status': 'running', 'seconds': None}
+        try:
+            func()
+            status = 'ok'
+        except Exception as e:
+            logger.error(f"Warm-up step {name} failed: {e}")
+            status = f"error: {e}"
+        elapsed = round(time.time() - started, 3)
+        with self._lock:
+            self._steps[name] = {'status': status, 'seconds': elapsed}
+        logger.info(f"Warm-up step {name}: {status} ({elapsed:.2f}s)")
+
+    def _run(self, steps):
+        for name, func in steps:
+            self._run_step(name, func)
+        logger.info(f"Warm-up finished {time.time() - self.started_at:.2f}s after start")
+
+    def start(self, steps):
+        """Run (name, callable) steps in order on a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return self._thread
+        self._thread = threading.Thread(target=self._run, args=(steps,), name="startup-warm-up", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def report(self):
+        with self._lock:
+            steps = {name: dict(step) for name, step in self._steps.items()}
+        return {
+            'uptime_seconds': round(time.time() - self.started_at, 3),
+            'ready': bool(steps) and all(step['status'] == 'ok' for step in steps.values()),
+            'steps': steps,
+        }
+
+startup_warm_up = StartupWarmUp()
+
+def _warm_storage():
+    from sheet_manager import get_sheet_manager
+    get_sheet_manager().warm_up()
+
+def _warm_exchange_rate():
+    from exchange_rate_service import start_rate_updater
+    start_rate_updater()
+
+def _warm_translator():
+    from translation_service import translation_service
+    translation_service.translator
+
+def start_warm_up(rate_updater=True):
+    """Warm up in the background; the asyncio runtime runs its own rate updater, so it passes rate_updater=False"""
+    steps = [('storage', _warm_storage)]
+    if rate_updater:
+        steps.append(('exchange_rate', _warm_exchange_rate))
+    steps.append(('translator', _warm_translator))
+    return startup_warm_up.start(steps)
+
+def startup_report():
+    return startup_warm_up.report()
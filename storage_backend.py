@@ -0,0 +1,260 @@
+import abc
+import queue
+import logging
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Column order of a token ledger event, shared by the Ledger worksheet and the SQLite ledger table
+LEDGER_FIELDS = ["timestamp", "user_id", "tokens_delta", "points_delta", "tokens_after", "points_after", "reason", "reference"]
+
+# Column order of a persisted quiz progress record, shared by the QuizProgress worksheet and the SQLite quiz_progress table
+QUIZ_PROGRESS_FIELDS = [
+    "user_id", "current_streak", "best_streak", "total_correct", "total_questions",
+    "questions_until_bonus", "skips_used", "games_paused", "used_questions", "updated_at"
+]
+
+class StorageBackend(abc.ABC):
+    """Interface shared by the bot's datastores (Google Sheets, SQLite)"""
+
+    @abc.abstractmethod
+    def register_user(self, user_id, name, username, referrer_id):
+        pass
+
+    def register_users(self, users, chunk_size=None):
+        """Register many users ({user_id, name, username, referrer_id} dicts), skipping known IDs; returns the count added"""
+        added = 0
+        for user in users:
+            if not self.get_user_data(user['user_id']):
+                self.register_user(user['user_id'], user.get('name') or 'Unknown', user.get('username'), user.get('referrer_id'))
+                added += 1
+        return added
+
+    @abc.abstractmethod
+    def get_user_data(self, user_id):
+        pass
+
+    @abc.abstractmethod
+    def update_user_tokens_points(self, user_id, tokens, points):
+        pass
+
+    @abc.abstractmethod
+    def reward_referrer(self, referrer_id, tokens):
+        pass
+
+    @abc.abstractmethod
+    def log_token_purchase(self, user_id, transaction_id, amount, payment_method):
+        pass
+
+    @abc.abstractmethod
+    def increment_referral_count(self, referrer_id, referred_id):
+        pass
+
+    @abc.abstractmethod
+    def log_point_redemption(self, user_id, reward):
+        pass
+
+    @abc.abstractmethod
+    def update_user_momo(self, user_id, momo_number):
+        pass
+
+    @abc.abstractmethod
+    def check_and_give_daily_reward(self, user_id):
+        pass
+
+    @abc.abstractmethod
+    def update_last_claim_date(self, user_id, date):
+        pass
+
+    @abc.abstractmethod
+    def get_all_users(self):
+        pass
+
+    @abc.abstractmethod
+    def get_pending_transactions(self):
+        pass
+
+    def get_users_data(self, user_ids):
+        """Resolve several users at once: {user_id: user} for the ones that exist"""
+        users = {}
+        for user_id in user_ids:
+            user = self.get_user_data(user_id)
+            if user:
+                users[str(user_id)] = user
+        return users
+
+    @abc.abstractmethod
+    def find_user_by_referral_code(self, referral_code):
+        pass
+
+    @abc.abstractmethod
+    def update_transaction_status(self, transaction_id, new_status):
+        pass
+
+    @abc.abstractmethod
+    def find_transaction(self, transaction_id):
+        """Return a logged transaction record by ID, or None"""
+
+    def archive_transactions(self, before_month=None):
+        """Move settled transactions older than before_month out of the live log; returns the count moved"""
+        return 0
+
+    @abc.abstractmethod
+    def log_cleanup_submission(self, user_id, name, username, location, media_url):
+        pass
+
+    @abc.abstractmethod
+    def append_ledger_events(self, events):
+        """Append token ledger events (dicts keyed by LEDGER_FIELDS)"""
+
+    @abc.abstractmethod
+    def get_ledger_events(self, user_id=None):
+        pass
+
+    @abc.abstractmethod
+    def load_quiz_progress(self, user_ids):
+        """{user_id: record keyed by QUIZ_PROGRESS_FIELDS} for the users that have saved progress"""
+
+    @abc.abstractmethod
+    def save_quiz_progress(self, records):
+        """Insert or replace quiz progress records (dicts keyed by QUIZ_PROGRESS_FIELDS)"""
+
+    def flush_writes(self):
+        """Push any buffered writes to the underlying store"""
+        return 0
+
+    def warm_up(self):
+        """Preload caches ahead of the first request"""
+
+class MirroredStorage(StorageBackend):
+    """Serve everything from a primary backend and replay writes onto a mirror in the background"""
+
+    def __init__(self, primary, mirror, max_queue=10000):
+        self.primary = primary
+        self.mirror = mirror
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="storage-mirror", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            method_name, args = self._queue.get()
+            try:
+                getattr(self.mirror, method_name)(*args)
+            except Exception as e:
+                logger.error(f"Error mirroring {method_name}{args}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _enqueue(self, method_name, *args):
+        try:
+            self._queue.put_nowait((method_name, args))
+        except queue.Full:
+            logger.error(f"Mirror queue full, dropping {method_name}{args}")
+
+    def mirror_backlog(self):
+        return self._queue.qsize()
+
+    def register_user(self, user_id, name, username, referrer_id):
+        self.primary.register_user(user_id, name, username, referrer_id)
+        self._enqueue('register_user', user_id, name, username, referrer_id)
+
+    def register_users(self, users, chunk_size=None):
+        users = list(users)
+        added = self.primary.register_users(users, chunk_size)
+        self._enqueue('register_users', users, chunk_size)
+        return added
+
+    def get_user_data(self, user_id):
+        return self.primary.get_user_data(user_id)
+
+    def update_user_tokens_points(self, user_id, tokens, points):
+        self.primary.update_user_tokens_points(user_id, tokens, points)
+        self._enqueue('update_user_tokens_points', user_id, tokens, points)
+
+    def reward_referrer(self, referrer_id, tokens):
+        self.primary.reward_referrer(referrer_id, tokens)
+        self._enqueue('reward_referrer', referrer_id, tokens)
+
+    def log_token_purchase(self, user_id, transaction_id, amount, payment_method):
+        self.primary.log_token_purchase(user_id, transaction_id, amount, payment_method)
+        self._enqueue('log_token_purchase', user_id, transaction_id, amount, payment_method)
+
+    def increment_referral_count(self, referrer_id, referred_id):
+        self.primary.increment_referral_count(referrer_id, referred_id)
+        self._enqueue('increment_referral_count', referrer_id, referred_id)
+
+    def log_point_redemption(self, user_id, reward):
+        self.primary.log_point_redemption(user_id, reward)
+        self._enqueue('log_point_redemption', user_id, reward)
+
+    def update_user_momo(self, user_id, momo_number):
+        self.primary.update_user_momo(user_id, momo_number)
+        self._enqueue('update_user_momo', user_id, momo_number)
+
+    def check_and_give_daily_reward(self, user_id):
+        rewarded, tokens = self.primary.check_and_give_daily_reward(user_id)
+        if rewarded:
+            # Mirror the outcome rather than re-deciding the claim against the mirror's state
+            user = self.primary.get_user_data(user_id)
+            if user:
+                self._enqueue('update_user_tokens_points', user_id, user['Tokens'], user['Points'])
+            self._enqueue('update_last_claim_date', user_id, datetime.now(timezone.utc).strftime("%Y-%m-%d"))
+        return rewarded, tokens
+
+    def update_last_claim_date(self, user_id, date):
+        self.primary.update_last_claim_date(user_id, date)
+        self._enqueue('update_last_claim_date', user_id, date)
+
+    def get_all_users(self):
+        return self.primary.get_all_users()
+
+    def get_pending_transactions(self):
+        return self.primary.get_pending_transactions()
+
+    def get_users_data(self, user_ids):
+        return self.primary.get_users_data(user_ids)
+
+    def find_user_by_referral_code(self, referral_code):
+        return self.primary.find_user_by_referral_code(referral_code)
+
+    def update_transaction_status(self, transaction_id, new_status):
+        self.primary.update_transaction_status(transaction_id, new_status)
+        self._enqueue('update_transaction_status', transaction_id, new_status)
+
+    def find_transaction(self, transaction_id):
+        return self.primary.find_transaction(transaction_id)
+
+    def archive_transactions(self, before_month=None):
+        archived = self.primary.archive_transactions(before_month)
+        self._enqueue('archive_transactions', before_month)
+        return archived
+
+    def log_cleanup_submission(self, user_id, name, username, location, media_url):
+        self.primary.log_cleanup_submission(user_id, name, username, location, media_url)
+        self._enqueue('log_cleanup_submission', user_id, name, username, location, media_url)
+
+    def append_ledger_events(self, events):
+        self.primary.append_ledger_events(events)
+        self._enqueue('append_ledger_events', events)
+
+    def get_ledger_events(self, user_id=None):
+        return self.primary.get_ledger_events(user_id)
+
+    def load_quiz_progress(self, user_ids):
+        return self.primary.load_quiz_progress(user_ids)
+
+    def save_quiz_progress(self, records):
+        self.primary.save_quiz_progress(records)
+        self._enqueue('save_quiz_progress', records)
+
+    def flush_writes(self):
+        return self.primary.flush_writes()
+
+    def warm_up(self):
+        self.primary.warm_up()
+
+    def __getattr__(self, name):
+        # Backend-specific extras (e.g. SheetManager.spreadsheet) come from the primary
+        return getattr(self.primary, name)
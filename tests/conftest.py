@@ -0,0 +1,16 @@
+import pytest
+from fake_gspread import FakeClient, create_learn_earn_spreadsheet
+from quota_scheduler import QuotaScheduler
+
+@pytest.fixture
+def sheets(monkeypatch, tmp_path):
+    """SheetManager on an emulated spreadsheet, with background flushing, watching and archiving off"""
+    monkeypatch.setenv("SHEET_WATCH_INTERVAL", "0")
+    monkeypatch.setenv("SHEET_FLUSH_INTERVAL", "3600")
+    monkeypatch.setenv("TOKENLOG_ARCHIVE_INTERVAL", "0")
+    monkeypatch.setenv("TRANSACTION_INDEX_PATH", str(tmp_path / "transaction_index.json"))
+    import sheet_manager
+    # A scheduler of its own, so one test's calls don't use up the quota of the next
+    monkeypatch.setattr(sheet_manager, 'quota_scheduler', QuotaScheduler(reads_per_minute=6000, writes_per_minute=6000))
+    client = create_learn_earn_spreadsheet(FakeClient())
+    return sheet_manager.SheetManager(client=client, spreadsheet_id="emulated")
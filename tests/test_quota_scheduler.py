@@ -0,0 +1,85 @@
+import time
+import threading
+import pytest
+from fake_gspread import QuotaExceeded
+from quota_scheduler import QuotaScheduler, TokenBucket, PRIORITY_USER, PRIORITY_BACKGROUND, PRIORITY_ADMIN
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(600, capacity=2)  # 10 per second
+    assert bucket.try_take() and bucket.try_take()
+    assert not bucket.try_take()
+    assert 0.05 < bucket.wait_time() <= 0.1
+    time.sleep(0.11)
+    assert bucket.wait_time() == 0.0
+    assert bucket.try_take()
+
+def test_acquire_waits_for_a_refill_and_times_out_without_one():
+    scheduler = QuotaScheduler(reads_per_minute=600, writes_per_minute=600)
+    scheduler._buckets['read'].drain()
+    assert not scheduler.acquire('read', timeout=0.02)
+    started = time.monotonic()
+    assert scheduler.acquire('read', timeout=1)
+    assert 0.05 < time.monotonic() - started < 0.5
+    assert scheduler.admitted == {'read': 1, 'write': 0}
+
+def test_higher_priority_waiters_are_admitted_first():
+    scheduler = QuotaScheduler(reads_per_minute=600, writes_per_minute=600)
+    scheduler._buckets['read'].drain()
+    admitted = []
+
+    def wait(priority):
+        scheduler.acquire('read', priority=priority, timeout=5)
+        admitted.append(priority)
+
+    threads = []
+    # Queued lowest priority first, so arrival order alone would admit them the other way round
+    for priority in (PRIORITY_ADMIN, PRIORITY_BACKGROUND, PRIORITY_USER):
+        thread = threading.Thread(target=wait, args=(priority,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+    assert admitted == [PRIORITY_USER, PRIORITY_BACKGROUND, PRIORITY_ADMIN]
+
+def test_reads_and_writes_have_separate_budgets():
+    scheduler = QuotaScheduler(reads_per_minute=1, writes_per_minute=60)
+    assert scheduler.has_budget('read')
+    assert scheduler.acquire('read', timeout=0)
+    assert not scheduler.has_budget('read')
+    assert scheduler.has_budget('write', reserve=10)
+    assert not scheduler.has_budget('write', reserve=60)
+
+def test_call_requeues_when_google_still_reports_quota_exceeded():
+    scheduler = QuotaScheduler(reads_per_minute=6000, writes_per_minute=6000)
+    attempts = []
+
+    def flaky_read():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise QuotaExceeded("APIError: [429]: Quota exceeded for quota metric 'Read requests'")
+        return 'values'
+
+    assert scheduler.call(flaky_read, kind='read') == 'values'
+    assert len(attempts) == 2
+    # The bucket was emptied, so the retry waited for a refill
+    assert attempts[1] - attempts[0] >= 0.005
+
+def test_call_gives_up_when_the_queue_wait_times_out():
+    scheduler = QuotaScheduler(reads_per_minute=1, writes_per_minute=1, max_wait=0.01)
+    scheduler._buckets['write'].drain()
+    with pytest.raises(Exception, match="Timed out waiting for Google Sheets write quota"):
+        scheduler.call(lambda: None, kind='write')
+    assert scheduler.rejected['write'] == 1
+
+def test_other_errors_are_not_retried():
+    scheduler = QuotaScheduler()
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise ValueError("bad range")
+
+    with pytest.raises(ValueError):
+        scheduler.call(broken)
+    assert len(calls) == 1
@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+import pytest
+from router import Router
+
+def message(text, chat_id=1):
+    return SimpleNamespace(text=text, chat=SimpleNamespace(id=chat_id))
+
+def callback(data, chat_id=1):
+    return SimpleNamespace(data=data, message=SimpleNamespace(chat=SimpleNamespace(id=chat_id)), from_user=SimpleNamespace(id=chat_id))
+
+@pytest.fixture
+def router():
+    router = Router()
+    calls = router.calls = []
+
+    def handler(name):
+        def handle(update):
+            calls.append(name)
+        handle.__name__ = name
+        return handle
+
+    router.command('start')(handler('start'))
+    router.command('admin', guard=lambda chat_id: chat_id == 99)(handler('admin'))
+    router.text('💰 Buy Tokens')(handler('buy_tokens'))
+    router.text('🔧 Admin', guard=lambda chat_id: chat_id == 99)(handler('admin_menu'))
+    router.state('awaiting_momo')(handler('momo'))
+    router.callback('pause_game')(handler('pause'))
+    router.callback('buy:custom')(handler('buy_custom'))
+    router.callback_prefix('buy:')(handler('buy_package'))
+    return router
+
+def test_commands_texts_and_callbacks_route_by_exact_match(router):
+    assert router.dispatch_message(message('/start'))
+    assert router.dispatch_message(message('/start@LearnEarnBot REF000001'))
+    assert router.dispatch_message(message('💰 Buy Tokens'))
+    assert router.dispatch_callback(callback('pause_game'))
+    assert router.calls == ['start', 'start', 'buy_tokens', 'pause']
+
+def test_conversation_state_takes_any_text_but_not_commands(router):
+    router.set_state(1, 'awaiting_momo', attempt=1)
+    assert router.get_state(1) == ('awaiting_momo', {'attempt': 1})
+    router.dispatch_message(message('0244123456'))
+    router.dispatch_message(message('💰 Buy Tokens'))
+    router.dispatch_message(message('/start'))
+    # Other chats are unaffected
+    router.dispatch_message(message('💰 Buy Tokens', chat_id=2))
+    assert router.calls == ['momo', 'momo', 'start', 'buy_tokens']
+
+    router.clear_state(1)
+    assert router.get_state(1) == (None, None)
+    router.dispatch_message(message('💰 Buy Tokens'))
+    assert router.calls[-1] == 'buy_tokens'
+
+def test_unknown_commands_fall_through_to_the_state(router):
+    router.set_state(1, 'awaiting_momo')
+    router.dispatch_message(message('/unknown'))
+    assert router.calls == ['momo']
+
+def test_exact_callback_data_wins_over_a_prefix(router):
+    router.dispatch_callback(callback('buy:custom'))
+    router.dispatch_callback(callback('buy:50'))
+    assert router.calls == ['buy_custom', 'buy_package']
+
+def test_guards_and_unrouted_updates(router):
+    assert not router.dispatch_message(message('🔧 Admin'))
+    assert not router.dispatch_message(message('/admin'))
+    assert router.dispatch_message(message('🔧 Admin', chat_id=99))
+    assert not router.dispatch_message(message('hello'))
+    assert not router.dispatch_message(message(None))
+    assert not router.dispatch_callback(callback('unknown'))
+    assert not router.dispatch_callback(callback('sell:5'))
+    assert router.calls == ['admin_menu']
+
+def test_callback_prefixes_must_end_with_a_colon(router):
+    with pytest.raises(ValueError):
+        router.callback_prefix('buy')
+
+def test_install_registers_one_catch_all_handler_per_update_type(router):
+    registered = {}
+
+    class Bot:
+        def message_handler(self, func):
+            return lambda handler: registered.setdefault('message', (func, handler))
+
+        def callback_query_handler(self, func):
+            return lambda handler: registered.setdefault('callback', (func, handler))
+
+    router.install(Bot())
+    lookups = []
+    route_message = router.route_message
+    router.route_message = lambda update: lookups.append(update.text) or route_message(update)
+
+    accepts, handle = registered['message']
+    update = message('💰 Buy Tokens')
+    assert accepts(update)
+    handle(update)
+    assert lookups == ['💰 Buy Tokens']
+    assert router.calls == ['buy_tokens']
+
+    accepts, handle = registered['callback']
+    assert accepts(callback('unknown'))
+    assert handle(callback('unknown')) is False
+
+def test_stats(router):
+    router.set_state(1, 'awaiting_momo')
+    assert router.stats() == {
+        'commands': 2, 'texts': 2, 'states': 1, 'callbacks': 2, 'callback_prefixes': 1, 'chats_in_conversation': 1,
+    }
@@ -0,0 +1,131 @@
+import time
+import threading
+from request_context import request_scope
+from send_queue import OutboundQueue, PRIORITY_BULK
+
+class TelegramError(Exception):
+    def __init__(self, error_code, description, retry_after=None):
+        super().__init__(description)
+        self.error_code = error_code
+        self.description = description
+        self.result_json = {'parameters': {'retry_after': retry_after}} if retry_after is not None else {}
+
+class Bot:
+    """Records sends; the first send blocks until released so later ones queue up behind it"""
+
+    def __init__(self, failures=()):
+        self.sent = []
+        self.failures = list(failures)
+        self.release = threading.Event()
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self._lock:
+            self.calls += 1
+            first = self.calls == 1
+            failure = self.failures.pop(0) if self.failures else None
+        if first:
+            self.release.wait(5)
+        if failure:
+            raise failure
+        with self._lock:
+            self.sent.append((chat_id, text, kwargs.get('reply_markup')))
+        return 'ok'
+
+def wait_for(outcomes, count):
+    """Callbacks run after a send leaves the queue, so drain() can return just before them"""
+    deadline = time.monotonic() + 5
+    while len(outcomes) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return outcomes
+
+def queue_for(bot, **kwargs):
+    return OutboundQueue(bot, messages_per_second=1000, per_chat_per_second=1000, per_chat_burst=100, workers=kwargs.pop('workers', 1), **kwargs)
+
+def test_texts_for_the_same_update_are_merged():
+    bot = Bot()
+    outbox = queue_for(bot)
+    outbox.send_message(1, "first")
+    with request_scope(1):
+        outbox.send_message(1, "a")
+        outbox.send_message(1, "b")
+        outbox.send_message(1, "c", reply_markup='{"keyboard":[]}')
+    bot.release.set()
+    assert outbox.drain(5)
+    assert bot.sent == [(1, "first", None), (1, "a\n\nb", None), (1, "c", '{"keyboard":[]}')]
+    assert outbox.stats()['merged'] == 1
+
+def test_texts_for_different_updates_are_not_merged():
+    bot = Bot()
+    outbox = queue_for(bot)
+    outbox.send_message(1, "first")
+    with request_scope(1):
+        outbox.send_message(1, "Enter your MoMo number:")
+    with request_scope(1):
+        outbox.send_message(1, "✅ MoMo number saved!")
+    outbox.send_message(1, "outside any update")
+    outbox.send_message(1, "outside again")
+    bot.release.set()
+    assert outbox.drain(5)
+    assert [text for _, text, _ in bot.sent] == [
+        "first", "Enter your MoMo number:", "✅ MoMo number saved!", "outside any update", "outside again"
+    ]
+    assert outbox.stats()['merged'] == 0
+
+def test_messages_with_callbacks_or_other_priorities_are_not_merged():
+    bot = Bot()
+    outbox = queue_for(bot)
+    outcomes = []
+    outbox.send_message(1, "first")
+    with request_scope(1):
+        outbox.send_message(1, "a")
+        outbox.send_message(1, "b", priority=PRIORITY_BULK)
+        outbox.send_message(1, "c", callback=lambda result, error: outcomes.append((result, error)))
+    bot.release.set()
+    assert outbox.drain(5)
+    assert [text for _, text, _ in bot.sent] == ["first", "a", "b", "c"]
+    assert wait_for(outcomes, 1) == [('ok', None)]
+
+def test_rate_limited_sends_are_retried_after_retry_after():
+    bot = Bot(failures=[None, TelegramError(429, "Too Many Requests", retry_after=0.05)])
+    bot.release.set()
+    outbox = queue_for(bot)
+    outcomes = []
+    outbox.send_message(1, "hello")
+    outbox.send_message(2, "world", callback=lambda result, error: outcomes.append(error))
+    assert outbox.drain(5)
+    assert sorted(text for _, text, _ in bot.sent) == ["hello", "world"]
+    assert wait_for(outcomes, 1) == [None]
+    stats = outbox.stats()
+    assert stats['retried'] == 1
+    assert stats['failed'] == 0
+
+def test_sends_are_given_up_after_max_attempts_or_other_errors():
+    blocked = TelegramError(403, "Forbidden: bot was blocked by the user")
+    rate_limited = [TelegramError(429, "Too Many Requests", retry_after=0.01) for _ in range(3)]
+    bot = Bot(failures=[None] + rate_limited + [blocked])
+    bot.release.set()
+    outbox = queue_for(bot, max_attempts=3)
+    outcomes = []
+    outbox.send_message(1, "ok")
+    outbox.send_message(2, "limited", callback=lambda result, error: outcomes.append(('limited', error)))
+    wait_for(outcomes, 1)
+    outbox.send_message(3, "blocked", callback=lambda result, error: outcomes.append(('blocked', error)))
+    assert outbox.drain(5)
+    assert wait_for(outcomes, 2) == [('limited', rate_limited[2]), ('blocked', blocked)]
+    assert bot.sent == [(1, "ok", None)]
+    stats = outbox.stats()
+    assert stats['retried'] == 2
+    assert stats['failed'] == 2
+
+def test_each_chat_keeps_its_order_across_workers():
+    bot = Bot()
+    bot.release.set()
+    outbox = queue_for(bot, workers=4)
+    for i in range(20):
+        for chat_id in (1, 2, 3):
+            outbox.send_message(chat_id, str(i), callback=lambda result, error: None)
+    assert outbox.drain(5)
+    for chat_id in (1, 2, 3):
+        assert [text for sent_to, text, _ in bot.sent if sent_to == chat_id] == [str(i) for i in range(20)]
@@ -0,0 +1,101 @@
+from transaction_archive import TransactionIndex, contiguous_ranges, partition_title, row_key, row_month
+
+def purchase(user_id, transaction_id, timestamp, amount=5):
+    return [str(user_id), transaction_id, amount, 'MoMo', timestamp]
+
+def seed(sheets, rows):
+    header = ["user_id", "transaction_id", "amount", "payment_method", "timestamp"]
+    sheets.transactions_sheet.load([header] + rows)
+    sheets._load_pending_transactions()
+
+def record_deletes(worksheet):
+    deletes = []
+    original = worksheet.delete_rows
+
+    def delete_rows(start_index, end_index=None):
+        deletes.append((start_index, end_index))
+        original(start_index, end_index)
+
+    worksheet.delete_rows = delete_rows
+    return deletes
+
+def test_helpers():
+    assert contiguous_ranges([7, 2, 3, 4, 9, 10]) == [(2, 4), (7, 7), (9, 10)]
+    assert contiguous_ranges([]) == []
+    assert row_key(['1', 'x', '', '']) == ('1', 'x')
+    assert row_month(['1', 'Airtime', '2026-08-05T10:00:00+00:00']) == '2026-08'
+    assert row_month(['1', 'x', 5, 'MoMo', '']) is None
+    assert partition_title('2026-08') == 'TokenLog 2026-08'
+
+def test_transaction_index_persists(tmp_path):
+    path = tmp_path / "index.json"
+    TransactionIndex(str(path)).add({'APPROVED_1': ('2026-08', 2)})
+    index = TransactionIndex(str(path))
+    assert index.get('APPROVED_1') == ('2026-08', 2)
+    assert index.get('missing') is None
+    assert len(index) == 1
+
+def test_archive_deletes_settled_rows_bottom_up_in_contiguous_ranges(sheets):
+    seed(sheets, [
+        purchase(1, 'APPROVED_PENDING_1', '2026-08-01T10:00:00+00:00'),
+        purchase(2, 'APPROVED_PENDING_2', '2026-08-02T10:00:00+00:00'),
+        purchase(3, 'PENDING_3', '2026-08-03T10:00:00+00:00'),
+        purchase(4, 'APPROVED_PENDING_4', '2026-09-04T10:00:00+00:00'),
+        purchase(5, 'APPROVED_PENDING_5', '2026-09-05T10:00:00+00:00'),
+        ['6', 'Airtime', '2026-09-06T10:00:00+00:00'],
+        purchase(7, 'APPROVED_PENDING_7', '2026-10-07T10:00:00+00:00'),
+    ])
+    deletes = record_deletes(sheets.transactions_sheet)
+
+    assert sheets.archive_transactions('2026-10') == 5
+
+    # Rows 2-3 and 5-7 were archived; the pending row 4 and this month's row 8 stay
+    assert deletes == [(5, 7), (2, 3)]
+    live = sheets.transactions_sheet.get_all_values()
+    assert [row[1] for row in live[1:]] == ['PENDING_3', 'APPROVED_PENDING_7']
+    august = sheets.spreadsheet.worksheet('TokenLog 2026-08').get_all_values()
+    september = sheets.spreadsheet.worksheet('TokenLog 2026-09').get_all_values()
+    assert [row[1] for row in august[1:]] == ['APPROVED_PENDING_1', 'APPROVED_PENDING_2']
+    assert [row[1] for row in september[1:]] == ['APPROVED_PENDING_4', 'APPROVED_PENDING_5', 'Airtime']
+    # The pending index points at the row's new position
+    assert sheets._pending_transactions['PENDING_3'][0] == 2
+
+def test_archive_leaves_rows_added_during_the_run(sheets):
+    seed(sheets, [
+        purchase(1, 'APPROVED_PENDING_1', '2026-08-01T10:00:00+00:00'),
+        purchase(2, 'APPROVED_PENDING_2', '2026-10-02T10:00:00+00:00'),
+    ])
+    open_archive = sheets._archive_worksheet
+
+    def admin_inserts_a_row(month, header=None):
+        worksheet = open_archive(month, header)
+        # Moves the archived row down by one before the deletes
+        sheets.transactions_sheet._rows.insert(1, purchase(9, 'PENDING_9', '2026-10-09T10:00:00+00:00'))
+        return worksheet
+
+    sheets._archive_worksheet = admin_inserts_a_row
+    assert sheets.archive_transactions('2026-10') == 1
+    live = sheets.transactions_sheet.get_all_values()
+    assert [row[1] for row in live[1:]] == ['PENDING_9', 'APPROVED_PENDING_2']
+    assert sheets._pending_transactions['PENDING_9'][0] == 2
+
+def test_find_transaction_reads_archived_rows_through_the_index(sheets):
+    seed(sheets, [
+        purchase(1, 'APPROVED_PENDING_1', '2026-08-01T10:00:00+00:00'),
+        purchase(2, 'APPROVED_PENDING_2', '2026-08-02T10:00:00+00:00', amount=15),
+        purchase(3, 'PENDING_3', '2026-08-03T10:00:00+00:00'),
+    ])
+    sheets.archive_transactions('2026-10')
+    assert sheets._transaction_index.get('APPROVED_PENDING_2') == ('2026-08', 3)
+
+    sheets.client.reset_stats()
+    record = sheets.find_transaction('APPROVED_PENDING_2')
+    assert record['user_id'] == '2'
+    assert record['amount'] == '15'
+    assert record['partition'] == 'TokenLog 2026-08'
+    # One row read from the archive worksheet, no scan of any partition
+    assert sheets.client.stats()['calls'] == {'row_values': 1}
+
+    pending = sheets.find_transaction('PENDING_3')
+    assert pending['partition'] == 'TokenLog'
+    assert sheets.find_transaction('APPROVED_UNKNOWN') is None
@@ -0,0 +1,120 @@
+def racing(worksheet, method, during):
+    """Make worksheet.method run during() after the API has answered, as a concurrent handler would"""
+    original = getattr(worksheet, method)
+
+    def call(*args, **kwargs):
+        values = original(*args, **kwargs)
+        during()
+        return values
+
+    setattr(worksheet, method, call)
+    return lambda: setattr(worksheet, method, original)
+
+def sheet_tokens(sheets, row):
+    return sheets.users_sheet.row_values(row)[3]
+
+def test_load_users_decodes_the_sheet(sheets):
+    sheets.users_sheet.load([
+        ["UserID", "Name", "Username", "Tokens", "Points", "MoMoNumber", "referral_code", "ReferralEarnings"],
+        ["1", "Ama", "ama", 3, 0, "", "REF000001", 0],
+        ["2", "Kofi", "kofi", 12.5, 4, "0244", "REF000002", 1],
+    ])
+    sheets._load_users()
+    assert sheets.get_user_data(2)['Tokens'] == 12.5
+    assert sheets._get_user_row(2) == 3
+    assert sheets.find_user_by_referral_code("REF000001")['UserID'] == "1"
+    assert sheets._next_user_row == 4
+
+def test_load_users_keeps_writes_made_during_the_download(sheets):
+    sheets.register_user(5, "Ama", "ama", None)
+    sheets.flush_writes()
+
+    def write_while_downloading():
+        # Flushed before the load finishes, so neither the download nor the buffer shows it
+        sheets.update_user_tokens_points(5, 50, 2)
+        sheets.flush_writes()
+        sheets.register_user(6, "Kofi", "kofi", None)
+
+    restore = racing(sheets.users_sheet, 'get_all_values', write_while_downloading)
+    sheets._load_users()
+    restore()
+
+    assert sheets.get_user_data(5)['Tokens'] == 50
+    assert sheets.get_user_data(5)['Points'] == 2
+    assert sheets.get_user_data(6) is not None
+    assert sheets._get_user_row(6) == 3
+    assert sheet_tokens(sheets, 2) == "50"
+
+def test_load_users_keeps_rows_with_unflushed_writes(sheets):
+    sheets.register_user(5, "Ama", "ama", None)
+    sheets.update_user_tokens_points(5, 9, 0)  # Staged, not flushed
+    sheets._load_users()
+    assert sheet_tokens(sheets, 2) == "3"
+    assert sheets.get_user_data(5)['Tokens'] == 9
+
+def test_load_users_picks_up_edits_to_rows_without_local_writes(sheets):
+    sheets.register_user(5, "Ama", "ama", None)
+    sheets.register_user(6, "Kofi", "kofi", None)
+    sheets.update_user_tokens_points(5, 20, 0)
+    sheets.flush_writes()
+    # An admin edits both rows by hand; only user 6 was untouched by us since
+    sheets.users_sheet.update_cell(2, 5, 7)
+    sheets.users_sheet.update_cell(3, 4, 40)
+    sheets._load_users()
+    assert sheets.get_user_data(5)['Points'] == 7
+    assert sheets.get_user_data(6)['Tokens'] == 40
+
+def test_refresh_users_applies_admin_edits_with_one_batched_read(sheets):
+    sheets.register_user(5, "Ama", "ama", None)
+    sheets.register_user(6, "Kofi", "kofi", None)
+    sheets.users_sheet.update_cell(3, 4, 99)
+    sheets.users_sheet.update_cell(2, 6, "0244")
+    sheets.client.reset_stats()
+    sheets.refresh_users()
+    assert sheets.client.stats()['calls'] == {'batch_get': 1}
+    assert sheets.get_user_data(6)['Tokens'] == 99
+    assert sheets.get_user_data(5)['MoMoNumber'] == "0244"
+
+def test_refresh_users_adds_appended_rows(sheets):
+    sheets.register_user(5, "Ama", "ama", None)
+    sheets.users_sheet.append_row(["7", "Esi", "esi", 3, 0, "", "REF000007", 0])
+    sheets.refresh_users()
+    assert sheets.get_user_data(7)['Name'] == "Esi"
+    assert sheets._get_user_row(7) == 3
+    assert sheets.find_user_by_referral_code("REF000007")['UserID'] == "7"
+
+def test_refresh_users_keeps_writes_made_during_the_read(sheets):
+    sheets.register_user(5, "Ama", "ama", None)
+    sheets.flush_writes()
+
+    def write_while_reading():
+        sheets.update_user_tokens_points(5, 77, 0)
+        sheets.flush_writes()
+
+    restore = racing(sheets.users_sheet, 'batch_get', write_while_reading)
+    sheets.refresh_users()
+    restore()
+    assert sheets.get_user_data(5)['Tokens'] == 77
+
+    # The next cycle still picks up an out-of-band edit of the same field
+    sheets.users_sheet.update_cell(2, 4, 99)
+    sheets.refresh_users()
+    assert sheets.get_user_data(5)['Tokens'] == 99
+
+def test_refresh_users_skips_rows_with_unflushed_writes(sheets):
+    sheets.register_user(5, "Ama", "ama", None)
+    sheets.flush_writes()
+    sheets.update_user_tokens_points(5, 12, 0)
+    sheets.users_sheet.update_cell(2, 5, 30)
+    sheets.refresh_users()
+    assert sheets.get_user_data(5)['Tokens'] == 12
+    assert sheets.get_user_data(5)['Points'] == 0
+
+def test_refresh_users_reloads_when_rows_moved(sheets):
+    sheets.register_user(5, "Ama", "ama", None)
+    sheets.register_user(6, "Kofi", "kofi", None)
+    sheets.flush_writes()
+    sheets.users_sheet.delete_rows(2)
+    sheets.refresh_users()
+    assert sheets.get_user_data(5) is None
+    assert sheets._get_user_row(6) == 2
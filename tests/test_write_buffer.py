@@ -0,0 +1,66 @@
+import time
+from fake_gspread import FakeClient, create_learn_earn_spreadsheet
+from write_buffer import WriteBuffer
+
+def users_sheet(**quotas):
+    client = create_learn_earn_spreadsheet(FakeClient(**quotas))
+    worksheet = client.open_by_key("emulated").worksheet("LearnEarnAfrica")
+    worksheet.load([["UserID", "Name", "Username", "Tokens", "Points"], ["1", "Ama", "ama", 3, 0], ["2", "Kofi", "kofi", 3, 0]])
+    client.reset_stats()
+    return client, worksheet
+
+def test_stage_coalesces_cells_into_one_batch_update():
+    client, worksheet = users_sheet()
+    buffer = WriteBuffer(worksheet)
+    buffer.stage(2, {4: 5})
+    buffer.stage(2, {4: 6, 5: 10})  # Same cell again: the later value wins
+    buffer.stage(3, {4: 7})
+
+    assert buffer.pending_value(2, 4) == 6
+    assert buffer.pending_rows() == {2, 3}
+    assert buffer.flush() == 3
+    assert client.stats()['calls'] == {'batch_update': 1}
+    assert worksheet.row_values(2) == ["1", "Ama", "ama", "6", "10"]
+    assert worksheet.row_values(3) == ["2", "Kofi", "kofi", "7", "0"]
+    assert not buffer.has_pending()
+    assert buffer.flush() == 0
+
+def test_build_ranges_merges_contiguous_columns():
+    _, worksheet = users_sheet()
+    buffer = WriteBuffer(worksheet)
+    ranges = buffer._build_ranges({2: {4: 'a', 5: 'b', 8: 'c'}, 3: {1: 'd'}})
+    assert ranges == [
+        {'range': 'D2:E2', 'values': [['a', 'b']]},
+        {'range': 'H2', 'values': [['c']]},
+        {'range': 'A3', 'values': [['d']]},
+    ]
+
+def test_reaching_max_pending_cells_flushes_without_waiting_for_the_interval():
+    client, worksheet = users_sheet()
+    buffer = WriteBuffer(worksheet, flush_interval=3600, max_pending_cells=2)
+    buffer.start()
+    buffer.stage(2, {4: 8})
+    time.sleep(0.05)
+    assert buffer.has_pending()
+    buffer.stage(3, {4: 9})
+    deadline = time.monotonic() + 2
+    while buffer.has_pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not buffer.has_pending()
+    assert client.stats()['calls']['batch_update'] == 1
+
+def test_flush_rejected_by_quota_is_retried_without_losing_newer_values():
+    client, worksheet = users_sheet(writes_per_minute=1)
+    buffer = WriteBuffer(worksheet)
+    buffer.stage(2, {4: 5})
+    assert buffer.flush() == 1
+    buffer.stage(2, {4: 6, 5: 1})
+    assert buffer.flush() == 0  # Over the write quota: requeued
+    assert client.stats()['rejected'] == {'batch_update': 1}
+    buffer.stage(2, {4: 7})
+    assert buffer.pending_value(2, 4) == 7
+    assert buffer.pending_value(2, 5) == 1
+
+    client.quotas['write'] = None
+    assert buffer.flush() == 2
+    assert worksheet.row_values(2)[3:5] == ["7", "1"]
@@ -0,0 +1,123 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from sheet_manager import get_sheet_manager
+from user_locks import user_lock
+from request_context import update_cached_user
+
+logger = logging.getLogger(__name__)
+
+class TokenLedger:
+    """Append-only log of token/point credits and debits with materialised balances
+
+    Every change is recorded as an event carrying the delta and the balance after it,
+    so a balance can be rebuilt by replaying the log. Balances are applied to the
+    storage backend immediately (SheetManager keeps them in its user table and
+    snapshots them to the sheet through its write buffer) while events are batched
+    and appended in the background.
+    """
+
+    def __init__(self, storage, flush_interval=5.0):
+        # A backend, or a zero-argument callable returning one so it can be created on first use
+        self._storage = storage
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._pending_events = []
+        self._flush_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="token-ledger", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    @property
+    def storage(self):
+        return self._storage() if callable(self._storage) else self._storage
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _append(self, user_id, tokens, points, tokens_after, points_after, reason, reference):
+        event = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "user_id": str(user_id),
+            "tokens_delta": float(tokens),
+            "points_delta": float(points),
+            "tokens_after": float(tokens_after),
+            "points_after": float(points_after),
+            "reason": reason,
+            "reference": str(reference or ""),
+        }
+        with self._lock:
+            self._pending_events.append(event)
+        return event
+
+    def record(self, user_id, tokens=0.0, points=0.0, reason="", reference=None, allow_overdraft=True):
+        """Apply a token/point delta to a user's balance and log it
+
+        Returns the new (tokens, points), or None if the user is unknown or the
+        change would overdraw a balance while allow_overdraft is False.
+        """
+        try:
+            # Per-user, so different users' updates run in parallel
+            with user_lock(user_id):
+                user = self.storage.get_user_data(user_id)
+                if not user:
+                    return None
+                new_tokens = float(user['Tokens']) + float(tokens)
+                new_points = float(user['Points']) + float(points)
+                if not allow_overdraft and (new_tokens < 0 or new_points < 0):
+                    return None
+                self.storage.update_user_tokens_points(user_id, new_tokens, new_points)
+                self._append(user_id, tokens, points, new_tokens, new_points, reason, reference)
+                update_cached_user(user_id, Tokens=new_tokens, Points=new_points)
+            return new_tokens, new_points
+        except Exception as e:
+            logger.error(f"Error recording ledger event for {user_id} ({reason}): {e}")
+            return None
+
+    def log(self, user_id, tokens=0.0, points=0.0, reason="", reference=None):
+        """Log a change the storage backend has already applied (e.g. daily reward, referral)"""
+        try:
+            with user_lock(user_id):
+                user = self.storage.get_user_data(user_id)
+            if user:
+                self._append(user_id, tokens, points, user['Tokens'], user['Points'], reason, reference)
+        except Exception as e:
+            logger.error(f"Error logging ledger event for {user_id} ({reason}): {e}")
+
+    def flush(self):
+        """Append buffered events to the storage backend in one batch"""
+        with self._flush_lock:
+            with self._lock:
+                events, self._pending_events = self._pending_events, []
+            if not events:
+                return 0
+            try:
+                # Events only exist once a user has been served, so this never creates the backend on its own
+                self.storage.append_ledger_events(events)
+                return len(events)
+            except Exception as e:
+                logger.error(f"Error appending {len(events)} ledger events, will retry: {e}")
+                with self._lock:
+                    self._pending_events[:0] = events
+                return 0
+
+    def replay(self, user_id=None):
+        """Rebuild {user_id: (tokens, points)} from the persisted log plus unflushed events"""
+        balances = {}
+        with self._lock:
+            pending = list(self._pending_events)
+        for event in list(self.storage.get_ledger_events(user_id)) + pending:
+            if user_id is not None and str(event["user_id"]) != str(user_id):
+                continue
+            balances[str(event["user_id"])] = (float(event["tokens_after"]), float(event["points_after"]))
+        return balances
+
+token_ledger = TokenLedger(get_sheet_manager, flush_interval=float(os.getenv("LEDGER_FLUSH_INTERVAL", "5")))
+
+def get_token_ledger():
+    return token_ledger
@@ -0,0 +1,84 @@
+import os
+import re
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = "TokenLog "
+_MONTH = re.compile(r'^(\d{4}-\d{2})-\d{2}T')
+
+def partition_title(month):
+    """Worksheet holding the settled TokenLog rows of a 'YYYY-MM' month"""
+    return f"{ARCHIVE_PREFIX}{month}"
+
+def row_month(row):
+    """'YYYY-MM' of a TokenLog row's ISO timestamp, or None if it has none
+
+    Purchases keep the timestamp in column 5 and redemptions in column 3, so the last
+    timestamp-looking cell is used.
+    """
+    for value in reversed(row):
+        match = _MONTH.match(str(value))
+        if match:
+            return match.group(1)
+    return None
+
+def row_key(row):
+    """Comparable content of a sheet row, ignoring trailing blank cells"""
+    values = [str(value) for value in row]
+    while values and values[-1] == '':
+        values.pop()
+    return tuple(values)
+
+def contiguous_ranges(row_numbers):
+    """Sorted (first, last) runs of consecutive row numbers"""
+    ranges = []
+    for row_number in sorted(row_numbers):
+        if ranges and row_number == ranges[-1][1] + 1:
+            ranges[-1][1] = row_number
+        else:
+            ranges.append([row_number, row_number])
+    return [tuple(run) for run in ranges]
+
+class TransactionIndex:
+    """Compact on-disk map of archived transaction IDs to their (month, row) in the archive worksheets"""
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except Exception as e:
+                logger.error(f"Error reading transaction index {self.path}, starting empty: {e}")
+                self._entries = {}
+        return self._entries
+
+    def get(self, transaction_id):
+        """(month, row) of an archived transaction, or None"""
+        with self._lock:
+            entry = self._load().get(str(transaction_id))
+            return tuple(entry) if entry else None
+
+    def add(self, entries):
+        """Record {transaction_id: (month, row)} and persist the index"""
+        with self._lock:
+            index = self._load()
+            for transaction_id, (month, row) in entries.items():
+                index[str(transaction_id)] = [month, row]
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load())
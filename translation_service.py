@@ -1,11 +1,22 @@
 import logging
+import threading
 from googletrans import Translator
 
 logger = logging.getLogger(__name__)
 
 class TranslationService:
     def __init__(self):
-        self.translator = Translator()
+        self._translator = None
+        self._lock = threading.Lock()
+
+    @property
+    def translator(self):
+        """googletrans client, built on first use"""
+        if self._translator is None:
+            with self._lock:
+                if self._translator is None:
+                    self._translator = Translator()
+        return self._translator
 
     def translate_text(self, text, lang_code):
         try:
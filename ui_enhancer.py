@@ -1,8 +1,54 @@
 import logging
-from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
+from telebot.types import InlineKeyboardButton
+from keyboards import reply_keyboard, inline_keyboard, rows_of
 
 logger = logging.getLogger(__name__)
 
+MAIN_MENU_BUTTONS = [
+    "🎮 Start Quiz",
+    "🌍 Zone Quiz",
+    "💰 Buy Tokens",
+    "🎁 Redeem Rewards",
+    "🎁 Daily Reward",
+    "📊 My Stats",
+    "📈 Progress",
+    "👥 Referrals",
+    "🏆 Leaderboard",
+    "ℹ️ Help",
+    "💬 Feedback",
+    "🌐 Current Affairs",
+    "🎁 Tiered Rewards",
+    "🌍 African Countries",
+    "🛒 Marketplace"
+]
+
+TIERS = [
+    ("🥉 Bronze", "bronze", "0-1000 points"),
+    ("🥈 Silver", "silver", "1001-5000 points"),
+    ("🥇 Gold", "gold", "5001-10000 points"),
+    ("💎 Platinum", "platinum", "10000+ points")
+]
+
+CRYPTO_OPTIONS = [
+    ("Bitcoin (BTC)", "btc"),
+    ("Ethereum (ETH)", "eth"),
+    ("USDT (TRC20)", "usdt_trc20"),
+    ("USDT (ERC20)", "usdt_erc20"),
+    ("BNB (BSC)", "bnb"),
+    ("Solana (SOL)", "sol")
+]
+
+ADMIN_MENU_BUTTONS = [
+    "📊 Admin Dashboard",
+    "📋 View Pending Tokens",
+    "✅ Approve Token Purchase",
+    "📢 Broadcast Message",
+    "📈 User Stats",
+    "🎯 Run Daily Lottery",
+    "🎰 Run Weekly Raffle",
+    "🔙 Back to User Menu"
+]
+
 class UIEnhancer:
     def __init__(self):
         self.colors = {
@@ -13,117 +59,58 @@ class UIEnhancer:
             'danger': '#dc3545',
             'info': '#17a2b8'
         }
-        
+        # Menus never change while the bot runs, so each is serialised once
+        self._menus = {
+            'main': reply_keyboard(rows_of(MAIN_MENU_BUTTONS, 2)),
+            'main_admin': reply_keyboard(rows_of(MAIN_MENU_BUTTONS + ["🔧 Admin"], 2)),
+            'tier': inline_keyboard([[(f"{name} {description}", f"tier:{tier_id}")] for name, tier_id, description in TIERS]),
+            'admin': reply_keyboard(rows_of(ADMIN_MENU_BUTTONS, 3)),
+            'crypto': inline_keyboard([[(f"💎 {name}", f"crypto:{crypto}")] for name, crypto in CRYPTO_OPTIONS]),
+        }
+
+    def _preference_menu(self, key, labels):
+        menu = self._menus.get(key)
+        if menu is None:
+            menu = self._menus[key] = reply_keyboard([[label] for label in labels()])
+        return menu
+
     def create_main_menu(self, is_admin=False):
         """Create enhanced main menu"""
-        markup = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-        
-        # Main game buttons
-        game_buttons = [
-            KeyboardButton("🎮 Start Quiz"),
-            KeyboardButton("🌍 Zone Quiz"),
-            KeyboardButton("💰 Buy Tokens"),
-            KeyboardButton("🎁 Redeem Rewards"),
-            KeyboardButton("🎁 Daily Reward"),
-            KeyboardButton("📊 My Stats"),
-            KeyboardButton("📈 Progress"),
-            KeyboardButton("👥 Referrals"),
-            KeyboardButton("🏆 Leaderboard"),
-            KeyboardButton("ℹ️ Help"),
-            KeyboardButton("💬 Feedback"),
-            KeyboardButton("🌐 Current Affairs"),
-            KeyboardButton("🎁 Tiered Rewards"),
-            KeyboardButton("🌍 African Countries"),
-            KeyboardButton("🛒 Marketplace")
-        ]
-        
-        if is_admin:
-            game_buttons.append(KeyboardButton("🔧 Admin"))
-            
-        markup.add(*game_buttons)
-        return markup
-        
+        return self._menus['main_admin' if is_admin else 'main']
+
     def create_language_menu(self):
         """Create language selection menu"""
-        markup = ReplyKeyboardMarkup(resize_keyboard=True)
+        # Imported here: user_preference_service imports this module
         from user_preference_service import user_preference_service
-        
-        for lang_code, info in user_preference_service.supported_languages.items():
-            markup.add(KeyboardButton(f"{info['flag']} {info['name']}"))
-        return markup
-        
+        return self._preference_menu('language', lambda: [
+            f"{info['flag']} {info['name']}" for info in user_preference_service.supported_languages.values()
+        ])
+
     def create_zone_menu(self):
         """Create zone selection menu"""
-        markup = ReplyKeyboardMarkup(resize_keyboard=True)
         from user_preference_service import user_preference_service
-        
-        for zone, info in user_preference_service.african_zones.items():
-            markup.add(KeyboardButton(f"{info['flag']} {zone}"))
-        return markup
-        
+        return self._preference_menu('zone', lambda: [
+            f"{info['flag']} {zone}" for zone, info in user_preference_service.african_zones.items()
+        ])
+
     def create_tier_menu(self):
         """Create tier-based reward menu"""
-        markup = InlineKeyboardMarkup(row_width=2)
-        
-        tiers = [
-            ("🥉 Bronze", "bronze", "0-1000 points"),
-            ("🥈 Silver", "silver", "1001-5000 points"),
-            ("🥇 Gold", "gold", "5001-10000 points"),
-            ("💎 Platinum", "platinum", "10000+ points")
-        ]
-        
-        for tier_name, tier_id, description in tiers:
-            markup.add(
-                InlineKeyboardButton(
-                    f"{tier_name} {description}",
-                    callback_data=f"tier:{tier_id}"
-                )
-            )
-        return markup
+        return self._menus['tier']
 
     def create_admin_menu(self):
         """Create admin menu"""
-        markup = ReplyKeyboardMarkup(resize_keyboard=True)
-        markup.add(
-            KeyboardButton("📊 Admin Dashboard"),
-            KeyboardButton("📋 View Pending Tokens"),
-            KeyboardButton("✅ Approve Token Purchase"),
-            KeyboardButton("📢 Broadcast Message"),
-            KeyboardButton("📈 User Stats"),
-            KeyboardButton("🎯 Run Daily Lottery"),
-            KeyboardButton("🎰 Run Weekly Raffle"),
-            KeyboardButton("🔙 Back to User Menu")
-        )
-        return markup
-        
+        return self._menus['admin']
+
     def create_notification_button(self, text, callback_data, emoji="🔔"):
         """Create notification button"""
         return InlineKeyboardButton(f"{emoji} {text}", callback_data=callback_data)
-        
+
     def create_return_button(self):
         """Create return to main menu button"""
         return InlineKeyboardButton("🏠 Return to Main Menu", callback_data="return_main")
-        
+
     def create_crypto_payment_menu(self):
         """Create crypto payment menu"""
-        markup = InlineKeyboardMarkup(row_width=1)
-
-        crypto_options = [
-            ("Bitcoin (BTC)", "btc"),
-            ("Ethereum (ETH)", "eth"),
-            ("USDT (TRC20)", "usdt_trc20"),
-            ("USDT (ERC20)", "usdt_erc20"),
-            ("BNB (BSC)", "bnb"),
-            ("Solana (SOL)", "sol")
-        ]
-
-        for name, crypto in crypto_options:
-            markup.add(
-                InlineKeyboardButton(
-                    f"💎 {name}",
-                    callback_data=f"crypto:{crypto}"
-                )
-            )
-        return markup
-
-ui_enhancer = UIEnhancer()
\ No newline at end of file
+        return self._menus['crypto']
+
+ui_enhancer = UIEnhancer()
@@ -0,0 +1,123 @@
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Update fields that carry a message (and so a chat) or a user
+_MESSAGE_FIELDS = ('message', 'edited_message', 'channel_post', 'edited_channel_post')
+_USER_FIELDS = ('inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query', 'poll_answer', 'my_chat_member', 'chat_member', 'chat_join_request')
+
+def chat_key(update):
+    """The chat an update belongs to, so its updates are handled in arrival order"""
+    for field in _MESSAGE_FIELDS:
+        message = getattr(update, field, None)
+        if message is not None:
+            return message.chat.id
+    callback_query = getattr(update, 'callback_query', None)
+    if callback_query is not None:
+        return callback_query.message.chat.id if callback_query.message else callback_query.from_user.id
+    for field in _USER_FIELDS:
+        item = getattr(update, field, None)
+        if item is not None:
+            chat = getattr(item, 'chat', None)
+            if chat is not None:
+                return chat.id
+            user = getattr(item, 'from_user', None) or getattr(item, 'user', None)
+            if user is not None:
+                return user.id
+    return f"update:{update.update_id}"
+
+class UpdateDispatcher:
+    """Bounded worker pool for webhook updates: FIFO within a chat, chats in parallel
+
+    submit() only queues the update, so the webhook can answer Telegram at once.
+    Each chat has its own queue and at most one worker at a time; a chat with more
+    updates goes to the back of the ready queue after each one, so a busy chat
+    can't starve the others.
+    """
+
+    def __init__(self, process, workers=8, max_pending=1000):
+        self.process = process
+        self.workers = workers
+        self.max_pending = max_pending
+        self._chats = {}  # chat -> deque of (enqueued_at, update); present while queued or being handled
+        self._ready = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._threads = []
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.avg_lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"update-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"Update dispatcher started with {self.workers} workers")
+
+    def submit(self, update):
+        """Queue an update; False if the queue is full and Telegram should redeliver later"""
+        self.start()
+        key = chat_key(update)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                return False
+            self._pending += 1
+            chat_queue = self._chats.get(key)
+            if chat_queue is None:
+                # Idle chat: schedule it. Otherwise the worker handling it will pick this up
+                chat_queue = self._chats[key] = deque()
+                self._ready.put(key)
+            chat_queue.append((time.monotonic(), update))
+        return True
+
+    def _run(self):
+        while True:
+            key = self._ready.get()
+            with self._lock:
+                enqueued_at, update = self._chats[key].popleft()
+            lag = time.monotonic() - enqueued_at
+            try:
+                self.process(update)
+                failed = False
+            except Exception as e:
+                logger.error(f"Error processing update {getattr(update, 'update_id', '?')} for chat {key}: {e}")
+                failed = True
+            with self._lock:
+                self._pending -= 1
+                self.processed += 1
+                self.failed += failed
+                self.avg_lag = lag if self.processed == 1 else 0.9 * self.avg_lag + 0.1 * lag
+                self.max_lag = max(self.max_lag, lag)
+                if self._chats[key]:
+                    self._ready.put(key)
+                else:
+                    del self._chats[key]
+
+    def stats(self):
+        """Queue depth and lag (seconds between webhook arrival and handling)"""
+        now = time.monotonic()
+        with self._lock:
+            oldest = min((chat_queue[0][0] for chat_queue in self._chats.values() if chat_queue), default=None)
+            return {
+                'pending': self._pending,
+                'active_chats': len(self._chats),
+                'workers': len(self._threads),
+                'processed': self.processed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'avg_lag': round(self.avg_lag, 3),
+                'max_lag': round(self.max_lag, 3),
+                'oldest_wait': round(now - oldest, 3) if oldest is not None else 0.0,
+            }
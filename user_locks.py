@@ -0,0 +1,45 @@
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class UserLocks:
+    """Per-user reentrant locks for balance read-modify-write sequences
+
+    Updates to the same user are serialised while different users never share a
+    lock. A user's lock exists only while some thread holds or waits for it.
+    """
+
+    def __init__(self):
+        self._locks = {}  # user_id -> [RLock, holders and waiters]
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, user_id):
+        key = str(user_id)
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.RLock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    def active(self):
+        """Number of users currently holding or waiting on a lock"""
+        with self._guard:
+            return len(self._locks)
+
+user_locks = UserLocks()
+
+def get_user_locks():
+    return user_locks
+
+def user_lock(user_id):
+    """Context manager serialising balance changes for one user"""
+    return user_locks.hold(user_id)
@@ -0,0 +1,124 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def column_letter(col):
+    letters = ""
+    while col > 0:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+class WriteBuffer:
+    """Write-behind buffer that coalesces per-cell updates into batch_update calls"""
+
+    def __init__(self, worksheet, flush_interval=2.0, max_pending_cells=200, executor=None):
+        self.worksheet = worksheet
+        self.flush_interval = flush_interval
+        self.max_pending_cells = max_pending_cells
+        # Runs the batch_update call, e.g. SheetManager._sheets_call
+        self.executor = executor or (lambda func, *args, **kwargs: func(*args, **kwargs))
+        self._pending = {}  # row -> {col: value}
+        self._pending_cells = 0
+        self._inflight_rows = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.flush_count = 0
+        self.cells_written = 0
+
+    def start(self):
+        """Start the background flush thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="sheet-write-buffer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def stage(self, row, values):
+        """Stage {col: value} changes for a row; later values for a cell replace earlier ones"""
+        with self._lock:
+            pending_row = self._pending.setdefault(row, {})
+            for col, value in values.items():
+                if col not in pending_row:
+                    self._pending_cells += 1
+                pending_row[col] = value
+            full = self._pending_cells >= self.max_pending_cells
+        if full:
+            self._wake.set()
+
+    def pending_value(self, row, col, default=None):
+        """Return a staged value that has not been flushed yet"""
+        with self._lock:
+            return self._pending.get(row, {}).get(col, default)
+
+    def pending_rows(self):
+        """Rows with staged or in-flight cells, whose sheet contents may be behind"""
+        with self._lock:
+            return set(self._pending) | self._inflight_rows
+
+    def has_pending(self):
+        with self._lock:
+            return bool(self._pending)
+
+    def _build_ranges(self, pending):
+        """Merge each row's contiguous columns into a single A1 range"""
+        data = []
+        for row, cells in sorted(pending.items()):
+            cols = sorted(cells)
+            run = [cols[0]]
+            for col in cols[1:] + [None]:
+                if col is not None and col == run[-1] + 1:
+                    run.append(col)
+                    continue
+                start, end = column_letter(run[0]), column_letter(run[-1])
+                a1 = f"{start}{row}" if run[0] == run[-1] else f"{start}{row}:{end}{row}"
+                data.append({'range': a1, 'values': [[cells[c] for c in run]]})
+                if col is not None:
+                    run = [col]
+        return data
+
+    def flush(self):
+        """Write all staged cells with a single batch_update"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                pending, self._pending = self._pending, {}
+                cell_count, self._pending_cells = self._pending_cells, 0
+                self._inflight_rows = set(pending)
+            data = self._build_ranges(pending)
+            try:
+                started = time.time()
+                self.executor(self.worksheet.batch_update, data, value_input_option='USER_ENTERED')
+                self.flush_count += 1
+                self.cells_written += cell_count
+                logger.info(f"Flushed {cell_count} cells in {len(data)} ranges ({time.time() - started:.2f}s)")
+                return cell_count
+            except Exception as e:
+                logger.error(f"Error flushing {cell_count} buffered cells, will retry: {e}")
+                self._requeue(pending)
+                return 0
+            finally:
+                with self._lock:
+                    self._inflight_rows = set()
+
+    def _requeue(self, pending):
+        """Put failed cells back without overwriting values staged since"""
+        with self._lock:
+            for row, cells in pending.items():
+                pending_row = self._pending.setdefault(row, {})
+                for col, value in cells.items():
+                    if col not in pending_row:
+                        pending_row[col] = value
+                        self._pending_cells += 1